@@ -0,0 +1,183 @@
+import heapq
+import math
+
+import numpy as np
+
+#Beam-search correction over an edit lattice, an alternative to textCorrection's greedy cases a/b/c.
+#The OCR text is read left to right. At every observed character each hypothesis may first insert up to
+#maxInsert missing characters, then keep the character, substitute it or delete it. Every emitted
+#character is scored with the model's next-char distribution of the hypothesis' own output, and every
+#edit also pays its channel probability: substituting one particular character for another costs
+#substitutionPrior / (vocabSize - 1), deleting one particular observed character deletionPrior / vocabSize,
+#inserting a missing one insertionPrior (the model scores which). Lacunae are filled without a prior:
+#   ?      exactly one unknown character, inside a word (ma?ime); elsewhere ? is a question mark
+#   [...]  1 to maxInsert unknown characters (any number of dots, or [])
+#Each observed character costs at most maxInsert + 1 batched forward passes over at most beamWidth
+#windows, so decoding is O(len(text) * beamWidth * maxInsert) model rows, with candidates alternatives
+#tried per row. Hypotheses whose last sequenceLength output characters agree are merged (only the best is
+#kept), because the model can't tell them apart from there on.
+
+lacunaChar = '?'
+#floor for model probabilities before taking logs
+minProb = 1e-30
+
+#whether text[i] is a '?' lacuna: its run of '?' has letters on both sides. Question marks (after a word, on
+#their own) are punctuation the vocabulary keeps
+def isLacuna(text, i):
+    if text[i] != lacunaChar:
+        return False
+    start, end = i, i + 1
+    while start > 0 and text[start - 1] == lacunaChar:
+        start -= 1
+    while end < len(text) and text[end] == lacunaChar:
+        end += 1
+    return start > 0 and text[start - 1].isalpha() and end < len(text) and text[end].isalpha()
+
+#observed text -> list of (kind, char, position): kind "char", "one" (? lacuna) or "gap" ([...])
+def tokenize(text):
+    tokens = []
+    i = 0
+    while i < len(text):
+        if isLacuna(text, i):
+            tokens.append(("one", None, i))
+        elif text[i] == '[':
+            end = i + 1
+            while end < len(text) and text[end] == '.':
+                end += 1
+            if end < len(text) and text[end] == ']':
+                tokens.append(("gap", None, i))
+                i = end + 1
+                continue
+            tokens.append(("char", text[i], i))
+        else:
+            tokens.append(("char", text[i], i))
+        i += 1
+    return tokens
+
+class Hypothesis:
+    __slots__ = ("score", "context", "parent", "char", "edit", "inserted")
+
+    def __init__(self, score, context, parent, char, edit, inserted):
+        self.score = score
+        #the last sequenceLength output characters, the model input for the next character
+        self.context = context
+        #backpointer, so extending a hypothesis never copies its whole output
+        self.parent = parent
+        #character this step emitted ('' for deletions and closed gaps)
+        self.char = char
+        self.edit = edit
+        #characters inserted (or filled into a gap) before the current observed character
+        self.inserted = inserted
+
+    def trace(self):
+        chars, edits = [], []
+        node = self
+        while node is not None:
+            chars.append(node.char)
+            if node.edit is not None:
+                edits.append(node.edit)
+            node = node.parent
+        return ''.join(reversed(chars)), edits[::-1]
+
+class BeamDecoder:
+    #predict(contexts) -> (len(contexts), vocabSize) next-char probabilities, e.g. completion.predictBatch
+    def __init__(self, predict, vocabulary, beamWidth = 8, maxInsert = 2, candidates = 8,
+                 substitutionPrior = 0.02, insertionPrior = 0.01, deletionPrior = 0.01):
+        self.predict = predict
+        self.vocabulary = vocabulary
+        self.beamWidth = beamWidth
+        self.maxInsert = maxInsert
+        self.candidates = min(candidates, vocabulary.vocabSize)
+        #the priors are the chance of any substitution or deletion at a character, spread over the characters
+        self.substitutionCost = math.log(substitutionPrior / (vocabulary.vocabSize - 1))
+        self.insertionCost = math.log(insertionPrior)
+        self.deletionCost = math.log(deletionPrior / vocabulary.vocabSize)
+        self.matchCost = math.log(1 - substitutionPrior - deletionPrior)
+
+    #(probabilities, topCandidateIds) for every distinct context of hypotheses, one forward pass
+    def score(self, hypotheses):
+        contexts = list({h.context: None for h in hypotheses})
+        probDists = np.asarray(self.predict(contexts))
+        top = np.argpartition(-probDists, self.candidates - 1, axis = 1)[:, :self.candidates]
+        return {context: (probDists[k], top[k]) for k, context in enumerate(contexts)}
+
+    @staticmethod
+    def logProb(p):
+        return math.log(max(p, minProb))
+
+    def extend(self, parent, char, logProb, edit, inserted):
+        context = (parent.context + char)[-self.vocabulary.sequenceLength:]
+        return Hypothesis(parent.score + logProb, context, parent, char, edit, inserted)
+
+    #best hypothesis per context, then the beamWidth best of those
+    def prune(self, hypotheses):
+        best = {}
+        for h in hypotheses:
+            key = (h.context, h.inserted)
+            if key not in best or h.score > best[key].score:
+                best[key] = h
+        return heapq.nlargest(self.beamWidth, best.values(), key = lambda h: h.score)
+
+    def advance(self, beam, kind, observed, position):
+        vocab = self.vocabulary
+        observedId = vocab.charToInt.get(observed) if kind == "char" else None
+        if kind == "char" and observedId is None:
+            #characters the model doesn't know (line breaks, ...) are kept as they are and not scored
+            return [self.extend(h, observed, 0.0, None, 0) for h in beam]
+        done = []
+        frontier = beam
+        for level in range(self.maxInsert + 1):
+            if not frontier:
+                break
+            #a gap at its last level only closes, that needs no scores
+            scored = self.score(frontier) if kind != "gap" or level < self.maxInsert else None
+            inserting = []
+            for h in frontier:
+                if kind == "gap":
+                    if h.inserted > 0:
+                        done.append(Hypothesis(h.score, h.context, h, '', None, 0))
+                    if scored is None:
+                        continue
+                probDist, top = scored[h.context]
+                if kind == "one":
+                    for j in top:
+                        c, p = vocab.vocab[j], float(probDist[j])
+                        done.append(self.extend(h, c, self.logProb(p), {"position": position, "kind": "fill", "observed": lacunaChar, "char": c, "prob": p}, 0))
+                elif kind == "char":
+                    p = float(probDist[observedId])
+                    done.append(self.extend(h, observed, self.logProb(p) + self.matchCost, None, 0))
+                    for j in top:
+                        if j == observedId:
+                            continue
+                        c, p = vocab.vocab[j], float(probDist[j])
+                        done.append(self.extend(h, c, self.logProb(p) + self.substitutionCost,
+                                                {"position": position, "kind": "substitution", "observed": observed, "char": c, "prob": p}, 0))
+                    done.append(Hypothesis(h.score + self.deletionCost, h.context, h, '',
+                                           {"position": position, "kind": "deletion", "observed": observed, "char": '', "prob": math.exp(self.deletionCost)}, 0))
+                #missing characters before the observed one (or the next characters of a gap)
+                if level < self.maxInsert and kind != "one":
+                    fill = kind == "gap"
+                    for j in top:
+                        c, p = vocab.vocab[j], float(probDist[j])
+                        edit = {"position": position, "kind": "fill" if fill else "insertion", "observed": "[...]" if fill else "", "char": c, "prob": p}
+                        inserting.append(self.extend(h, c, self.logProb(p) + (0 if fill else self.insertionCost), edit, h.inserted + 1))
+            frontier = self.prune(inserting)
+        return self.prune(done)
+
+    #-> {"text", "logProb", "edits": [{"position", "kind", "observed", "char", "prob"}]}; position indexes text,
+    #prob is the model probability of the emitted character (the edit prior for deletions)
+    def decode(self, text):
+        tokens = tokenize(text)
+        #a gap takes 1 to maxInsert characters, with none allowed no hypothesis gets past it
+        if self.maxInsert < 1 and any(kind == "gap" for kind, _, _ in tokens):
+            raise ValueError("Filling a [...] lacuna needs maxInsert >= 1 (COMPLETION_MAX_INSERT).")
+        beam = [Hypothesis(0.0, '', None, '', None, 0)]
+        #like textCorrection, the first character is taken as it is: there is no context to judge it by
+        if tokens and tokens[0][0] == "char":
+            beam = [self.extend(beam[0], tokens[0][1], 0.0, None, 0)]
+            tokens = tokens[1:]
+        for kind, observed, position in tokens:
+            beam = self.advance(beam, kind, observed, position)
+        best = beam[0]
+        output, edits = best.trace()
+        return {"text": output, "logProb": best.score, "edits": edits}
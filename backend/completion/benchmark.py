@@ -0,0 +1,395 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+#Completion benchmarks, run from backend/completion with the transformerEnv interpreter:
+#   transformerEnv/bin/python benchmark.py --chars 2000
+#scan: chars/sec for predicting the next-char distribution of every position, one window per forward
+#pass versus predictPositions batches. correction: chars/sec and forward passes of textCorrection (batched)
+#against textCorrectionReference, the original loop, on corrupted corpus text. "original" runs the batched
+#engine with the original repairs (originalRepair), which must return the same as the reference; both stop
+#with the same ValueError where the original case c's two-name unpacking fails. The distribution cache is
+#cleared before each engine; "warm cache" repeats the batched run with it kept and its hit ratio is printed.
+#--mode quantized: the float model against its int8 variant (numpyModel.quantizeWeights) on held-out corpus
+#windows: top-1 next-char agreement, next-char accuracy, correction accuracy (similarity of textCorrection's
+#output to the clean text) and per-window latency at batch 1 and 256 (the int8 model runs on its int8 kernels).
+#--mode graph: keras model latency per call at batch 1, 32 and 256, eager versus compiledModel's
+#fixed-signature tf.function, with and without XLA.
+#--mode encode: microseconds per window for encoding held-out windows with sequenceToInputFormat (one string
+#at a time, concatenated) versus Vocabulary.encodeBatch, at batch 1, 32 and 256. Needs no model.
+#--mode lexicon: symSpell build time and size of the lexicon files (memory-mapped, so this is also what the
+#page cache holds once they're hot), then lookups per second for held-out words as they are (the exact-match
+#path), with one substituted letter (fixSubstitution, the completion pre-pass) and with distance 2 lookups,
+#and how many of the substituted words the pre-pass restores. Needs no model.
+#--mode ngram: the character n-gram model (ngramModel.py, built from the training split) against the transformer
+#on held-out windows: build time and size, top-1 agreement, next-char accuracy and us/window at batch 256; then
+#for several COMPLETION_NGRAM_ACCEPT levels how many positions of corrupted held-out text the prefilter accepts
+#and how many of those the transformer accepts too; then textCorrection with and without the prefilter.
+#The correction mode runs without the prefilter, so it can be compared with the reference.
+#Without a generator.keras, --train-steps trains a small throwaway model on the corpus first.
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+def trainThrowawayModel(steps):
+    import modelCreation
+    text = modelCreation.loadCorpus()
+    vocabulary = modelCreation.buildVocabulary(text)
+    trainDataset, _ = modelCreation.buildDatasets(text, vocabulary)
+    model = modelCreation.buildModel(vocabulary.vocabSize)
+    model.compile(optimizer = 'adam', loss = 'sparse_categorical_crossentropy')
+    model.fit(trainDataset.take(steps), epochs = 1, verbose = 0)
+    path = os.path.join(tempfile.mkdtemp(), 'benchmark.keras')
+    model.save(path)
+    return path
+
+def readCorpus():
+    with open(os.path.join(here, 'trainingData/latinCorpusCleaned.txt'), 'r', encoding = 'utf-8') as f:
+        return f.read()
+
+#the validation split of modelCreation.buildDatasets (the last 20% of the corpus), never trained on
+def heldOutText():
+    corpus = readCorpus()
+    return corpus[int(len(corpus) * 0.8):]
+
+#corpus text with a replaced, dropped or inserted character every ~25 chars
+def makeSample(chars, seed = 0):
+    return corrupt(readCorpus()[chars:chars * 2], seed)
+
+def corrupt(text, seed):
+    import numpy as np
+    text = list(text)
+    rng = np.random.default_rng(seed)
+    for _ in range(len(text) // 25):
+        pos = int(rng.integers(1, len(text) - 1))
+        op = rng.integers(3)
+        if op == 0:
+            text[pos] = 'xqzk'[int(rng.integers(4))]
+        elif op == 1:
+            del text[pos]
+        else:
+            text.insert(pos, 'e')
+    return ''.join(text)
+
+class CountingModel:
+    def __init__(self, model):
+        self.model = model
+        self.calls = 0
+        self.rows = 0
+
+    def __call__(self, x, *args, **kwargs):
+        self.calls += 1
+        self.rows += len(x)
+        return self.model(x, *args, **kwargs)
+
+def scanReference(completion, text, threshold):
+    for i in range(1, len(text) - 1):
+        sequenceText, t = completion.getSequenceText(text, i, threshold)
+        completion.getNextCharsVector(completion.predictBatch([sequenceText])[0], t)
+
+def scanBatched(completion, text, threshold):
+    for start in range(1, len(text) - 1, completion.inferenceBatchSize):
+        completion.predictPositions(text, start, min(len(text) - 1, start + completion.inferenceBatchSize), threshold)
+
+#-> (corrected text, or the name of the exception the original algorithm stopped with, seconds)
+def timeCorrection(fn, text, threshold):
+    start = time.perf_counter()
+    try:
+        result = fn(text, threshold)
+    except (ValueError, IndexError) as e:
+        result = type(e).__name__
+    return result, time.perf_counter() - start
+
+#float weights of the model completion.py would load
+def loadFloatWeights():
+    import numpyModel
+    path = os.environ.get('COMPLETION_MODEL')
+    if path and (path.endswith('.npz') or os.path.isdir(path)):
+        return numpyModel.loadWeights(path)
+    if not path and numpyModel.findWeights():
+        return numpyModel.loadWeights()
+    import tensorflow as tf
+    return numpyModel.extractWeights(tf.keras.models.load_model(path or os.path.join(here, 'generator.keras')))
+
+def windowLatencyMs(model, batch, repeats):
+    model(batch)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model(batch)
+        timings.append((time.perf_counter() - start) * 1000 / len(batch))
+    return sorted(timings)[len(timings) // 2]
+
+def benchQuantized(completion, args, threshold):
+    import difflib
+    import numpy as np
+    import numpyModel
+
+    floatWeights = loadFloatWeights()
+    variants = [
+        ("float32", numpyModel.NumpyModel(floatWeights)),
+        ("int8", numpyModel.NumpyModel(numpyModel.quantizeWeights(floatWeights))),
+    ]
+    vocabulary = completion.vocabulary
+    text = heldOutText()
+    rng = np.random.default_rng(0)
+    positions = rng.integers(vocabulary.sequenceLength, len(text), size = args.windows)
+    batch = vocabulary.encodeBatch([text[p - vocabulary.sequenceLength:p] for p in positions]).copy()
+    truth = np.array([vocabulary.charToInt.get(text[p], -1) for p in positions])
+
+    samples = []
+    for seed in range(args.samples):
+        start = int(rng.integers(0, len(text) - args.chars))
+        clean = text[start:start + args.chars]
+        samples.append((clean, corrupt(clean, seed)))
+
+    top1 = {}
+    print(f"{'variant':>8} {'next-char acc':>13} {'correction acc':>14} {'ms/window b=1':>13} {'ms/window b=256':>15}")
+    for name, model in variants:
+        top1[name] = np.concatenate([model(batch[k:k + 256]).argmax(axis = 1) for k in range(0, len(batch), 256)])
+        completion.model = model
+        scores = []
+        for clean, corrupted in samples:
+            result, _ = timeCorrection(completion.textCorrection, corrupted, threshold)
+            scores.append(difflib.SequenceMatcher(None, result, clean).ratio())
+        accuracy = (top1[name] == truth).mean()
+        print(f"{name:>8} {accuracy:>13.4f} {np.mean(scores):>14.4f} {windowLatencyMs(model, batch[:1], 50):>13.3f} {windowLatencyMs(model, batch[:256], 5):>15.3f}")
+    print(f"top-1 next-char agreement int8 vs float32: {(top1['int8'] == top1['float32']).mean():.4f} over {len(batch)} held-out windows")
+
+def benchNgram(completion, args, threshold):
+    import difflib
+    import numpy as np
+    import ngramModel
+
+    vocabulary = completion.vocabulary
+    corpus = readCorpus()
+    text = heldOutText()
+    with tempfile.TemporaryDirectory() as modelPath:
+        start = time.perf_counter()
+        ngramModel.buildModel(modelPath = modelPath, text = corpus[:int(len(corpus) * 0.8)])
+        size = sum(os.path.getsize(os.path.join(modelPath, name)) for name in os.listdir(modelPath))
+        print(f"n-gram build: {time.perf_counter() - start:.1f} s, {size / 2**20:.1f} MiB")
+        ngrams = ngramModel.NgramModel(modelPath)
+
+        rng = np.random.default_rng(0)
+        positions = rng.integers(vocabulary.sequenceLength, len(text), size = args.windows)
+        windows = [text[p - vocabulary.sequenceLength:p] for p in positions]
+        truth = np.array([vocabulary.charToInt.get(text[p], -1) for p in positions])
+        batches = [windows[k:k + 256] for k in range(0, len(windows), 256)]
+        print(f"{'model':>12} {'next-char acc':>13} {'us/window b=256':>15}")
+        dists = {}
+        for name, predict in (("transformer", completion.predictBatch), ("n-gram", ngrams.distributions)):
+            predict(batches[0])
+            start = time.perf_counter()
+            dists[name] = np.concatenate([np.asarray(predict(batch)) for batch in batches])
+            us = (time.perf_counter() - start) * 1e6 / len(windows)
+            print(f"{name:>12} {(dists[name].argmax(axis = 1) == truth).mean():>13.4f} {us:>15.1f}")
+        print(f"top-1 agreement: {(dists['transformer'].argmax(axis = 1) == dists['n-gram'].argmax(axis = 1)).mean():.4f}")
+
+        #the prefilter's question: is the observed character of (corrupted) text plausible after its window
+        corrupted = corrupt(text[:args.windows * 2], 0)
+        windows = [completion.getSequenceText(corrupted, i, threshold) for i in range(1, len(corrupted) - 1)]
+        observed = corrupted[1:-1]
+        transformerAccepts = np.concatenate([
+            [c in completion.getNextCharsVector(probDist, t) for probDist, (_, t), c in
+             zip(completion.predictBatch([w for w, _ in windows[k:k + 256]]), windows[k:k + 256], observed[k:k + 256])]
+            for k in range(0, len(windows), 256)])
+        start = time.perf_counter()
+        p = ngrams.probabilities([w for w, _ in windows], observed)
+        print(f"n-gram P(observed char): {(time.perf_counter() - start) * 1e6 / len(windows):.1f} us/position")
+        print(f"transformer accepts {transformerAccepts.mean():.3f} of {len(windows)} corrupted positions")
+        print(f"{'accept':>7} {'n-gram accepts':>14} {'transformer agrees':>18}")
+        for level in (0.2, 0.5, 0.8, 0.95):
+            accepted = p >= level
+            print(f"{level:>7} {accepted.mean():>14.3f} {transformerAccepts[accepted].mean():>18.4f}")
+
+        #whole corrections: forward passes saved and how close the output stays to the transformer-only result
+        counter = CountingModel(completion.model)
+        completion.model = counter
+        previous, ngramModel._defaultModel = ngramModel._defaultModel, ngrams
+        prefilterAccept = completion.ngramAccept or 0.5
+        samples = [corrupt(text[k * args.chars:(k + 1) * args.chars], k) for k in range(args.samples)]
+        results = {}
+        print(f"{'correction':>18} {'seconds':>8} {'windows':>8} {'similarity':>10}")
+        for name, accept in (("transformer only", 0), ("n-gram prefilter", prefilterAccept)):
+            completion.ngramAccept = accept
+            completion.distributionCache.clear()
+            counter.rows = 0
+            start = time.perf_counter()
+            results[name] = [timeCorrection(completion.textCorrection, sample, threshold)[0] for sample in samples]
+            elapsed = time.perf_counter() - start
+            similarity = np.mean([difflib.SequenceMatcher(None, a, b).ratio() for a, b in zip(results[name], results["transformer only"])])
+            print(f"{name:>18} {elapsed:>8.2f} {counter.rows:>8} {similarity:>10.4f}")
+        ngramModel._defaultModel = previous
+
+def benchEncode(args):
+    import numpy as np
+    from vocabulary import loadVocabulary
+
+    vocabulary = loadVocabulary()
+    sequenceLength = vocabulary.sequenceLength
+    text = heldOutText()
+    positions = np.random.default_rng(0).integers(sequenceLength, len(text), size = max(args.windows, 256))
+    windows = [text[p - sequenceLength:p] for p in positions]
+    print(f"{'batch':>6} {'sequenceToInputFormat us/window':>32} {'encodeBatch us/window':>22} {'speedup':>8}")
+    for batchSize in (1, 32, 256):
+        batches = [windows[k:k + batchSize] for k in range(0, len(windows) - batchSize + 1, batchSize)]
+        timings = []
+        for encode in (lambda b: np.concatenate([vocabulary.sequenceToInputFormat(t) for t in b], axis = 0),
+                       vocabulary.encodeBatch):
+            encode(batches[0])
+            start = time.perf_counter()
+            for batch in batches:
+                encode(batch)
+            timings.append((time.perf_counter() - start) * 1e6 / (len(batches) * batchSize))
+        print(f"{batchSize:>6} {timings[0]:>32.2f} {timings[1]:>22.2f} {timings[0] / timings[1]:>7.1f}x")
+
+def benchLexicon(args):
+    import numpy as np
+    import symSpell
+
+    with tempfile.TemporaryDirectory() as lexiconPath:
+        start = time.perf_counter()
+        symSpell.buildLexicon(lexiconPath = lexiconPath)
+        print(f"build: {time.perf_counter() - start:.1f} s")
+        sizes = {name[:-len(".npy")]: os.path.getsize(os.path.join(lexiconPath, name)) for name in sorted(os.listdir(lexiconPath))}
+        print(f"files: {sum(sizes.values()) / 2**20:.1f} MiB (" + ", ".join(f"{name} {size / 2**20:.1f}" for name, size in sizes.items() if size > 2**16) + ")")
+        lexicon = symSpell.Lexicon(lexiconPath)
+
+        rng = np.random.default_rng(0)
+        words = [w for w in symSpell.wordPattern.findall(heldOutText()) if len(w) >= 4 and lexicon.count(w)]
+        words = [words[k] for k in rng.integers(0, len(words), size = args.windows)]
+        letters = "abcdefghilmnopqrstuvx"
+        corrupted = []
+        for w in words:
+            pos = int(rng.integers(len(w)))
+            corrupted.append(w[:pos] + letters[(letters.find(w[pos].lower()) + 1 + int(rng.integers(len(letters) - 1))) % len(letters)] + w[pos + 1:])
+
+        print(f"{'lookup':>22} {'words':>6} {'us/word':>9} {'words/s':>9}")
+        restored = []
+        for name, fn, tokens in (("count (exact words)", lexicon.count, words),
+                                 ("fixSubstitution", lambda t: restored.append(lexicon.fixSubstitution(t)), corrupted),
+                                 ("lookup distance 2", lexicon.lookup, corrupted)):
+            start = time.perf_counter()
+            for token in tokens:
+                fn(token)
+            us = (time.perf_counter() - start) * 1e6 / len(tokens)
+            print(f"{name:>22} {len(tokens):>6} {us:>9.1f} {1e6 / us:>9.0f}")
+        fixed = sum(fix is not None and fix[0] == w for fix, w in zip(restored, words))
+        wrong = sum(fix is not None and fix[0] != w for fix, w in zip(restored, words))
+        print(f"pre-pass: {fixed / len(words):.1%} of the substituted words restored, {wrong / len(words):.1%} changed to another word")
+
+def benchGraph(args):
+    import numpy as np
+    import tensorflow as tf
+    import compiledModel
+
+    path = os.environ.get('COMPLETION_MODEL') or os.path.join(here, 'generator.keras')
+    if not path.endswith('.keras'):
+        raise SystemExit("--mode graph needs a keras model (COMPLETION_MODEL=....keras)")
+    model = tf.keras.models.load_model(path)
+    sequenceLength = model.input_shape[1]
+    variants = [("eager", lambda: model)]
+    variants.append(("compiled", lambda: compiledModel.CompiledModel(model, sequenceLength).warmup()))
+    variants.append(("xla", lambda: compiledModel.CompiledModel(model, sequenceLength, jitCompile=True).warmup()))
+
+    rng = np.random.default_rng(0)
+    print(f"{'variant':>9} {'batch':>6} {'ms/call':>9} {'ms/window':>10}")
+    for name, build in variants:
+        try:
+            variant = build()
+        except Exception as e:
+            print(f"{name:>9}  unavailable: {e}")
+            continue
+        for batchSize in compiledModel.warmupBatchSizes:
+            #float64, like the arrays sequenceToInputFormat produces
+            x = np.stack([rng.integers(0, model.output_shape[-1], (batchSize, sequenceLength)),
+                          np.broadcast_to(np.linspace(-1.0, 1.0, sequenceLength), (batchSize, sequenceLength))], axis=-1)
+            variant(x)
+            repeats = max(3, 200 // batchSize)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                np.asarray(variant(x))
+            ms = (time.perf_counter() - start) * 1000 / repeats
+            print(f"{name:>9} {batchSize:>6} {ms:>9.2f} {ms / batchSize:>10.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", default="correction", choices=["correction", "quantized", "graph", "encode", "lexicon", "ngram"])
+    parser.add_argument("--windows", type=int, default=2000, help="held-out windows for --mode quantized, encode and ngram, words for --mode lexicon")
+    parser.add_argument("--chars", type=int, default=1000, help="characters of text per sample")
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--threshold", default="1/32")
+    parser.add_argument("--train-steps", type=int, default=300, help="steps for the throwaway model when there is no generator.keras")
+    parser.add_argument("--skip-reference", action="store_true", help="only time the batched engine")
+    args = parser.parse_args()
+
+    sys.path.append(here)
+    if args.mode == "encode":
+        benchEncode(args)
+        raise SystemExit(0)
+    if args.mode == "lexicon":
+        benchLexicon(args)
+        raise SystemExit(0)
+    if 'COMPLETION_MODEL' not in os.environ and not os.path.exists(os.path.join(here, 'generator.keras')):
+        print(f"no generator.keras, training a throwaway model for {args.train_steps} steps")
+        os.environ['COMPLETION_MODEL'] = trainThrowawayModel(args.train_steps)
+    if args.mode == "graph":
+        benchGraph(args)
+        raise SystemExit(0)
+    import completion
+    threshold = completion.parseThreshold(args.threshold)
+    if args.mode == "quantized":
+        benchQuantized(completion, args, threshold)
+        raise SystemExit(0)
+    if args.mode == "ngram":
+        benchNgram(completion, args, threshold)
+        raise SystemExit(0)
+    completion.ngramAccept = 0
+    counter = CountingModel(completion.model)
+    completion.model = counter
+
+    texts = [makeSample(args.chars, seed) for seed in range(args.samples)]
+    totalChars = sum(len(text) for text in texts)
+    print(f"{'':>10} {'engine':>10} {'chars':>7} {'seconds':>8} {'chars/s':>8} {'passes':>7} {'windows':>8}")
+
+    scans = [("batched", scanBatched)]
+    if not args.skip_reference:
+        scans.append(("reference", scanReference))
+    for name, scan in scans:
+        scan(completion, texts[0][:100], threshold)
+        completion.distributionCache.clear()
+        counter.calls = counter.rows = 0
+        start = time.perf_counter()
+        for text in texts:
+            scan(completion, text, threshold)
+        elapsed = time.perf_counter() - start
+        print(f"{'scan':>10} {name:>10} {totalChars:>7} {elapsed:>8.2f} {totalChars / elapsed:>8.0f} {counter.calls:>7} {counter.rows:>8}")
+
+    #"warm cache" runs the batched engine again over the same samples without clearing the distribution cache
+    engines = [("batched", completion.textCorrection), ("warm cache", completion.textCorrection)]
+    if not args.skip_reference:
+        engines.append(("original", lambda text, threshold: completion.textCorrection(text, threshold, repair = completion.originalRepair)))
+        engines.append(("reference", completion.textCorrectionReference))
+    results = {}
+    for name, fn in engines:
+        if name != "warm cache":
+            #warm up (first calls trace and allocate)
+            timeCorrection(fn, texts[0][:100], threshold)
+            completion.distributionCache.clear()
+        totalTime = 0
+        counter.calls = counter.rows = 0
+        results[name] = []
+        for text in texts:
+            result, elapsed = timeCorrection(fn, text, threshold)
+            results[name].append(result)
+            totalTime += elapsed
+        print(f"{'correction':>10} {name:>10} {totalChars:>7} {totalTime:>8.2f} {totalChars / totalTime:>8.0f} {counter.calls:>7} {counter.rows:>8}")
+        if name == "warm cache":
+            cache = completion.cacheStats()
+    print(f"distribution cache: hit ratio {cache['hitRatio']:.2f}, {cache['entries']} entries, {cache['bytes'] / 1e6:.1f} MB")
+    if "reference" in results:
+        print("identical output:", results["batched"] == results["warm cache"], "(batched, warm cache),",
+              results["original"] == results["reference"], "(original, reference)")
+        print("samples stopped by the original case c's ValueError:", results["reference"].count("ValueError"), "of", len(texts))
@@ -0,0 +1,42 @@
+import numpy as np
+import tensorflow as tf
+
+#Graph-compiled inference for the keras model. Calling the model eagerly converts the NumPy input and
+#dispatches every op from Python on each call; here the forward pass is traced once by tf.function with a
+#fixed (None, sequenceLength, 2) float32 signature (optionally compiled with XLA) and warmed up at load,
+#so calls only feed a tensor into the finished graph.
+
+#batch sizes textCorrection uses: single windows, case a candidate sets and full lookahead batches
+warmupBatchSizes = (1, 32, 256)
+
+class CompiledModel:
+    #called like the keras model: model(batch) -> (B, vocabSize) probabilities as a NumPy array
+    def __init__(self, model, sequenceLength, jitCompile=False):
+        self.model = model
+        self.output_shape = model.output_shape
+        self.jitCompile = jitCompile
+        signature = [tf.TensorSpec(shape=(None, sequenceLength, 2), dtype=tf.float32)]
+        self.forward = tf.function(lambda x: model(x, training=False), input_signature=signature, jit_compile=jitCompile)
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        batch = len(x)
+        if self.jitCompile:
+            #XLA compiles one program per input shape, so batches are padded up to a power of two
+            padded = 1 << max(0, batch - 1).bit_length()
+            if padded != batch:
+                x = np.concatenate([x, np.zeros((padded - batch,) + x.shape[1:], dtype=np.float32)])
+        return self.forward(tf.constant(x)).numpy()[:batch]
+
+    def warmup(self, batchSizes=warmupBatchSizes):
+        for batchSize in batchSizes:
+            self(np.zeros((batchSize,) + tuple(self.model.input_shape[1:]), dtype=np.float32))
+        return self
+
+#mode: "eager" returns the model as is, "compiled" wraps it in a tf.function, "xla" also jit-compiles it
+def wrapKerasModel(model, mode, sequenceLength):
+    if mode == 'eager':
+        return model
+    if mode not in ('compiled', 'xla'):
+        raise ValueError(f"Unknown COMPLETION_TF_MODE '{mode}', use 'compiled', 'xla' or 'eager'.")
+    return CompiledModel(model, sequenceLength, jitCompile=(mode == 'xla')).warmup()
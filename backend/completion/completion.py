@@ -1,81 +1,178 @@
-import tensorflow as tf
 import numpy as np
-import modelCreation
 import argparse 
+import os
+import re
+import sys
 from fractions import Fraction
-model = tf.keras.models.load_model('generator.keras')
-model.compile()
-sequenceLength = modelCreation.getSeqLen()
+here = os.path.dirname(os.path.abspath(__file__))
+if here not in sys.path:
+    sys.path.append(here)
+from vocabulary import loadVocabulary
+from distributionCache import DistributionCache
+#only the saved vocabulary is needed here, modelCreation (corpus, datasets) is for training
+vocabulary = loadVocabulary()
+
+#COMPLETION_BACKEND picks the inference engine: "tf" loads generator.keras with TensorFlow, "numpy" runs
+#generator.weights (memory-mapped) or generator.npz, exported by numpyModel.py, without TensorFlow.
+#"auto" uses numpy when exported weights are available.
+#COMPLETION_MODEL overrides the model file (e.g. for benchmark.py)
+def loadModel(backend, modelPath=None):
+    import numpyModel
+    if backend == 'auto':
+        if modelPath:
+            numpyWeights = modelPath.endswith('.npz') or os.path.isdir(modelPath)
+        else:
+            numpyWeights = numpyModel.findWeights() is not None
+        backend = 'numpy' if numpyWeights else 'tf'
+    if backend == 'numpy':
+        return numpyModel.loadNumpyModel(modelPath), backend
+    if backend != 'tf':
+        raise ValueError(f"Unknown COMPLETION_BACKEND '{backend}', use 'tf', 'numpy' or 'auto'.")
+    import tensorflow as tf
+    import compiledModel
+    model = tf.keras.models.load_model(modelPath or os.path.join(here, 'generator.keras'))
+    model.compile()
+    #COMPLETION_TF_MODE: "compiled" (default) traces a fixed-signature graph and warms it up, "xla" also
+    #jit-compiles it, "eager" calls the keras model directly
+    return compiledModel.wrapKerasModel(model, os.getenv('COMPLETION_TF_MODE', 'compiled').lower(), vocabulary.sequenceLength), backend
+
+model, backend = loadModel(os.getenv('COMPLETION_BACKEND', 'auto').lower(), os.getenv('COMPLETION_MODEL'))
+outputSize = getattr(model, 'output_shape', (None,))[-1]
+if outputSize is not None and outputSize != vocabulary.vocabSize:
+    raise ValueError(f"The model predicts {outputSize} characters but generator.vocab.json has {vocabulary.vocabSize}. Re-create the vocabulary with modelCreation.py.")
+sequenceLength = vocabulary.sequenceLength
+#memo of next-char distributions shared by every request served by this process. COMPLETION_CACHE_ENTRIES bounds
+#it (0 turns it off), COMPLETION_CACHE_TOPK is how many of the most probable characters each entry keeps
+distributionCache = DistributionCache(int(os.getenv('COMPLETION_CACHE_ENTRIES', '50000')), int(os.getenv('COMPLETION_CACHE_TOPK', '32')))
 #this variable represents the maximum number of missing characters can be generated at each position in the text
 depth = 5
 def test():
     testSeq = "s"
-    testSeq = modelCreation.sequenceToInputFormat(testSeq)
+    testSeq = vocabulary.sequenceToInputFormat(testSeq)
     probDist = model(testSeq)[0]
     threshold = 1/32
     for i in range(0,len(probDist)):
         if probDist[i] >= threshold:
-            print(f"{modelCreation.decode(i)}: {probDist[i]}")
+            print(f"{vocabulary.decode(i)}: {probDist[i]}")
 
+#all characters with probability >= threshold, most probable first (ties keep vocab order)
 def getNextCharsVector(probDist, threshold):
-    nextChars = []
-    for j in range(0,len(probDist)):
-        probability = probDist[j]
-        char = modelCreation.decode(j)
-        if probability >= threshold:
-            nextChars.append((char,probability))
-    nextCharsSorted = [ch for ch, p in sorted(nextChars, key=lambda x: x[1], reverse=True)]
-    return nextCharsSorted
+    probDist = np.asarray(probDist)
+    candidates = np.nonzero(probDist >= threshold)[0]
+    order = candidates[np.argsort(-probDist[candidates], kind='stable')]
+    return [vocabulary.vocab[j] for j in order]
 
-def getSeqeunce(text, i, threshold):
-    sequence = modelCreation.sequenceToInputFormat('')
-    sequenceText = ''
+#the model input text for position i (the sequenceLength chars before it) and the threshold for it
+def getSequenceText(text, i, threshold):
     if(i < sequenceLength):
+        #short sequences at the start of the text get a proportionally lower threshold
         threshold = (threshold * i) / sequenceLength
-        sequenceText = text[:i]
-        sequence = modelCreation.sequenceToInputFormat(sequenceText)
-    else:
-        sequenceText = text[i-sequenceLength:i]
-        sequence = modelCreation.sequenceToInputFormat(sequenceText)
-    return sequence, sequenceText, threshold
-        
-def textCorrection(text, thresholdStatic):
+        return text[:i], threshold
+    return text[i-sequenceLength:i], threshold
+
+def getSeqeunce(text, i, threshold):
+    sequenceText, threshold = getSequenceText(text, i, threshold)
+    return vocabulary.sequenceToInputFormat(sequenceText), sequenceText, threshold
+
+#one forward pass over many sequences; row k is the same distribution as model(sequenceToInputFormat(sequenceTexts[k]))[0]
+def predictBatch(sequenceTexts):
+    return np.asarray(model(vocabulary.encodeBatch(sequenceTexts)))
+
+#nextChars for each (sequenceText, threshold) in windows, as getNextCharsVector would give them. Windows seen
+#before are answered from distributionCache, the rest share one forward pass and are added to it
+def getNextCharsBatch(windows):
+    keys = [vocabulary.windowKey(sequenceText) for sequenceText, _ in windows]
+    cached = [distributionCache.get(key, threshold) for key, (_, threshold) in zip(keys, windows)]
+    results = [None if ids is None else [vocabulary.vocab[j] for j in ids] for ids in cached]
+    missing = [k for k, ids in enumerate(cached) if ids is None]
+    if missing:
+        probDists = predictBatch([windows[k][0] for k in missing])
+        for k, probDist in zip(missing, probDists):
+            distributionCache.put(keys[k], probDist)
+            results[k] = getNextCharsVector(probDist, windows[k][1])
+    return results
+
+#hit ratio and size of distributionCache (reported by completionServer's /health)
+def cacheStats():
+    return distributionCache.stats()
+
+#repairs text[i], which is not among nextChars. caseAChar is the first of nextChars after which followingChar
+#is predicted again (None if there is none). Returns the new text; every case only changes text at position i.
+def repairPosition(text, i, sequenceText, threshold, nextChars, followingChar, caseAChar):
+    if not nextChars:
+        #nothing reaches the threshold, there is nothing to repair with
+        return text
+    maxChar = nextChars[0]
+    #1. 'case a' error- text[i] is misinterpreted and should be replaced
+    if caseAChar is not None:
+        return text[:i] + caseAChar + text[i+1:]
+    #2. test for 'case b' error- text[i] is extraneous and should be skipped
+    if followingChar in nextChars:
+        return text[:i] + text[i+1:]
+
+    #3. test for 'case c' error- text[i] is early and should come after some missing text: up to depth
+    #characters are generated after the window, and inserted before text[i] once it is predicted after them
+    missing = ''
+    for j in range (0,depth):
+        missing += maxChar
+        testNextChars = getNextCharsVector(predictBatch([(sequenceText + missing)[-sequenceLength:]])[0], threshold)
+        if text[i] in testNextChars:
+            return text[:i] + missing + text[i:]
+        if not testNextChars:
+            break
+        maxChar = testNextChars[0]
+    #4. no missing text explains it either, text[i] is replaced with the most probable character
+    return text[:i] + nextChars[0] + text[i+1:]
+
+#the original repair of text[i] (cases a, b and c as they were, before repairPosition): case b drops everything
+#before text[i] and case c unpacks the candidate list into two names, so it raises ValueError on most inputs
+def originalRepair(text, i, sequenceText, threshold, nextChars, followingChar, caseAChar):
+    maxChar = nextChars[0]
+    if caseAChar is not None:
+        return text[:i] + caseAChar + text[i+1:]
+    if followingChar in nextChars:
+        return text[:1] + text[i+1:]
+    for j in range (0,5):
+        probDist = predictBatch([sequenceText[1:] + maxChar])[0]
+        nextChars, maxChar = getNextCharsVector(probDist, threshold)
+        if text[i] in nextChars:
+            text = text[:i] + maxChar + text[i:]
+            break
+        else:
+            text = text[:i] + maxChar + text[i+1:]
+            i += 1
+    return text
+
+#the original one-window-at-a-time algorithm, copied as it was (only the model call goes through predictBatch
+#and its debug print is gone). It is the regression oracle for batching: textCorrection with
+#repair = originalRepair returns the same text wherever this doesn't raise (see tests/backend/test_completion.py
+#and benchmark.py)
+def textCorrectionReference(text, thresholdStatic):
     #iterate over whole text, text can be appended to during the run, so we assume the largest possible length
     for i in range(1,len(text) *  depth):
         #since len(text) can change
         if i >= (len(text)-1):
             break
         #gather the sequence (and adjusted threshould value for short seqeunces) from the text
-        sequence, sequenceText, threshold = getSeqeunce(text, i, thresholdStatic)
+        sequenceText, threshold = getSequenceText(text, i, thresholdStatic)
 
         #probDist is a map of all characters in the vocab and their normalized probability
-        probDist = model(sequence)[0]
+        probDist = predictBatch([sequenceText])[0]
 
         #get next chars vector- all characters with prob above threshold, and the highest probable char
         nextChars = getNextCharsVector(probDist, threshold)
         maxChar = nextChars[0]
 
         if text[i] not in nextChars:
-            #actual character (test[i]) not found in nextChars vector, replace it somehow...
-            #--- naive strategy ---
-            #text = text = text[:i] + maxChar + text[i+1:]
-            #continue
-            #---
-
-            #in depth strategy--- 
-
             #first, the char after will be used to check replacement strategies
             followingChar = ' '
             if (i+1) < len(text):
-                followingChar = text[i+1] 
-            
-            #print(f"text: {text}, wrong char: {text[i]}, next chars: {nextChars}, following char: {followingChar}")
+                followingChar = text[i+1]
+
             #1. test for 'case a' error- text[i] is misinterpreted and should be replaced
             caseA = False
             for char in nextChars:
-                testSequence = modelCreation.sequenceToInputFormat(sequenceText[1:] + char)
-                print(sequenceText[1:] + char)
-                probDist = model(testSequence)[0]
+                probDist = predictBatch([sequenceText[1:] + char])[0]
                 testNextChars = getNextCharsVector(probDist, threshold)
                 if followingChar in testNextChars:
                     text = text[:i] + char + text[i+1:]
@@ -86,12 +183,10 @@ def textCorrection(text, thresholdStatic):
             if followingChar in nextChars:
                 text = text[:1] + text[i+1:]
                 continue
-            
+
             #3. test for 'case c' error- text[i] is early and should come after some missing text
             for j in range (0,5):
-                seqeunceText = sequenceText[1:] + maxChar
-                testSequence = modelCreation.sequenceToInputFormat(sequenceText[1:] + maxChar)
-                probDist = model(testSequence)[0]
+                probDist = predictBatch([sequenceText[1:] + maxChar])[0]
                 nextChars, maxChar = getNextCharsVector(probDist, threshold)
                 if text[i] in nextChars:
                     text = text[:i] + maxChar + text[i:]
@@ -99,30 +194,232 @@ def textCorrection(text, thresholdStatic):
                 else:
                     text = text[:i] + maxChar + text[i+1:]
                     i += 1
-            
     return text
 
+#most windows sent to the model in one forward pass
+inferenceBatchSize = 256
+#fewest windows predicted ahead after a repair
+minLookahead = 16
+
+#first tier of textCorrection: a character the n-gram model (ngramModel.py, generator.ngram) gives at least
+#COMPLETION_NGRAM_ACCEPT after its window is taken as correct without asking the transformer. 0 turns it off
+ngramAccept = float(os.getenv('COMPLETION_NGRAM_ACCEPT', '0.5'))
+
+#for each window, whether the n-gram model is sure of the character that follows it in text
+def ngramAccepted(windows, chars):
+    import ngramModel
+    ngrams = ngramModel.loadDefaultModel() if ngramAccept > 0 else None
+    if ngrams is None or not windows:
+        return [False] * len(windows)
+    return list(ngrams.probabilities([sequenceText for sequenceText, _ in windows], chars) >= ngramAccept)
+
+#(sequenceText, threshold, nextChars) for positions start..stop-1 of text, from one forward pass. nextChars is
+#None where the n-gram model accepted text[i], those windows don't go to the model
+def predictPositions(text, start, stop, thresholdStatic):
+    windows = [getSequenceText(text, i, thresholdStatic) for i in range(start, stop)]
+    accepted = ngramAccepted(windows, text[start:stop])
+    nextCharsList = iter(getNextCharsBatch([window for window, ok in zip(windows, accepted) if not ok]))
+    return {
+        start + k: (sequenceText, threshold, None if accepted[k] else next(nextCharsList))
+        for k, (sequenceText, threshold) in enumerate(windows)
+    }
+
+#case a for every candidate at once: the first of nextChars after which followingChar is predicted, or None
+def findCaseAChar(sequenceText, threshold, nextChars, followingChar):
+    if not nextChars or followingChar not in vocabulary.charToInt:
+        return None
+    testNextCharsList = getNextCharsBatch([(sequenceText[1:] + char, threshold) for char in nextChars])
+    for char, testNextChars in zip(nextChars, testNextCharsList):
+        if followingChar in testNextChars:
+            return char
+    return None
+
+def textCorrection(text, thresholdStatic, start = 1, stop = None, repair = repairPosition):
+    #With repair = originalRepair the same result as textCorrectionReference (where that doesn't raise), with
+    #far fewer forward passes; the default repairPosition fixes the original's cases b and c. The next-char
+    #distributions of the positions ahead are predicted in one batch and stay valid until the text is changed;
+    #a repair changes every window after it, so they are recomputed from there. All case a candidates of a
+    #position are verified in one batch. Windows already seen (in this text, or in an earlier request)
+    #come from distributionCache. With generator.ngram, positions the n-gram model is sure of skip the model
+    #(then the result can differ from the reference where the two models disagree).
+    #Only positions start..stop-1 are checked (stop moves with the repairs), the text around them is context.
+    predicted = {}
+    lookahead = inferenceBatchSize
+    lastRepair = start - 1
+    stop = len(text) if stop is None else stop
+    #repairs change the length of the text, the end of the region moves with them
+    stopShift = stop - len(text)
+    #iterate over whole text, text can be appended to during the run, so we assume the largest possible length
+    for i in range(start,len(text) *  depth):
+        #since len(text) can change
+        end = min(len(text) - 1, len(text) + stopShift)
+        if i >= end:
+            break
+        if i not in predicted:
+            predicted = predictPositions(text, i, min(end, i + lookahead), thresholdStatic)
+        sequenceText, threshold, nextChars = predicted[i]
+        if nextChars is None or text[i] in nextChars:
+            continue
+
+        #actual character (text[i]) not found in nextChars vector, replace it somehow...
+        followingChar = ' '
+        if (i+1) < len(text):
+            followingChar = text[i+1]
+        caseAChar = findCaseAChar(sequenceText, threshold, nextChars, followingChar)
+        text = repair(text, i, sequenceText, threshold, nextChars, followingChar, caseAChar)
+
+        #predict about twice the distance between the last two repairs ahead, so noisy text wastes little work
+        predicted = {}
+        lookahead = min(inferenceBatchSize, max(minLookahead, 2 * (i - lastRepair)))
+        lastRepair = i
+    return text
+
+#characters around a suspect span that are checked (and may be repaired) with it. 0: only the spans change
+spanMargin = 0
+
+#textCorrection restricted to spans: [start, end) offsets of suspect text (e.g. low-confidence OCR words).
+#Each span, widened by margin, is corrected with the text before it as context; the rest of the text is
+#never checked or changed. Returns (text, number of positions checked).
+def correctSpans(text, thresholdStatic, spans, margin = spanMargin):
+    text, _ = lexiconPass(text, spans)
+    regions = []
+    for spanStart, spanEnd in sorted(spans):
+        regionStart, regionEnd = max(1, spanStart - margin), min(len(text) - 1, spanEnd + margin)
+        if regionStart >= regionEnd:
+            continue
+        if regions and regionStart <= regions[-1][1]:
+            regions[-1][1] = max(regions[-1][1], regionEnd)
+        else:
+            regions.append([regionStart, regionEnd])
+    checked = sum(regionEnd - regionStart for regionStart, regionEnd in regions)
+    #offsets after a repair move by the change in length it made
+    shift = 0
+    for regionStart, regionEnd in regions:
+        before = len(text)
+        text = textCorrection(text, thresholdStatic, regionStart + shift, regionEnd + shift)
+        shift += len(text) - before
+    return text, checked
+
+#beam search correction (beamDecoder.py): hypotheses kept per character, and the most missing characters
+#inserted before one
+beamWidth = int(os.getenv('COMPLETION_BEAM_WIDTH', '8'))
+maxInsert = int(os.getenv('COMPLETION_MAX_INSERT', '2'))
+#chance of the OCR misreading a character, adding a spurious one (undone by a deletion) or dropping one
+#(undone by an insertion) at any one position
+substitutionPrior = float(os.getenv('COMPLETION_SUBSTITUTION_PRIOR', '0.02'))
+deletionPrior = float(os.getenv('COMPLETION_DELETION_PRIOR', '0.01'))
+insertionPrior = float(os.getenv('COMPLETION_INSERTION_PRIOR', '0.01'))
+
+#first tier of beamCorrection: a word with '?' lacunae whose matches in the training corpus (corpusIndex.py,
+#generator.corpus) are dominated by one word is filled with it before the model runs. COMPLETION_CORPUS_SHARE
+#is the share of the matching corpus words the most frequent one needs
+corpusShare = float(os.getenv('COMPLETION_CORPUS_SHARE', '0.6'))
+#letters with '?' lacunae inside them (beamDecoder.isLacuna); a '?' at the end of a word is a question mark
+lacunaWord = re.compile(r"[^\W\d_]+(?:\?+[^\W\d_]+)+")
+
+#-> (text with the lacunae filled from the corpus, their edits); unchanged without a corpus index
+def fillFromCorpus(text):
+    import corpusIndex
+    index = corpusIndex.loadDefaultIndex()
+    if index is None:
+        return text, []
+    edits = []
+    for match in lacunaWord.finditer(text):
+        word = match.group()
+        found = index.candidates(word, limit = None)
+        total = sum(count for _, count in found)
+        if not found or found[0][1] < corpusShare * total:
+            continue
+        fill, count = found[0]
+        for k, char in enumerate(word):
+            if char == '?':
+                edits.append({"position": match.start() + k, "kind": "fill", "observed": "?", "char": fill[k], "prob": count / total, "source": "corpus"})
+        text = text[:match.start()] + fill + text[match.end():]
+    return text, edits
+
+#cheap pre-pass before the model: a word that is not in the corpus but one substituted character away from
+#one likely corpus word (symSpell.py, generator.lexicon) is replaced with it, e.g. maxKme -> maxime.
+#COMPLETION_LEXICON_SHARE is the share of the corpus counts of all such words the best one needs
+lexiconShare = float(os.getenv('COMPLETION_LEXICON_SHARE', '0.8'))
+
+#-> (text, edits); only substitutions, so the length and every offset stay the same. With spans only the words
+#overlapping them are looked at, and only letters inside them are changed. Words next to a lacuna ('?' inside
+#a word, '[...]') are left to the lacuna filling.
+def lexiconPass(text, spans = None):
+    import beamDecoder
+    import symSpell
+    lexicon = symSpell.loadDefaultLexicon()
+    if lexicon is None:
+        return text, []
+    edits = []
+    for match in symSpell.wordPattern.finditer(text):
+        start, end = match.span()
+        if spans is not None and not any(spanStart < end and start < spanEnd for spanStart, spanEnd in spans):
+            continue
+        if (start > 0 and beamDecoder.isLacuna(text, start - 1)) or (end < len(text) and beamDecoder.isLacuna(text, end)):
+            continue
+        if text[start - 1:start] == ']' or text[end:end + 1] == '[':
+            continue
+        fix = lexicon.fixSubstitution(match.group(), lexiconShare)
+        if fix is None:
+            continue
+        word, share = fix
+        k = next(k for k, (a, b) in enumerate(zip(word, match.group())) if a != b)
+        if spans is not None and not any(spanStart <= start + k < spanEnd for spanStart, spanEnd in spans):
+            continue
+        edits.append({"position": start + k, "kind": "substitution", "observed": match.group()[k], "char": word[k], "prob": share, "source": "lexicon"})
+        text = text[:start] + word + text[end:]
+    return text, edits
+
+#textCorrection after the lexicon pre-pass; what completionServer and the OCR service run
+def correctText(text, thresholdStatic):
+    text, _ = lexiconPass(text)
+    return textCorrection(text, thresholdStatic)
+
+#corrects text by beam search over substitutions, deletions and insertions instead of textCorrection's greedy
+#cases, and fills lacunae marked with '?' or '[...]', from the corpus index where it is sure and with the
+#model otherwise. Returns {"text", "logProb", "edits"}, every edit with its position in text, probability
+#and source ("corpus", "lexicon" or "model")
+def beamCorrection(text, beamWidth = beamWidth, maxInsert = maxInsert):
+    import beamDecoder
+    text, corpusEdits = fillFromCorpus(text)
+    text, lexiconEdits = lexiconPass(text)
+    decoder = beamDecoder.BeamDecoder(predictBatch, vocabulary, beamWidth, maxInsert, substitutionPrior = substitutionPrior,
+                                      insertionPrior = insertionPrior, deletionPrior = deletionPrior)
+    result = decoder.decode(text)
+    for edit in result["edits"]:
+        edit["source"] = "model"
+    result["edits"] = sorted(corpusEdits + lexiconEdits + result["edits"], key = lambda edit: edit["position"])
+    return result
+
+#accepts a fraction like '1/32' or a decimal like '0.03' (also used by completionServer.py)
+def parseThreshold(threshold):
+    if isinstance(threshold, (int, float)):
+        return float(threshold)
+    try:
+        if '/' in threshold:
+            return float(Fraction(threshold))
+        return float(threshold)
+    except (ValueError, ZeroDivisionError) as e:
+        raise ValueError(f"Invalid threshold value '{threshold}'. Write the threshold value as a string either as a fraction like '1/32' or a decimal like '0.03': {e}")
+
 #Example run
 #print(textCorrection("Maxima pars Graium Saturno et maxKme AthKnae", 0.001))
 #exit()
 #this file is called on from the CLI using subprocess. in that instance, the value of __name__ is '__main__'
 #it must be called using subprocess, as it expects the source to be the 'backend/completion/transformerEnv/' interpreter or venv
+#for repeated calls, run completionServer.py instead: it loads the model once and serves textCorrection over HTTP
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("ocrText", default = "Provide OCRtext as a CLI argument")
     parser.add_argument("threshold", default = "1/32")
+    parser.add_argument("--mode", default = "greedy", choices = ["greedy", "beam"], help = "beam: beamCorrection (the threshold is not used)")
     args = parser.parse_args()
 
-    threshold = args.threshold
-    try:
-        if '/' in threshold:
-            threshold = float(Fraction(threshold))
-        else:
-            threshold = float(threshold)
-    except (ValueError, ZeroDivisionError) as e:
-        raise ValueError(f"Invalid threshold value '{threshold}'. Write the threshold value as a string either as a fraction like '1/32' or a decimal like '0.03': {e}")
-        
-    correctedText = textCorrection(args.ocrText, threshold)
+    if args.mode == "beam":
+        correctedText = beamCorrection(args.ocrText)["text"]
+    else:
+        correctedText = correctText(args.ocrText, parseThreshold(args.threshold))
     print(correctedText)
     #subprocess will capture this output
\ No newline at end of file
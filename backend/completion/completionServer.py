@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import signal
+import threading
+import time
+import traceback
+from fractions import Fraction
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#Long-lived completion worker. Importing completion (TensorFlow, the vocab, generator.keras) costs
+#seconds, so it is done once at startup and every request after that only pays for inference.
+#Run it with the 'transformerEnv' interpreter from backend/completion, like completion.py:
+#   transformerEnv/bin/python completionServer.py --port 8765
+#Endpoints:
+#   GET  /health   -> {"status": "ok", "backend", "sequenceLength", "loadMs", "requests", "uptimeS", "cache"}
+#                     cache: hits, misses, hitRatio, entries and bytes of the next-char distribution cache
+#   POST /correct  {"text": "...", "threshold": "1/32"} -> {"text": corrected, "durationMs"}
+#                  {"text": "...", "mode": "beam"} -> {"text", "durationMs", "logProb", "edits"} (completion.beamCorrection)
+#                  {"text": "...", "threshold", "spans": [[start, end], ...]} -> {"text", "durationMs", "rescored"}
+#                  only checks the suspect spans (completion.correctSpans); rescored is the number of positions checked
+#With --workers N (preload/fork mode) the vocabulary and model are loaded and the socket is bound once,
+#then N worker processes are forked that all accept on it. With the numpy backend and memory-mapped
+#weights (generator.weights) the workers share one copy of the weights. Each worker has its own distribution
+#cache, /health reports the one of the worker that answered. Workers that die are restarted, with a backoff
+#while they die right after starting (serveForked).
+
+defaultThreshold = "1/32"
+#upper bound on a request body, the OCR text of a large document is still far below this
+maxBodyBytes = 8 * 1024 * 1024
+
+class CompletionHandler(BaseHTTPRequestHandler):
+    #set by makeServer
+    state = None
+
+    def sendJson(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self.sendJson(404, {"error": f"unknown path {self.path}"})
+            return
+        state = self.state
+        self.sendJson(200, {
+            "status": "ok",
+            "backend": state["backend"],
+            "pid": os.getpid(),
+            "sequenceLength": state["sequenceLength"],
+            "loadMs": state["loadMs"],
+            "requests": state["requests"],
+            "uptimeS": round(time.time() - state["startedAt"], 1),
+            "cache": state["cacheStats"]() if state["cacheStats"] else None,
+        })
+
+    def do_POST(self):
+        if self.path != '/correct':
+            self.sendJson(404, {"error": f"unknown path {self.path}"})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0 or length > maxBodyBytes:
+            self.sendJson(400, {"error": "missing or oversized request body"})
+            return
+        try:
+            request = json.loads(self.rfile.read(length))
+            text = request["text"]
+            threshold = self.state["parseThreshold"](request.get("threshold", defaultThreshold))
+            mode = request.get("mode", "greedy")
+            if mode not in ("greedy", "beam") or (mode == "beam" and self.state["beamCorrect"] is None):
+                raise ValueError(f"unsupported mode '{mode}'")
+            spans = request.get("spans")
+            if spans is not None:
+                if self.state["correctSpans"] is None:
+                    raise ValueError("spans are not supported")
+                spans = [(int(spanStart), int(spanEnd)) for spanStart, spanEnd in spans]
+        except (ValueError, KeyError, TypeError, ZeroDivisionError) as e:
+            self.sendJson(400, {"error": f"bad request: {e}"})
+            return
+
+        start = time.perf_counter()
+        try:
+            if mode == "beam":
+                response = self.state["beamCorrect"](text)
+            elif spans is not None:
+                corrected, rescored = self.state["correctSpans"](text, threshold, spans)
+                response = {"text": corrected, "rescored": rescored}
+            else:
+                response = {"text": self.state["correct"](text, threshold)}
+        except Exception as e:
+            self.sendJson(500, {"error": f"completion failed: {e}"})
+            return
+        durationMs = int((time.perf_counter() - start) * 1000)
+        with self.state["lock"]:
+            self.state["requests"] += 1
+        self.sendJson(200, {**response, "durationMs": durationMs})
+
+    def log_message(self, format, *args):
+        if not self.state["quiet"]:
+            super().log_message(format, *args)
+
+#builds the server around any correct(text, threshold) function, so it can be tested without the model
+def makeServer(correct, parseThreshold=lambda t: float(Fraction(t)), host='127.0.0.1', port=8765, sequenceLength=None, loadMs=0, quiet=False,
+               backend=None, cacheStats=None, beamCorrect=None, correctSpans=None):
+    state = {
+        "backend": backend,
+        "correct": correct,
+        "cacheStats": cacheStats,
+        "beamCorrect": beamCorrect,
+        "correctSpans": correctSpans,
+        "parseThreshold": parseThreshold,
+        "sequenceLength": sequenceLength,
+        "loadMs": loadMs,
+        "requests": 0,
+        "startedAt": time.time(),
+        "lock": threading.Lock(),
+        "quiet": quiet,
+    }
+    handler = type('BoundCompletionHandler', (CompletionHandler,), {"state": state})
+    return ThreadingHTTPServer((host, port), handler)
+
+#imports completion once (this is where the model is loaded) and wraps it in a server
+def loadServer(host, port, quiet=False):
+    start = time.perf_counter()
+    import completion
+    loadMs = int((time.perf_counter() - start) * 1000)
+    return makeServer(completion.correctText, completion.parseThreshold, host, port,
+                      sequenceLength=completion.sequenceLength, loadMs=loadMs, quiet=quiet, backend=completion.backend,
+                      cacheStats=completion.cacheStats, beamCorrect=completion.beamCorrection,
+                      correctSpans=completion.correctSpans)
+
+#a worker that exits sooner than this after it was forked died starting up (bad weights, the socket, ...).
+#Such restarts wait restartBackoffS, doubled for every one in a row up to maxRestartBackoffS, and after
+#maxQuickExits in a row the server gives up
+workerMinUptimeS = 10
+restartBackoffS = 1
+maxRestartBackoffS = 30
+maxQuickExits = 5
+
+#preload/fork mode: forks workers that serve the already bound server, restarts any that die (backing off
+#while they die right after starting), and stops them all on SIGINT/SIGTERM
+def serveForked(server, workers):
+    children = {}
+    stopping = False
+    quickExits = 0
+
+    def forkWorker():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            status = 1
+            try:
+                server.serve_forever()
+                status = 0
+            except Exception:
+                traceback.print_exc()
+            finally:
+                os._exit(status)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(workers):
+        forkWorker()
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        startedAt = children.pop(pid, None)
+        if stopping or startedAt is None:
+            continue
+        if time.monotonic() - startedAt >= workerMinUptimeS:
+            quickExits = 0
+            print(f"completion worker {pid} exited (status {status}), starting a new one")
+            forkWorker()
+            continue
+        quickExits += 1
+        if quickExits >= maxQuickExits:
+            print(f"completion workers exited within {workerMinUptimeS} s of starting {quickExits} times in a row, stopping")
+            stop(None, None)
+            continue
+        delay = min(maxRestartBackoffS, restartBackoffS * 2 ** (quickExits - 1))
+        print(f"completion worker {pid} exited (status {status}) right after starting, starting a new one in {delay} s")
+        time.sleep(delay)
+        if not stopping:
+            forkWorker()
+    server.server_close()
+    if quickExits >= maxQuickExits:
+        raise SystemExit("completion workers keep dying at startup")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--quiet", action="store_true", help="don't log every request")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes forked after the model is loaded")
+    args = parser.parse_args()
+
+    server = loadServer(args.host, args.port, args.quiet)
+    state = server.RequestHandlerClass.state
+    print(f"completion server ready on http://{args.host}:{args.port} (model loaded in {state['loadMs']} ms)")
+    if args.workers > 1:
+        #TensorFlow's runtime threads do not survive a fork, only the numpy backend can be preloaded
+        if state["backend"] != "numpy":
+            raise SystemExit("--workers needs the numpy backend (export the weights with numpyModel.py)")
+        serveForked(server, args.workers)
+        raise SystemExit(0)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,193 @@
+import argparse
+import os
+import time
+from collections import Counter
+
+import numpy as np
+
+from vocabulary import loadVocabulary
+
+#Suffix array over the cleaned training corpus, for looking up damaged words in it.
+#   python corpusIndex.py                  builds generator.corpus/ from trainingData/latinCorpusCleaned.txt
+#   python corpusIndex.py --query 'ma?ime' 'Ath*'
+#The index is a directory of .npy files, like generator.weights: the corpus as vocab ids (uint8) and the
+#sorted suffix start positions (int32). Both are memory-mapped read-only, so loading is instant and the
+#pages are shared between processes. A query binary-searches the suffix array for the longest literal
+#piece of the pattern, then checks the rest of the pattern on all its occurrences at once with NumPy.
+#Patterns are words: ? is one unknown letter, a * at the start or the end stands for any letters
+#(suffix and prefix queries). candidates() returns the matching corpus words, most frequent first.
+
+#bump when the files or the encoding change
+indexFormatVersion = 1
+here = os.path.dirname(os.path.abspath(__file__))
+defaultCorpusPath = os.path.join(here, "trainingData/latinCorpusCleaned.txt")
+defaultIndexPath = os.path.join(here, "generator.corpus")
+wildcardChar = '?'
+anyChars = '*'
+#longest word a prefix or suffix query extends a match to
+maxWordLength = 24
+#occurrences of the literal piece that are checked against the whole pattern; a piece found more often is
+#checked on that many occurrences spread evenly over its suffix array range, so counts are a sample then
+maxOccurrences = 200000
+
+#suffix array by prefix doubling: after round k the suffixes are sorted by their first 2^k characters.
+#Every round is one stable argsort of (rank, rank k positions later) keys, so the whole build is NumPy
+#work, O(n log n) per round and O(log longest repeat) rounds.
+def buildSuffixArray(ids):
+    n = len(ids)
+    #0 is reserved for "past the end", which sorts before every character
+    rank = ids.astype(np.int64) + 1
+    k = 1
+    while True:
+        following = np.zeros(n, dtype = np.int64)
+        following[:n - k] = rank[k:]
+        key = rank * (n + 1) + following
+        suffixes = np.argsort(key, kind = 'stable')
+        sortedKey = key[suffixes]
+        newRank = np.empty(n, dtype = np.int64)
+        newRank[suffixes] = np.cumsum(np.concatenate([[1], sortedKey[1:] != sortedKey[:-1]]))
+        rank = newRank
+        if n == 0 or rank[suffixes[-1]] == n or k >= n:
+            return suffixes.astype(np.int32)
+        k *= 2
+
+def buildIndex(corpusPath = defaultCorpusPath, indexPath = defaultIndexPath, vocabulary = None):
+    vocabulary = vocabulary or loadVocabulary()
+    if vocabulary.vocabSize > 255:
+        raise ValueError("The corpus index stores vocab ids as uint8, the vocabulary has too many characters.")
+    with open(corpusPath, 'r', encoding = 'utf-8') as f:
+        text = f.read()
+    #characters outside the vocab become spaces (word breaks)
+    text = "".join(c if c in vocabulary.charToInt else ' ' for c in text)
+    ids = vocabulary.encode(text).astype(np.uint8)
+    os.makedirs(indexPath, exist_ok = True)
+    np.save(os.path.join(indexPath, "text.npy"), ids)
+    np.save(os.path.join(indexPath, "suffixes.npy"), buildSuffixArray(ids))
+    np.save(os.path.join(indexPath, "vocab.npy"), np.array(vocabulary.vocab))
+    np.save(os.path.join(indexPath, "formatVersion.npy"), np.int32(indexFormatVersion))
+    return indexPath
+
+class CorpusIndex:
+    def __init__(self, indexPath = defaultIndexPath, vocabulary = None):
+        self.vocabulary = vocabulary or loadVocabulary()
+        if int(np.load(os.path.join(indexPath, "formatVersion.npy"))) != indexFormatVersion:
+            raise ValueError(f"Error: {indexPath} has an old index format. Rebuild it with corpusIndex.py.")
+        if list(np.load(os.path.join(indexPath, "vocab.npy"))) != self.vocabulary.vocab:
+            raise ValueError(f"Error: {indexPath} was built with another vocabulary. Rebuild it with corpusIndex.py.")
+        self.ids = np.load(os.path.join(indexPath, "text.npy"), mmap_mode = "r")
+        self.suffixes = np.load(os.path.join(indexPath, "suffixes.npy"), mmap_mode = "r")
+        #vocab ids of letters; everything else ends a word
+        self.isLetter = np.array([c.isalpha() for c in self.vocabulary.vocab] + [False])
+        self.boundaryId = self.vocabulary.vocabSize
+
+    def encode(self, literal):
+        return bytes(self.vocabulary.charToInt[c] for c in literal)
+
+    #[lo, hi) range of the suffix array whose suffixes start with literal (vocab ids as bytes)
+    def suffixRange(self, literal):
+        m = len(literal)
+        suffixes, ids = self.suffixes, self.ids
+        lo, hi = 0, len(suffixes)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = int(suffixes[mid])
+            if bytes(ids[start:start + m]) < literal:
+                lo = mid + 1
+            else:
+                hi = mid
+        first = lo
+        hi = len(suffixes)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = int(suffixes[mid])
+            if bytes(ids[start:start + m]) <= literal:
+                lo = mid + 1
+            else:
+                hi = mid
+        return first, lo
+
+    def count(self, literal):
+        first, last = self.suffixRange(self.encode(literal))
+        return last - first
+
+    #(len(starts), width) ids of the corpus from each start, boundaryId outside the corpus
+    def windows(self, starts, width):
+        positions = starts[:, None] + np.arange(width)
+        inside = (positions >= 0) & (positions < len(self.ids))
+        return np.where(inside, np.asarray(self.ids)[np.clip(positions, 0, len(self.ids) - 1)], self.boundaryId)
+
+    #start positions of every occurrence of pattern, where ? matches any one letter
+    def findAll(self, pattern):
+        if any(c != wildcardChar and c not in self.vocabulary.charToInt for c in pattern):
+            return np.zeros(0, dtype = np.int64)
+        pieces = pattern.split(wildcardChar)
+        if not any(pieces):
+            raise ValueError("A pattern needs at least one known character.")
+        #the longest literal piece narrows the search, the rest is checked on its occurrences
+        piece = max(pieces, key = len)
+        offset = pattern.index(piece)
+        first, last = self.suffixRange(self.encode(piece))
+        if last - first > maxOccurrences:
+            sample = np.linspace(first, last - 1, maxOccurrences).astype(np.int64)
+        else:
+            sample = np.arange(first, last)
+        starts = np.sort(np.asarray(self.suffixes[sample], dtype = np.int64)) - offset
+        starts = starts[(starts >= 0) & (starts + len(pattern) <= len(self.ids))]
+        window = self.windows(starts, len(pattern))
+        known = np.array([c != wildcardChar for c in pattern])
+        expected = np.array([self.vocabulary.charToInt.get(c, 0) for c in pattern])
+        ok = (window[:, known] == expected[known]).all(axis = 1) & self.isLetter[window[:, ~known]].all(axis = 1)
+        return starts[ok]
+
+    #whole corpus words matching pattern -> [(word, count)], most frequent first.
+    #? is one letter, a leading or trailing * any number of letters
+    def candidates(self, pattern, limit = 10):
+        prefixQuery, suffixQuery = pattern.endswith(anyChars), pattern.startswith(anyChars)
+        core = pattern.strip(anyChars)
+        if not core or anyChars in core:
+            raise ValueError("Use * only at the start or the end of a pattern.")
+        starts = self.findAll(core)
+        if len(starts) == 0:
+            return []
+        #extend each match over the letters before and after it (up to maxWordLength), or require a word
+        #boundary there
+        before = self.windows(starts - maxWordLength, maxWordLength)[:, ::-1]
+        after = self.windows(starts + len(core), maxWordLength)
+        leading = np.argmin(self.isLetter[before], axis = 1) if suffixQuery else np.zeros(len(starts), dtype = np.int64)
+        trailing = np.argmin(self.isLetter[after], axis = 1) if prefixQuery else np.zeros(len(starts), dtype = np.int64)
+        ok = ~self.isLetter[before[np.arange(len(starts)), leading]] & ~self.isLetter[after[np.arange(len(starts)), trailing]]
+        counts = Counter()
+        vocab = self.vocabulary.vocab
+        for start, lead, trail in zip(starts[ok], leading[ok], trailing[ok]):
+            counts[bytes(self.ids[start - lead:start + len(core) + trail])] += 1
+        return [("".join(vocab[b] for b in word), n) for word, n in counts.most_common(limit)]
+
+_defaultIndex = None
+
+#the index in generator.corpus, loaded once; None when it hasn't been built
+def loadDefaultIndex(indexPath = None):
+    global _defaultIndex
+    if _defaultIndex is None:
+        indexPath = indexPath or os.getenv('COMPLETION_CORPUS_INDEX', defaultIndexPath)
+        if not os.path.exists(os.path.join(indexPath, "suffixes.npy")):
+            return None
+        _defaultIndex = CorpusIndex(indexPath)
+    return _defaultIndex
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=defaultCorpusPath)
+    parser.add_argument("--index", default=defaultIndexPath)
+    parser.add_argument("--query", nargs="*", help="look words up instead of building, e.g. 'ma?ime' 'Ath*' '*nae'")
+    args = parser.parse_args()
+
+    if args.query is None:
+        start = time.perf_counter()
+        buildIndex(args.corpus, args.index)
+        print(f"wrote {args.index} in {time.perf_counter() - start:.1f} s")
+        raise SystemExit(0)
+    index = CorpusIndex(args.index)
+    for pattern in args.query:
+        start = time.perf_counter()
+        found = index.candidates(pattern)
+        print(f"{pattern}: {found} ({(time.perf_counter() - start) * 1000:.2f} ms)")
@@ -0,0 +1,83 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+#Bounded LRU memo of next-character distributions, keyed by the context window the model sees (the window
+#text after out-of-vocabulary characters are dropped, which encodes to exactly one model input).
+#Only the topK most probable characters of a distribution are kept, sorted by probability with ties in
+#vocab order, exactly as getNextCharsVector orders them. A lookup for a threshold is answered only when
+#the kept characters provably contain every character at or above it (the smallest kept probability is
+#below the threshold, or the whole vocab is kept); otherwise it counts as a miss and the model is asked.
+
+class DistributionCache:
+    def __init__(self, maxEntries=50000, topK=32):
+        self.maxEntries = maxEntries
+        self.topK = topK
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        #entries that were present but too short for a low threshold
+        self.uncovered = 0
+        self._bytes = 0
+
+    def get(self, key, threshold):
+        #indices of all characters with probability >= threshold, most probable first, or None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            ids, probs, complete = entry
+            if not complete and probs[-1] >= threshold:
+                self.uncovered += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return ids[:np.searchsorted(-probs, -threshold, side='right')]
+
+    def put(self, key, probDist):
+        if self.maxEntries <= 0:
+            return
+        probDist = np.asarray(probDist)
+        order = np.argsort(-probDist, kind='stable')[:self.topK]
+        entry = (order.astype(np.int16), probDist[order].astype(probDist.dtype), len(order) == len(probDist))
+        size = self._entrySize(key, entry)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= self._entrySize(key, old)
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.maxEntries:
+                oldKey, oldEntry = self._entries.popitem(last=False)
+                self._bytes -= self._entrySize(oldKey, oldEntry)
+
+    @staticmethod
+    def _entrySize(key, entry):
+        ids, probs, _ = entry
+        return sys.getsizeof(key) + ids.nbytes + probs.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.uncovered = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "maxEntries": self.maxEntries,
+                "topK": self.topK,
+                "hits": self.hits,
+                "misses": self.misses,
+                "uncovered": self.uncovered,
+                "hitRatio": round(self.hits / lookups, 4) if lookups else 0.0,
+                #keys and kept arrays; the dict's own overhead is not included
+                "bytes": self._bytes,
+            }
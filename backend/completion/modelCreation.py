@@ -1,8 +1,11 @@
-import numpy as np
+import argparse
 import tensorflow as tf
 import os
 import re
-from sklearn.model_selection import train_test_split
+from vocabulary import Vocabulary, defaultVocabPath
+
+#Importing this module has no side effects: the corpus is only read, cleaned and turned into datasets
+#when training is requested (trainAndSaveModel, or running this file). Inference uses vocabulary.py.
 
 #important model variables
 dimensionality = 64
@@ -14,8 +17,11 @@ numEpochs = 25
 def getSeqLen(): 
     return sequenceLength
 #corpus data
-corpusPath = "trainingData/latinCorpus.txt"
-cleanCorpusPath = "trainingData/latinCorpusCleaned.txt"
+here = os.path.dirname(os.path.abspath(__file__))
+corpusPath = os.path.join(here, "trainingData/latinCorpus.txt")
+cleanCorpusPath = os.path.join(here, "trainingData/latinCorpusCleaned.txt")
+modelPath = os.path.join(here, "generator.keras")
+quantizedModelPath = os.path.join(here, "generator.int8.npz")
 
 #grabbing/cleaning corpus data
 def readAndCleanInput():
@@ -28,80 +34,55 @@ def readAndCleanInput():
             if char.isalpha() or char == ' ' or char == '.' or char == '?' or char =='!' or char == ',' or char == ';' or char == '-':
                 text += char
     text = re.sub(r"\s+", " ", text)
-    with open(cleanCorpusPath, "w") as f:
+    with open(cleanCorpusPath, "w", encoding='utf-8') as f:
         f.write(text)
-        
-#throw exception if corpus is not found
-if not os.path.exists(corpusPath):
-    raise ValueError("Error: Could not find file containing corpus data at trainingData/latinCorpus.txt")
-
-processInput = False
-if not os.path.exists(cleanCorpusPath):
-    #by default, if there is not a cleaned txt file, this needs to be true
-    processInput = True
-if processInput:
-    readAndCleanInput()
-text = ""
-with open(cleanCorpusPath, 'r', encoding = 'utf-8') as f:
-    text = f.read()
-
-#important variables from the corpus data
-vocab = sorted(set(text))
-vocabSize = len(vocab)
-#encoding and decoding
-charToInt = {ch: i for i, ch in enumerate(vocab)}
-intToChar = {i: ch for i, ch in enumerate(vocab)}
-
-#its a bit more clear to have this as a function
-def decode(encodedChar):
-    return intToChar[encodedChar]
-
-#pads out to 32 char long, encodes string text, adds location info, and a batch dimension to match the model input
-def sequenceToInputFormat(text):
-    temp = ""
-    for c in text:
-        if c in vocab:
-            temp += c
-    text = temp
-    if(len(text) > sequenceLength):
-        raise ValueError(f"The method 'modelCreation.stringToInputFormat' expects an input equal to or smaller than the sequnce length: {sequenceLength}\n Handle splitting larger text bodies into sequences at the callsite.")
-    pad = ""
-    for i in range(sequenceLength - len(text)):
-        pad += ' '
-    text = pad + text
-    encodedText = np.array([charToInt[c] for c in text])
-    location = np.linspace(start = -1.0, stop = 1.0, num = sequenceLength)
-    encodedText = np.stack([encodedText, location], axis=-1)
-
-    encodedText = np.expand_dims(encodedText, axis=0)
-    return encodedText
-
-#converts text into integers
-encodedText = np.array([charToInt[c] for c in text])
-location = np.linspace(start = -1.0, stop = 1.0, num = sequenceLength)
-x = []
-y = []
-for i in range(len(encodedText) - sequenceLength - 1):
-    charSeq = encodedText[i: i+sequenceLength]
-    target = encodedText[i+sequenceLength+1]
-    
-    charSeqWithLocation = np.stack([charSeq, location], axis=1)
-    x.append(charSeqWithLocation)
-    y.append(target)
-
-#split into train and validation data
-splitInd = int(len(x) * 0.8)
-xTrain, xValid = x[:splitInd], x[splitInd:]
-yTrain, yValid = y[:splitInd], y[splitInd:]
-
-#convert into tensorflow dataset objects
-trainDataset = tf.data.Dataset.from_tensor_slices((xTrain, yTrain)).batch(batchSize)
-trainDataset.shuffle(buffer_size=5000)
-trainDataset.prefetch(tf.data.AUTOTUNE)
-validDataset = tf.data.Dataset.from_tensor_slices((xValid, yValid)).batch(batchSize)
 
-#call this from an external callsite if necessary, to load the model, use model.load()
-def trainAndSaveModel():
+#returns the cleaned corpus text, cleaning the raw corpus first if there is no cleaned txt file yet
+def loadCorpus():
+    if not os.path.exists(cleanCorpusPath):
+        #throw exception if corpus is not found
+        if not os.path.exists(corpusPath):
+            raise ValueError("Error: Could not find file containing corpus data at trainingData/latinCorpus.txt")
+        readAndCleanInput()
+    with open(cleanCorpusPath, 'r', encoding = 'utf-8') as f:
+        return f.read()
+
+#the vocabulary the model is trained with; saved next to the model as generator.vocab.json
+def buildVocabulary(text):
+    return Vocabulary.fromText(text, sequenceLength)
+
+#converts text into integers and builds the train and validation datasets.
+#Only the encoded corpus (one int32 array) is kept in memory: a dataset element is the start index of
+#a window, and each batch of indices is gathered into (batch, sequenceLength, 2) inputs on the fly.
+#Window i is encodedText[i:i+sequenceLength] and its target is the next character, encodedText[i+sequenceLength].
+def buildDatasets(text, vocabulary):
+    encodedText = tf.constant(vocabulary.encode(text), dtype = tf.int32)
+    location = tf.constant(vocabulary.location, dtype = tf.float32)
+    offsets = tf.range(sequenceLength, dtype = tf.int64)
+    numWindows = int(encodedText.shape[0]) - sequenceLength
+
+    def gatherWindows(starts):
+        charSeq = tf.gather(encodedText, starts[:, None] + offsets)
+        target = tf.gather(encodedText, starts + sequenceLength)
+        batchLocation = tf.broadcast_to(location, tf.shape(charSeq))
+        return tf.stack([tf.cast(charSeq, tf.float32), batchLocation], axis=-1), target
+
+    #split into train and validation data
+    splitInd = int(numWindows * 0.8)
+
+    #the shuffle buffer holds every training index, so each epoch is a full reshuffle of the windows
+    trainDataset = (tf.data.Dataset.range(splitInd)
+        .shuffle(buffer_size=splitInd, reshuffle_each_iteration=True)
+        .batch(batchSize)
+        .map(gatherWindows, num_parallel_calls=tf.data.AUTOTUNE)
+        .prefetch(tf.data.AUTOTUNE))
+    validDataset = (tf.data.Dataset.range(splitInd, numWindows)
+        .batch(batchSize)
+        .map(gatherWindows, num_parallel_calls=tf.data.AUTOTUNE)
+        .prefetch(tf.data.AUTOTUNE))
+    return trainDataset, validDataset
+
+def buildModel(vocabSize):
     #multihead attension block, residual connection, and normalization
     inlayer = tf.keras.Input(shape = (sequenceLength,2))
     projection = tf.keras.layers.Dense(units = dimensionality)(inlayer)
@@ -120,8 +101,37 @@ def trainAndSaveModel():
     outlayer = tf.keras.layers.Dense(units = vocabSize, activation = tf.keras.activations.softmax)(flat)
 
     #model creation
-    model = tf.keras.Model(inputs = inlayer, outputs = outlayer)
+    return tf.keras.Model(inputs = inlayer, outputs = outlayer)
+
+#call this from an external callsite if necessary, to load the model, use model.load()
+def trainAndSaveModel():
+    text = loadCorpus()
+    vocabulary = buildVocabulary(text)
+    trainDataset, validDataset = buildDatasets(text, vocabulary)
+
+    model = buildModel(vocabulary.vocabSize)
     model.summary()
     model.compile(optimizer = tf.keras.optimizers.Adam(), loss = tf.keras.losses.SparseCategoricalCrossentropy(), metrics = ['accuracy'])
     model.fit(trainDataset, epochs = 20, validation_data = validDataset)
-    model.save('generator.keras')
\ No newline at end of file
+    model.save(modelPath)
+    vocabulary.save(defaultVocabPath)
+
+#post-training quantized variant of a trained model for CPU serving: int8 kernels with per-channel scales,
+#loaded by the numpy backend (COMPLETION_MODEL=generator.int8.npz); compare it with benchmark.py --mode quantized
+def saveQuantizedModel(kerasPath = modelPath, outputPath = quantizedModelPath):
+    import numpyModel
+    model = tf.keras.models.load_model(kerasPath)
+    numpyModel.saveWeights(numpyModel.quantizeWeights(numpyModel.extractWeights(model)), outputPath)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vocab-only", action="store_true", help="only write generator.vocab.json from the corpus")
+    parser.add_argument("--quantize", action="store_true", help="only write generator.int8.npz from the trained generator.keras")
+    args = parser.parse_args()
+
+    if args.quantize:
+        saveQuantizedModel()
+    elif args.vocab_only:
+        buildVocabulary(loadCorpus()).save(defaultVocabPath)
+    else:
+        trainAndSaveModel()
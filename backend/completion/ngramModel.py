@@ -0,0 +1,173 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from vocabulary import loadVocabulary
+
+#Character n-gram model of the training corpus, a cheap first opinion before the transformer.
+#   python ngramModel.py                   builds generator.ngram/ from trainingData/latinCorpusCleaned.txt
+#   python ngramModel.py --query 'Gallia est omnis diuis'
+#Every n-gram of 1..order characters is packed into one uint64 (8 bits per vocab id, first character in the
+#highest bits), so the table of each length is a sorted key array with its counts, searched with searchsorted.
+#The tables of the context lengths also keep how often each context is followed by anything and by how many
+#distinct characters. P(c | context) is Witten-Bell smoothed: from a uniform distribution up through each longer
+#context that was seen, P = (C(context c) + T(context) * P_shorter) / (C(context) + T(context)).
+#Like the other generator.* artifacts the tables are .npy files, memory-mapped read-only.
+
+#bump when the files or the key packing change
+ngramFormatVersion = 1
+here = os.path.dirname(os.path.abspath(__file__))
+defaultCorpusPath = os.path.join(here, "trainingData/latinCorpusCleaned.txt")
+defaultModelPath = os.path.join(here, "generator.ngram")
+#n-gram length: 5 characters of context and the predicted one
+defaultOrder = 6
+bitsPerChar = 8
+
+#(len(rows), k) ids -> packed uint64 keys, first column in the highest bits
+def packKeys(rows):
+    keys = np.zeros(len(rows), dtype = np.uint64)
+    for column in range(rows.shape[1]):
+        keys = (keys << np.uint64(bitsPerChar)) | rows[:, column].astype(np.uint64)
+    return keys
+
+def buildTables(ids, order = defaultOrder):
+    tables = {}
+    for k in range(1, order + 1):
+        windows = np.lib.stride_tricks.sliding_window_view(ids, k)
+        tables[f"keys{k}"], tables[f"counts{k}"] = np.unique(packKeys(windows), return_counts = True)
+        tables[f"counts{k}"] = tables[f"counts{k}"].astype(np.uint32)
+    #as a context, a (k-1)-gram was followed C times by T distinct characters: the k-grams with it as prefix
+    for k in range(1, order):
+        prefixes = tables[f"keys{k + 1}"] >> np.uint64(bitsPerChar)
+        contexts, first, types = np.unique(prefixes, return_index = True, return_counts = True)
+        totals = np.add.reduceat(tables[f"counts{k + 1}"].astype(np.int64), first)
+        #every context is a k-gram (only the corpus' last k characters are never followed by anything)
+        position = np.searchsorted(tables[f"keys{k}"], contexts)
+        tables[f"totals{k}"] = np.zeros(len(tables[f"keys{k}"]), dtype = np.uint32)
+        tables[f"types{k}"] = np.zeros(len(tables[f"keys{k}"]), dtype = np.uint32)
+        tables[f"totals{k}"][position] = totals
+        tables[f"types{k}"][position] = types
+    return tables
+
+def buildModel(corpusPath = defaultCorpusPath, modelPath = defaultModelPath, order = defaultOrder, vocabulary = None, text = None):
+    vocabulary = vocabulary or loadVocabulary()
+    if vocabulary.vocabSize >= 2 ** bitsPerChar:
+        raise ValueError(f"The n-gram model packs vocab ids into {bitsPerChar} bits, the vocabulary has too many characters.")
+    if order * bitsPerChar > 64:
+        raise ValueError(f"An order of {order} doesn't fit a uint64 key.")
+    if text is None:
+        with open(corpusPath, 'r', encoding = 'utf-8') as f:
+            text = f.read()
+    #the model sees text with the characters outside the vocab dropped, so does the n-gram model
+    ids = vocabulary.encode("".join(c for c in text if c in vocabulary.charToInt)).astype(np.uint8)
+    os.makedirs(modelPath, exist_ok = True)
+    arrays = buildTables(ids, order)
+    arrays["vocab"] = np.array(vocabulary.vocab)
+    arrays["formatVersion"] = np.int32(ngramFormatVersion)
+    for name, array in arrays.items():
+        np.save(os.path.join(modelPath, name + ".npy"), array)
+    return modelPath
+
+class NgramModel:
+    def __init__(self, modelPath = defaultModelPath, vocabulary = None):
+        self.vocabulary = vocabulary or loadVocabulary()
+        load = lambda name: np.load(os.path.join(modelPath, name + ".npy"), mmap_mode = "r")
+        if int(load("formatVersion")) != ngramFormatVersion:
+            raise ValueError(f"Error: {modelPath} has an old n-gram format. Rebuild it with ngramModel.py.")
+        if list(load("vocab")) != self.vocabulary.vocab:
+            raise ValueError(f"Error: {modelPath} was built with another vocabulary. Rebuild it with ngramModel.py.")
+        self.order = sum(1 for name in os.listdir(modelPath) if name.startswith("keys"))
+        self.keys = [None] + [load(f"keys{k}") for k in range(1, self.order + 1)]
+        self.counts = [None] + [load(f"counts{k}") for k in range(1, self.order + 1)]
+        self.totals = [None] + [load(f"totals{k}") for k in range(1, self.order)]
+        self.types = [None] + [load(f"types{k}") for k in range(1, self.order)]
+        #the empty context: every unigram, and how many distinct ones
+        self.unigramTotal = int(np.asarray(self.counts[1], dtype = np.int64).sum())
+        self.unigramTypes = len(self.keys[1])
+
+    #(len(texts), order - 1) vocab ids of the last order - 1 known characters of each text, -1 where it is shorter
+    def encodeContexts(self, texts):
+        width = self.order - 1
+        charToInt = self.vocabulary.charToInt
+        contexts = np.full((len(texts), width), -1, dtype = np.int64)
+        for row, text in enumerate(texts):
+            ids = [charToInt[c] for c in text[-2 * width:] if c in charToInt][-width:]
+            if ids:
+                contexts[row, width - len(ids):] = ids
+        return contexts
+
+    @staticmethod
+    def find(keys, values):
+        position = np.minimum(np.searchsorted(keys, values), len(keys) - 1)
+        return position, np.asarray(keys[position]) == values
+
+    #P(chars[k] | contexts[k]) for encoded contexts and char ids
+    def probabilitiesOfIds(self, contexts, chars):
+        width = self.order - 1
+        chars = chars.astype(np.uint64)
+        p = np.full(len(chars), 1 / self.vocabulary.vocabSize)
+        position, seen = self.find(self.keys[1], chars)
+        count = np.where(seen, np.asarray(self.counts[1])[position], 0)
+        p = (count + self.unigramTypes * p) / (self.unigramTotal + self.unigramTypes)
+        for k in range(1, width + 1):
+            #a context known to this length, and seen in the corpus; otherwise the shorter estimate stays
+            known = (contexts[:, width - k:] >= 0).all(axis = 1)
+            if not known.any():
+                break
+            contextKeys = packKeys(np.where(contexts[:, width - k:] >= 0, contexts[:, width - k:], 0))
+            position, seen = self.find(self.keys[k], contextKeys)
+            total = np.where(seen & known, np.asarray(self.totals[k])[position], 0).astype(np.float64)
+            types = np.where(seen & known, np.asarray(self.types[k])[position], 0).astype(np.float64)
+            ngramPosition, ngramSeen = self.find(self.keys[k + 1], (contextKeys << np.uint64(bitsPerChar)) | chars)
+            count = np.where(ngramSeen & seen & known, np.asarray(self.counts[k + 1])[ngramPosition], 0)
+            p = np.where(total > 0, (count + types * p) / np.maximum(total + types, 1), p)
+        return p
+
+    #P(chars[k] | texts[k]); 0 for characters outside the vocab
+    def probabilities(self, texts, chars):
+        charToInt = self.vocabulary.charToInt
+        ids = np.array([charToInt.get(c, -1) for c in chars], dtype = np.int64)
+        p = self.probabilitiesOfIds(self.encodeContexts(texts), np.maximum(ids, 0))
+        return np.where(ids >= 0, p, 0.0)
+
+    #(len(texts), vocabSize) next-char distributions, like the transformer's
+    def distributions(self, texts):
+        vocabSize = self.vocabulary.vocabSize
+        contexts = np.repeat(self.encodeContexts(texts), vocabSize, axis = 0)
+        chars = np.tile(np.arange(vocabSize), len(texts))
+        return self.probabilitiesOfIds(contexts, chars).reshape(len(texts), vocabSize)
+
+_defaultModel = None
+
+#the model in generator.ngram, loaded once; None when it hasn't been built
+def loadDefaultModel(modelPath = None):
+    global _defaultModel
+    if _defaultModel is None:
+        modelPath = modelPath or os.getenv('COMPLETION_NGRAM', defaultModelPath)
+        if not os.path.exists(os.path.join(modelPath, "keys1.npy")):
+            return None
+        _defaultModel = NgramModel(modelPath)
+    return _defaultModel
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=defaultCorpusPath)
+    parser.add_argument("--model", default=defaultModelPath)
+    parser.add_argument("--order", type=int, default=defaultOrder)
+    parser.add_argument("--query", nargs="*", help="print the most probable next characters after each text instead of building")
+    args = parser.parse_args()
+
+    if args.query is None:
+        start = time.perf_counter()
+        buildModel(args.corpus, args.model, args.order)
+        print(f"wrote {args.model} in {time.perf_counter() - start:.1f} s")
+        raise SystemExit(0)
+    ngrams = NgramModel(args.model)
+    for text in args.query:
+        start = time.perf_counter()
+        probDist = ngrams.distributions([text])[0]
+        elapsed = (time.perf_counter() - start) * 1e6
+        top = np.argsort(-probDist)[:5]
+        print(f"{text!r}: " + ", ".join(f"{ngrams.vocabulary.vocab[j]!r} {probDist[j]:.3f}" for j in top) + f" ({elapsed:.0f} us)")
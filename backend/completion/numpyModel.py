@@ -0,0 +1,206 @@
+import argparse
+import os
+
+import numpy as np
+
+#NumPy-only inference for the generator model built by modelCreation.buildModel. exportWeights dumps the
+#weights of generator.keras (needs TensorFlow) into generator.npz; NumpyModel runs the same forward pass
+#on batches of windows without TensorFlow, so completion can be served in-process by the OCR service.
+#   python numpyModel.py generator.keras generator.npz --check
+#The weights can also be saved as a directory with one uncompressed .npy per tensor (generator.weights).
+#Those are memory-mapped read-only, so every worker process on the machine shares one copy in the page cache.
+#   python numpyModel.py generator.npz generator.weights
+#--int8 saves a post-training quantized variant instead: every kernel as int8 with one float32 scale per output
+#channel (name + "Scale"). The kernels stay int8 when loaded (and memory-mapped from a directory); each matmul
+#widens its kernel for the product and scales the output columns.
+#   python numpyModel.py generator.keras generator.int8.npz --int8
+
+#bump when the weight names or the layer layout change
+weightsFormatVersion = 1
+here = os.path.dirname(os.path.abspath(__file__))
+defaultWeightsPath = os.path.join(here, "generator.npz")
+defaultWeightsDir = os.path.join(here, "generator.weights")
+
+#layers of buildModel in the order they appear in model.layers, and the names their weights are saved under
+denseNames = ["projection", "feedForwardA", "feedForwardB", "output"]
+normNames = ["norm1", "norm2"]
+attentionParts = ["query", "key", "value", "attentionOutput"]
+
+#generator.keras -> {name: float32 array}
+def extractWeights(model):
+    import tensorflow as tf
+    dense = [l for l in model.layers if isinstance(l, tf.keras.layers.Dense)]
+    norms = [l for l in model.layers if isinstance(l, tf.keras.layers.LayerNormalization)]
+    attention = [l for l in model.layers if isinstance(l, tf.keras.layers.MultiHeadAttention)]
+    if len(dense) != len(denseNames) or len(norms) != len(normNames) or len(attention) != 1:
+        raise ValueError("The model does not have the layer layout of modelCreation.buildModel, it can't be exported.")
+
+    weights = {}
+    for name, layer in zip(denseNames, dense):
+        kernel, bias = layer.get_weights()
+        weights[name + "Kernel"], weights[name + "Bias"] = kernel, bias
+    for name, layer in zip(normNames, norms):
+        gamma, beta = layer.get_weights()
+        weights[name + "Gamma"], weights[name + "Beta"] = gamma, beta
+    #query, key, value and output projections, each a kernel and a bias
+    attentionWeights = attention[0].get_weights()
+    for k, part in enumerate(attentionParts):
+        weights[part + "Kernel"], weights[part + "Bias"] = attentionWeights[2 * k], attentionWeights[2 * k + 1]
+
+    weights = {name: np.asarray(w, dtype=np.float32) for name, w in weights.items()}
+    weights["layerNormEpsilon"] = np.float32(norms[0].epsilon)
+    weights["formatVersion"] = np.int32(weightsFormatVersion)
+    return weights
+
+#kernel -> how many of its leading axes are inputs; the rest index the output channels
+def inputAxes(name):
+    #attentionOutput maps (heads, keyDim) to dim, query/key/value map dim to (heads, keyDim)
+    return 2 if name == "attentionOutputKernel" else 1
+
+#symmetric per-output-channel int8: scale = max |w| / 127 over the input axes, so query/key/value have one
+#scale per (head, keyDim) unit
+def quantizeWeights(weights):
+    quantized = {}
+    for name, array in weights.items():
+        if not name.endswith("Kernel"):
+            quantized[name] = array
+            continue
+        reduceAxes = tuple(range(inputAxes(name)))
+        scale = np.abs(array).max(axis=reduceAxes) / 127
+        scale[scale == 0] = 1
+        quantized[name] = np.clip(np.round(array / scale), -127, 127).astype(np.int8)
+        quantized[name + "Scale"] = scale.astype(np.float32)
+    return quantized
+
+#writes generator.npz, or a directory of per-tensor .npy files when path does not end in .npz
+def saveWeights(weights, path):
+    if path.endswith(".npz"):
+        np.savez(path, **weights)
+        return
+    os.makedirs(path, exist_ok=True)
+    for name, array in weights.items():
+        np.save(os.path.join(path, name + ".npy"), array)
+
+def exportWeights(model, path = defaultWeightsPath):
+    saveWeights(extractWeights(model), path)
+
+#the .npy directory if there is one (it can be shared between processes), otherwise generator.npz
+def findWeights():
+    if os.path.isdir(defaultWeightsDir):
+        return defaultWeightsDir
+    if os.path.exists(defaultWeightsPath):
+        return defaultWeightsPath
+    return None
+
+def loadWeights(path = None):
+    path = path or findWeights() or defaultWeightsPath
+    if os.path.isdir(path):
+        #read-only maps: the arrays are paged in on first use and shared with every other process mapping them
+        weights = {
+            name[:-len(".npy")]: np.load(os.path.join(path, name), mmap_mode="r")
+            for name in os.listdir(path) if name.endswith(".npy")
+        }
+    else:
+        with np.load(path) as data:
+            weights = {name: data[name] for name in data.files}
+    if int(weights.get("formatVersion", -1)) != weightsFormatVersion:
+        raise ValueError(f"Error: {path} has weights format version {weights.get('formatVersion')}, expected {weightsFormatVersion}. Export it again with numpyModel.py.")
+    return weights
+
+def layerNorm(x, gamma, beta, epsilon):
+    mean = x.mean(axis=-1, keepdims=True)
+    variance = x.var(axis=-1, keepdims=True)
+    return (x - mean) / np.sqrt(variance + epsilon) * gamma + beta
+
+def softmax(x, axis=-1):
+    x = x - x.max(axis=axis, keepdims=True)
+    np.exp(x, out=x)
+    x /= x.sum(axis=axis, keepdims=True)
+    return x
+
+class NumpyModel:
+    #called like the keras model: model(batch) with batch (B, sequenceLength, 2) -> (B, vocabSize) probabilities
+    def __init__(self, weights):
+        self.w = weights
+        self.epsilon = float(weights["layerNormEpsilon"])
+        dim, self.numHeads, self.keyDim = weights["queryKernel"].shape
+        self.output_shape = (None, weights["outputKernel"].shape[-1])
+        #every kernel as a 2-D view so plain matmuls (BLAS) do the work, and the scale of its output columns
+        #(None for float weights); views, not copies, so memory-mapped weights stay shared
+        self.kernels = {}
+        for name in [n for n in weights if n.endswith("Kernel")]:
+            kernel = weights[name]
+            rows = int(np.prod(kernel.shape[:inputAxes(name)]))
+            scale = weights.get(name + "Scale")
+            if scale is not None:
+                scale = np.broadcast_to(scale, kernel.shape[inputAxes(name):]).reshape(-1)
+            self.kernels[name] = (kernel.reshape(rows, -1), scale)
+        self.projectionBiases = [weights[p + "Bias"].reshape(-1) for p in attentionParts[:3]]
+
+    #x @ kernel; an int8 kernel is widened for this product only, x @ (q * s) == (x @ q) * s per output column
+    def matmul(self, x, name):
+        kernel, scale = self.kernels[name]
+        if scale is None:
+            return x @ kernel
+        return (x @ kernel.astype(np.float32)) * scale
+
+    def __call__(self, x):
+        w = self.w
+        x = np.asarray(x, dtype=np.float32)
+        batch, length = x.shape[0], x.shape[1]
+
+        #projection and multihead self attention, residual connection, and normalization
+        projection = self.matmul(x, "projectionKernel") + w["projectionBias"]
+        #(batch, length, heads * keyDim) -> (batch, heads, length, keyDim)
+        query, key, value = [
+            (self.matmul(projection, part + "Kernel") + bias).reshape(batch, length, self.numHeads, self.keyDim).transpose(0, 2, 1, 3)
+            for part, bias in zip(attentionParts, self.projectionBiases)
+        ]
+        scores = softmax(query @ key.transpose(0, 1, 3, 2) / np.float32(np.sqrt(self.keyDim)))
+        heads = (scores @ value).transpose(0, 2, 1, 3).reshape(batch, length, -1)
+        attention = self.matmul(heads, "attentionOutputKernel") + w["attentionOutputBias"]
+        normalized = layerNorm(projection + attention, w["norm1Gamma"], w["norm1Beta"], self.epsilon)
+
+        #feed forward block, residual connection, and normalization
+        feedForwardA = np.maximum(self.matmul(normalized, "feedForwardAKernel") + w["feedForwardABias"], 0)
+        feedForwardB = self.matmul(feedForwardA, "feedForwardBKernel") + w["feedForwardBBias"]
+        normalizedB = layerNorm(normalized + feedForwardB, w["norm2Gamma"], w["norm2Beta"], self.epsilon)
+
+        #output layer
+        logits = self.matmul(normalizedB.reshape(batch, -1), "outputKernel") + w["outputBias"]
+        return softmax(logits)
+
+def loadNumpyModel(path = None):
+    return NumpyModel(loadWeights(path))
+
+#largest absolute difference between the keras model and NumpyModel on random windows
+def compareWithKeras(kerasModel, numpyModel, vocabSize, batch = 64, seed = 0):
+    rng = np.random.default_rng(seed)
+    sequenceLength = kerasModel.input_shape[1]
+    chars = rng.integers(0, vocabSize, size=(batch, sequenceLength))
+    location = np.broadcast_to(np.linspace(-1.0, 1.0, sequenceLength), chars.shape)
+    x = np.stack([chars, location], axis=-1).astype(np.float32)
+    return float(np.abs(np.asarray(kerasModel(x)) - numpyModel(x)).max())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model", nargs="?", default=os.path.join(here, "generator.keras"), help="generator.keras, or a .npz to convert")
+    parser.add_argument("output", nargs="?", default=defaultWeightsPath, help="a .npz file, or a directory for per-tensor .npy files")
+    parser.add_argument("--check", action="store_true", help="compare the exported weights with the keras model")
+    parser.add_argument("--int8", action="store_true", help="save int8 kernels with per-channel scales")
+    args = parser.parse_args()
+
+    if args.model.endswith(".npz"):
+        weights = loadWeights(args.model)
+        saveWeights(quantizeWeights(weights) if args.int8 and "outputKernelScale" not in weights else weights, args.output)
+        print(f"wrote {args.output}")
+        raise SystemExit(0)
+
+    import tensorflow as tf
+    kerasModel = tf.keras.models.load_model(args.model)
+    weights = extractWeights(kerasModel)
+    saveWeights(quantizeWeights(weights) if args.int8 else weights, args.output)
+    print(f"wrote {args.output}")
+    if args.check:
+        vocabSize = kerasModel.output_shape[-1]
+        print(f"max abs difference to keras: {compareWithKeras(kerasModel, loadNumpyModel(args.output), vocabSize):.2e}")
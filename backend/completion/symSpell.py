@@ -0,0 +1,210 @@
+import argparse
+import hashlib
+import os
+import re
+import time
+from collections import Counter
+
+import numpy as np
+
+#SymSpell-style lexicon of the training corpus words, for correcting OCR tokens without the model.
+#   python symSpell.py                      builds generator.lexicon/ from trainingData/latinCorpusCleaned.txt
+#   python symSpell.py --lookup maxKme AthKnae
+#Every word's first prefixLength characters, and every string made by deleting up to maxDistance characters
+#from them, are hashed to 64 bits (blake2b). The index is the sorted array of those hashes with the word each
+#one came from, so a lookup generates the deletes of the token, finds them with searchsorted and verifies the
+#few candidate words with a real edit distance. Hashes of the whole words are kept in a second sorted array
+#for the exact-match check that most tokens stop at. Everything is saved as .npy files and memory-mapped.
+
+#bump when the files or the hashing change
+lexiconFormatVersion = 1
+here = os.path.dirname(os.path.abspath(__file__))
+defaultCorpusPath = os.path.join(here, "trainingData/latinCorpusCleaned.txt")
+defaultLexiconPath = os.path.join(here, "generator.lexicon")
+maxDistance = 2
+#only this many leading characters are indexed (compact SymSpell); the rest is checked when verifying
+prefixLength = 7
+wordPattern = re.compile(r"[^\W\d_]+")
+
+def hashString(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size = 8).digest(), 'little')
+
+def hashStrings(texts):
+    return np.fromiter((hashString(t) for t in texts), dtype = np.uint64, count = len(texts))
+
+#text and every string made by deleting 1..distance characters from it
+def deletes(text, distance = maxDistance):
+    found = {text}
+    frontier = {text}
+    for _ in range(distance):
+        frontier = {s[:i] + s[i + 1:] for s in frontier for i in range(len(s))} - found
+        found |= frontier
+    return found
+
+#optimal string alignment distance (Damerau-Levenshtein without repeated edits of a substring),
+#or limit + 1 as soon as it is certain to exceed limit
+def editDistance(a, b, limit = maxDistance):
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    #candidates share most of their characters with the token, only the part between a common prefix and
+    #suffix needs the table
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if not a or not b:
+        return min(len(a) + len(b), limit + 1)
+    #only cells within limit of the diagonal can stay within limit, the others are capped at limit + 1
+    outside = limit + 1
+    previous2 = None
+    previous = [min(j, outside) for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [outside] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        ai = a[i - 1]
+        rowMin = current[0]
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            value = previous[j - 1] if ai == b[j - 1] else previous[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if i > 1 and j > 1 and ai == b[j - 2] and a[i - 2] == b[j - 1] and previous2[j - 2] + 1 < value:
+                value = previous2[j - 2] + 1
+            if value < outside:
+                current[j] = value
+                if value < rowMin:
+                    rowMin = value
+        if rowMin > limit:
+            return outside
+        previous2, previous = previous, current
+    return previous[-1]
+
+def buildLexicon(corpusPath = defaultCorpusPath, lexiconPath = defaultLexiconPath):
+    with open(corpusPath, 'r', encoding = 'utf-8') as f:
+        counts = Counter(wordPattern.findall(f.read()))
+    words = sorted(counts, key = lambda w: (-counts[w], w))
+
+    #the same prefix and its deletes come from many words, each is hashed once
+    prefixWords = {}
+    for k, word in enumerate(words):
+        prefixWords.setdefault(word[:prefixLength], []).append(k)
+    keys, wordIds = [], []
+    for prefix, ids in prefixWords.items():
+        for delete in deletes(prefix):
+            keys.append(hashString(delete))
+            wordIds.append(ids)
+    lengths = np.fromiter(map(len, wordIds), dtype = np.int64, count = len(wordIds))
+    keys = np.repeat(np.array(keys, dtype = np.uint64), lengths)
+    wordIds = np.concatenate([np.array(ids, dtype = np.int32) for ids in wordIds])
+    order = np.argsort(keys, kind = 'stable')
+
+    exactKeys = hashStrings(words)
+    exactOrder = np.argsort(exactKeys, kind = 'stable')
+    encoded = [w.encode('utf-8') for w in words]
+    os.makedirs(lexiconPath, exist_ok = True)
+    arrays = {
+        "deleteKeys": keys[order],
+        "deleteWords": wordIds[order],
+        "exactKeys": exactKeys[exactOrder],
+        "exactWords": exactOrder.astype(np.int32),
+        "counts": np.array([counts[w] for w in words], dtype = np.int32),
+        "wordBytes": np.frombuffer(b"".join(encoded), dtype = np.uint8),
+        "wordOffsets": np.concatenate([[0], np.cumsum([len(e) for e in encoded])]).astype(np.int64),
+        "wordLengths": np.array([len(w) for w in words], dtype = np.int32),
+        "formatVersion": np.int32(lexiconFormatVersion),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(lexiconPath, name + ".npy"), array)
+    return lexiconPath
+
+class Lexicon:
+    def __init__(self, lexiconPath = defaultLexiconPath):
+        load = lambda name: np.load(os.path.join(lexiconPath, name + ".npy"), mmap_mode = "r")
+        if int(load("formatVersion")) != lexiconFormatVersion:
+            raise ValueError(f"Error: {lexiconPath} has an old lexicon format. Rebuild it with symSpell.py.")
+        self.deleteKeys, self.deleteWords = load("deleteKeys"), load("deleteWords")
+        self.exactKeys, self.exactWords = load("exactKeys"), load("exactWords")
+        self.counts, self.wordOffsets, self.wordLengths = load("counts"), load("wordOffsets"), load("wordLengths")
+        self.wordBytes = load("wordBytes")
+
+    def word(self, k):
+        return bytes(self.wordBytes[self.wordOffsets[k]:self.wordOffsets[k + 1]]).decode('utf-8')
+
+    #corpus count of token, 0 when it is not a corpus word
+    def count(self, token):
+        key = np.uint64(hashString(token))
+        lo = int(np.searchsorted(self.exactKeys, key, side = 'left'))
+        hi = int(np.searchsorted(self.exactKeys, key, side = 'right'))
+        for k in self.exactWords[lo:hi]:
+            if self.word(k) == token:
+                return int(self.counts[k])
+        return 0
+
+    #[(word, distance, count)] of the corpus words within distance of token, closest and most frequent first
+    def lookup(self, token, distance = maxDistance, limit = 10):
+        count = self.count(token)
+        if count and distance == 0:
+            return [(token, 0, count)]
+        keys = hashStrings(list(deletes(token[:prefixLength], distance)))
+        lo = np.searchsorted(self.deleteKeys, keys, side = 'left')
+        hi = np.searchsorted(self.deleteKeys, keys, side = 'right')
+        candidates = np.unique(np.concatenate([self.deleteWords[a:b] for a, b in zip(lo, hi)] or [np.zeros(0, dtype = np.int32)]))
+        #words whose length alone puts them out of reach aren't verified
+        candidates = candidates[np.abs(self.wordLengths[candidates] - len(token)) <= distance]
+        found = []
+        for k in candidates:
+            word = self.word(k)
+            d = editDistance(token, word, distance)
+            if d <= distance:
+                found.append((word, d, int(self.counts[k])))
+        found.sort(key = lambda entry: (entry[1], -entry[2]))
+        return found[:limit]
+
+    #(word, its share) for the corpus word one substituted character away from token, if there is one
+    #plausible such word: token is not a corpus word, it has at least minLength letters, and the most
+    #frequent of the words one substitution away has at least share of their counts. None otherwise.
+    def fixSubstitution(self, token, share = 0.8, minLength = 4):
+        if len(token) < minLength or self.count(token):
+            return None
+        found = [(word, n) for word, d, n in self.lookup(token, 1, limit = None) if d == 1 and len(word) == len(token)]
+        #a swap of two letters is also distance 1, only single substitutions are taken
+        found = [(word, n) for word, n in found if sum(a != b for a, b in zip(word, token)) == 1]
+        total = sum(n for _, n in found)
+        if not found or found[0][1] < share * total:
+            return None
+        return found[0][0], found[0][1] / total
+
+_defaultLexicon = None
+
+#the lexicon in generator.lexicon, loaded once; None when it hasn't been built
+def loadDefaultLexicon(lexiconPath = None):
+    global _defaultLexicon
+    if _defaultLexicon is None:
+        lexiconPath = lexiconPath or os.getenv('COMPLETION_LEXICON', defaultLexiconPath)
+        if not os.path.exists(os.path.join(lexiconPath, "deleteKeys.npy")):
+            return None
+        _defaultLexicon = Lexicon(lexiconPath)
+    return _defaultLexicon
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=defaultCorpusPath)
+    parser.add_argument("--lexicon", default=defaultLexiconPath)
+    parser.add_argument("--lookup", nargs="*", help="look tokens up instead of building")
+    args = parser.parse_args()
+
+    if args.lookup is None:
+        start = time.perf_counter()
+        buildLexicon(args.corpus, args.lexicon)
+        print(f"wrote {args.lexicon} in {time.perf_counter() - start:.1f} s")
+        raise SystemExit(0)
+    lexicon = Lexicon(args.lexicon)
+    for token in args.lookup:
+        start = time.perf_counter()
+        found = lexicon.lookup(token)
+        print(f"{token}: {found} ({(time.perf_counter() - start) * 1e6:.0f} us)")
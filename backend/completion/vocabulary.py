@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+#The encoding layer shared by training (modelCreation.py) and inference (completion.py).
+#Inference only needs the character vocabulary and the sequence length, so they are saved as a small
+#versioned artifact next to the model instead of being rebuilt from the corpus on every import.
+
+#bump when the artifact layout or the encoding (padding, location channel) changes
+vocabFormatVersion = 1
+defaultVocabPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generator.vocab.json")
+
+class Vocabulary:
+    def __init__(self, vocab, sequenceLength):
+        self.vocab = list(vocab)
+        self.vocabSize = len(self.vocab)
+        self.sequenceLength = sequenceLength
+        self.charToInt = {ch: i for i, ch in enumerate(self.vocab)}
+        self.intToChar = {i: ch for i, ch in enumerate(self.vocab)}
+        #the location channel is the same for every input, so it is built once
+        self.location = np.linspace(start = -1.0, stop = 1.0, num = sequenceLength)
+        #codepoint -> vocab index, -1 for characters outside the vocab. Codepoints past the table are clipped
+        #onto its last slot, which is always -1
+        self.codepointTable = np.full(max(map(ord, self.vocab), default = 0) + 2, -1, dtype = np.int32)
+        self.codepointTable[[ord(c) for c in self.vocab]] = np.arange(self.vocabSize)
+        #encodeBatch output buffers, one per thread (completionServer serves requests on many threads)
+        self._buffers = threading.local()
+
+    @classmethod
+    def fromText(cls, text, sequenceLength):
+        return cls(sorted(set(text)), sequenceLength)
+
+    def decode(self, encodedChar):
+        return self.intToChar[encodedChar]
+
+    def encode(self, text):
+        return np.array([self.charToInt[c] for c in text])
+
+    #the text the model actually sees for a window: unknown chars dropped, left-padded with spaces to sequenceLength.
+    #Two windows with the same key get the same model input (used as the key of completion's distribution cache)
+    def windowKey(self, text):
+        text = "".join(c for c in text if c in self.charToInt)
+        if(len(text) > self.sequenceLength):
+            raise ValueError(f"The method 'sequenceToInputFormat' expects an input equal to or smaller than the sequnce length: {self.sequenceLength}\n Handle splitting larger text bodies into sequences at the callsite.")
+        return ' ' * (self.sequenceLength - len(text)) + text
+
+    #pads out to sequenceLength chars, encodes string text, adds location info, and a batch dimension to match the model input
+    def sequenceToInputFormat(self, text):
+        text = self.windowKey(text)
+        encodedText = np.stack([self.encode(text), self.location], axis=-1)
+        return np.expand_dims(encodedText, axis=0)
+
+    #sequenceToInputFormat for many windows at once: (len(texts), sequenceLength, 2) float32, row k equal to
+    #sequenceToInputFormat(texts[k])[0]. Characters are looked up in codepointTable for the whole batch in one
+    #go. The result is a view of a per-thread buffer that is reused (the location channel is only written
+    #when it grows), so it is only valid until the next call on the same thread; pass out to keep it.
+    def encodeBatch(self, texts, out = None):
+        count = len(texts)
+        lengths = np.fromiter(map(len, texts), dtype = np.int64, count = count)
+        codepoints = np.frombuffer("".join(texts).encode("utf-32-le"), dtype = np.uint32)
+        ids = self.codepointTable[np.minimum(codepoints, len(self.codepointTable) - 1)]
+        known = ids >= 0
+        rows = np.repeat(np.arange(count), lengths)[known]
+        ids = ids[known]
+        kept = np.bincount(rows, minlength = count)
+        if count and kept.max() > self.sequenceLength:
+            raise ValueError(f"The method 'encodeBatch' expects inputs equal to or smaller than the sequnce length: {self.sequenceLength}\n Handle splitting larger text bodies into sequences at the callsite.")
+
+        if out is None:
+            out = self._buffer(count)
+        else:
+            out[:, :, 1] = self.location
+        #left padding: every row starts as spaces, the kept characters fill its last kept[row] columns
+        out[:, :, 0] = self.charToInt[' ']
+        firstKept = np.cumsum(kept) - kept
+        columns = self.sequenceLength - kept[rows] + np.arange(len(ids)) - firstKept[rows]
+        out[rows, columns, 0] = ids
+        return out
+
+    def _buffer(self, count):
+        buffer = getattr(self._buffers, "array", None)
+        if buffer is None or len(buffer) < count:
+            buffer = np.empty((max(count, 2 * len(buffer) if buffer is not None else 1), self.sequenceLength, 2), dtype = np.float32)
+            buffer[:, :, 1] = self.location
+            self._buffers.array = buffer
+        return buffer[:count]
+
+    def save(self, path = defaultVocabPath):
+        artifact = {"version": vocabFormatVersion, "sequenceLength": self.sequenceLength, "vocab": self.vocab}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(artifact, f, ensure_ascii=False)
+
+def loadVocabulary(path = defaultVocabPath):
+    if not os.path.exists(path):
+        raise ValueError(f"Error: Could not find the vocabulary artifact at {path}. Run 'python modelCreation.py --vocab-only' to create it.")
+    with open(path, 'r', encoding='utf-8') as f:
+        artifact = json.load(f)
+    if artifact.get("version") != vocabFormatVersion:
+        raise ValueError(f"Error: {path} has vocabulary format version {artifact.get('version')}, expected {vocabFormatVersion}. Re-create it with modelCreation.py.")
+    return Vocabulary(artifact["vocab"], artifact["sequenceLength"])
@@ -1,23 +1,34 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from PIL import Image, ImageOps, ImageFilter
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_bytes, convert_from_path, pdfinfo_from_bytes, pdfinfo_from_path
 import pytesseract
-from pytesseract import Output
 
 import io
 import os
+import re
+import json
+import asyncio
 import sys
 import time
 import subprocess
 import tempfile
 import statistics
+from html.parser import HTMLParser
+import threading
+import urllib.request
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
 
 # Add backend to path for imports
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from translation.groqTranslation import webTranslation
+from ocr_service.jobs import JobStore
+from ocr_service.ocr_cache import OcrCache, doc_key, page_key
+from ocr_service import tess_capi
 
 # ------------------------- FastAPI -------------------------
 app = FastAPI()
@@ -34,60 +45,300 @@ app.add_middleware(
 PAGE_SEP = "\n\n--- page break ---\n\n"
 ALLOWED_EXTS = {".png", ".jpg", ".jpeg", ".pdf"}
 
+# ------------------------- Settings -------------------------
+# Multi-page PDFs are OCRed on a shared page pool. OCR_WORKERS=1 restores the
+# old one-page-at-a-time loop. "thread" is enough for pytesseract (the work
+# happens in the tesseract subprocess); "process" also parallelises the PIL
+# preprocessing.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_POOL = os.getenv("OCR_POOL", "thread").lower()          # "thread" | "process"
+# OpenMP threads per tesseract run; keep at 1 when several pages run at once,
+# otherwise every page fights for every core. The in-process backend only reads
+# it when libtesseract is loaded, so it is set for it here, before that.
+OCR_TESS_THREADS = os.getenv("OCR_TESS_THREADS", "1")
+tess_capi.set_thread_limit(OCR_TESS_THREADS)
+# PDFs are rasterized a few pages at a time instead of all up front:
+# PDF_RASTER_BATCH pages per pdftoppm call, and at most PDF_LOOKAHEAD rendered
+# pages waiting for a free OCR worker. Peak memory no longer grows with page count.
+PDF_DPI = 300
+# Resolution: images are resized so their text lines come out about
+# OCR_TARGET_LINE_PX tall (clamped to OCR_MIN_SCALE..OCR_MAX_SCALE; the old
+# fixed 2x when nothing can be measured). With PDF_ADAPTIVE_DPI, PDFs are
+# probed at low DPI and rendered straight at the DPI that hits the target,
+# instead of 300 DPI followed by a 2x resample.
+OCR_TARGET_LINE_PX = float(os.getenv("OCR_TARGET_LINE_PX", "56"))
+OCR_MIN_SCALE = float(os.getenv("OCR_MIN_SCALE", "0.4"))
+OCR_MAX_SCALE = float(os.getenv("OCR_MAX_SCALE", "3.0"))
+OCR_DEFAULT_SCALE = 2.0
+PDF_ADAPTIVE_DPI = os.getenv("PDF_ADAPTIVE_DPI", "1") == "1"
+PDF_PROBE_DPI = 72
+PDF_MIN_DPI = int(os.getenv("PDF_MIN_DPI", "150"))
+PDF_MAX_DPI = int(os.getenv("PDF_MAX_DPI", "600"))
+PDF_RASTER_BATCH = int(os.getenv("PDF_RASTER_BATCH", "2"))
+PDF_LOOKAHEAD = int(os.getenv("PDF_LOOKAHEAD", "2"))
+# The async routes never run blocking work on the event loop. Rasterization/OCR
+# of whole uploads and the network-bound translation calls get their own pools
+# so a slow translation API cannot starve OCR (and neither can stall /ping).
+OCR_REQUEST_THREADS = int(os.getenv("OCR_REQUEST_THREADS", "4"))
+TRANSLATION_THREADS = int(os.getenv("TRANSLATION_THREADS", "8"))
+# Background jobs (/jobs): worker count, how long finished results are kept,
+# and how many jobs (queued + running + finished) may be held at once.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_TTL_S = float(os.getenv("JOB_TTL_S", "3600"))
+JOB_MAX_JOBS = int(os.getenv("JOB_MAX_JOBS", "1000"))
+# Tesseract backend: "capi" keeps initialized libtesseract handles in-process
+# (see tess_capi.py), "pytesseract" runs the CLI per call, "auto" prefers capi
+# when libtesseract can be loaded.
+OCR_TESS_BACKEND = os.getenv("OCR_TESS_BACKEND", "auto").lower()
+# A page whose words are well segmented only gets the char-box comparison when
+# it looks misread: mean word confidence under OCR_CONF_GATE, or more than
+# OCR_LOW_CONF_SHARE of its words under OCR_LOW_CONF.
+OCR_CONF_GATE = float(os.getenv("OCR_CONF_GATE", "70"))
+OCR_LOW_CONF = float(os.getenv("OCR_LOW_CONF", "50"))
+OCR_LOW_CONF_SHARE = float(os.getenv("OCR_LOW_CONF_SHARE", "0.25"))
+# Result cache: OCR_CACHE_ENTRIES documents/pages in memory (0 disables), plus
+# an on-disk tier under OCR_CACHE_DIR trimmed to OCR_CACHE_MAX_MB ("" disables).
+OCR_CACHE_ENTRIES = int(os.getenv("OCR_CACHE_ENTRIES", "256"))
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "codex-continuum-ocr-cache"))
+OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", "512"))
+# Optional completion stage: the long-lived completion server
+# (backend/completion/completionServer.py) at COMPLETION_URL fills in damaged
+# characters before translation when a request sets complete=true.
+COMPLETION_URL = os.getenv("COMPLETION_URL", "").rstrip("/")
+# COMPLETION_INPROCESS=1 runs textCorrection inside this process instead
+# (with COMPLETION_BACKEND=numpy and an exported generator.npz, no TensorFlow
+# is needed); the model is loaded on first use.
+COMPLETION_INPROCESS = os.getenv("COMPLETION_INPROCESS", "0") == "1"
+# COMPLETION_PRELOAD=1 loads it at import instead, so a preforking server
+# (gunicorn --preload) shares the vocabulary and memory-mapped weights with
+# every worker it forks.
+COMPLETION_PRELOAD = os.getenv("COMPLETION_PRELOAD", "0") == "1"
+COMPLETION_THRESHOLD = os.getenv("COMPLETION_THRESHOLD", "1/32")
+# "greedy" (textCorrection) or "beam" (beam search that also fills lacunae
+# marked "?" or "[...]" and reports every edit with its probability)
+COMPLETION_MODE = os.getenv("COMPLETION_MODE", "greedy")
+# In greedy mode only the words under OCR_LOW_CONF (and the pages without
+# word confidences) are rescored; COMPLETION_SUSPECT_ONLY=0 rescores every page in full.
+COMPLETION_SUSPECT_ONLY = os.getenv("COMPLETION_SUSPECT_ONLY", "1") == "1"
+COMPLETION_TIMEOUT_S = float(os.getenv("COMPLETION_TIMEOUT_S", "120"))
+COMPLETION_THREADS = int(os.getenv("COMPLETION_THREADS", "4"))
+
 def infer_ext(filename: str) -> str:
     return (os.path.splitext(filename or "")[1] or "").lower()
 
-def preprocess(img: Image.Image) -> Image.Image:
+def _otsu_threshold(histogram: list) -> int:
+    total = sum(histogram)
+    sum_all = sum(i * n for i, n in enumerate(histogram))
+    sum_bg = weight_bg = 0
+    best_t, best_var = 0, -1.0
+    for t, n in enumerate(histogram):
+        weight_bg += n
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += t * n
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        var = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if var > best_var:
+            best_t, best_var = t, var
+    return best_t
+
+def estimate_line_height(img: Image.Image, max_side: int = 1600) -> float | None:
+    """
+    Median height, in pixels of `img`, of its text lines: Otsu-binarize a
+    downsampled grayscale copy and measure the runs of inked rows in its
+    horizontal projection. Returns None when no text lines are found.
+    """
+    gray = ImageOps.grayscale(img)
+    f = min(1.0, max_side / max(gray.size))
+    if f < 1.0:
+        gray = gray.resize((max(1, int(gray.width * f)), max(1, int(gray.height * f))), Image.BILINEAR)
+    thr = _otsu_threshold(gray.histogram())
+    ink = gray.point(lambda v: 255 if v <= thr else 0)
+    # Mean ink per row (0..255)
+    rows = list(ink.resize((1, ink.height), Image.BOX).getdata())
+    peak = max(rows) if rows else 0
+    if peak == 0:
+        return None
+
+    runs, run = [], 0
+    for v in rows + [0]:
+        if v > 0.1 * peak:
+            run += 1
+        elif run:
+            runs.append(run)
+            run = 0
+    runs = [r for r in runs if r >= 2]
+    # Text dark on light: a "line" covering most of the image is background, not text
+    if not runs or statistics.median(runs) > 0.5 * len(rows):
+        return None
+    return statistics.median(runs) / f
+
+def choose_scale(img: Image.Image) -> float:
+    """Scale factor that brings the measured text line height to OCR_TARGET_LINE_PX."""
+    line_h = estimate_line_height(img)
+    if not line_h:
+        return OCR_DEFAULT_SCALE
+    return min(OCR_MAX_SCALE, max(OCR_MIN_SCALE, OCR_TARGET_LINE_PX / line_h))
+
+def preprocess(img: Image.Image, scale: float | None = None) -> Image.Image:
     """
     Gentle preprocessing:
-      - 2.0x upscale (helps spacing)
+      - resize so text lines are about OCR_TARGET_LINE_PX tall (choose_scale;
+        2.0x when no text lines can be measured). Pass scale=1.0 for images
+        that were already rendered at the right resolution.
       - grayscale + autocontrast
       - light UnsharpMask (keeps edges crisp)
       - larger right border to prevent tail clipping
     """
-    w, h = img.size
-    img = img.resize((int(w * 2.0), int(h * 2.0)), Image.LANCZOS)
+    if scale is None:
+        scale = choose_scale(img)
     img = ImageOps.grayscale(img)
+    if scale != 1.0:
+        w, h = img.size
+        img = img.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.LANCZOS)
     img = ImageOps.autocontrast(img)
     img = img.filter(ImageFilter.UnsharpMask(radius=1.0, percent=110, threshold=2))
     #            left, top, right, bottom   (right made larger)
     img = ImageOps.expand(img, border=(12, 8, 36, 8), fill=255)
     return img
 
-def _reconstruct_from_chars(
-    img: Image.Image,
-    psm: str = "7",
-    lang: str = "lat",
-    oem: str = "1",
-    whitelist: str = ""
-) -> str:
+def _use_capi() -> bool:
+    if OCR_TESS_BACKEND == "capi":
+        return True
+    return OCR_TESS_BACKEND == "auto" and tess_capi.available()
+
+@lru_cache(maxsize=None)
+def _tesseract_version(capi: bool) -> str:
+    """Version of the Tesseract the given backend runs ("" when it can't be found)."""
+    if capi:
+        return tess_capi.version()
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except Exception:
+        return ""
+
+def _ocr_fingerprint() -> tuple:
     """
-    Char-box fallback: insert a space when the gap between adjacent chars
-    exceeds an adaptive threshold from the median gap + width safeguard.
+    The settings besides the request parameters that change OCR output: the
+    backend and its Tesseract version, resolution, PDF DPI and the confidence
+    gate. Part of every cache key, so results cached on disk under other
+    settings are never served after a restart.
     """
-    cfg = f"--oem {oem} --psm {psm} -c user_defined_dpi=400"
+    capi = _use_capi()
+    return (
+        "capi" if capi else "pytesseract", _tesseract_version(capi),
+        OCR_TARGET_LINE_PX, OCR_MIN_SCALE, OCR_MAX_SCALE, OCR_DEFAULT_SCALE,
+        PDF_ADAPTIVE_DPI, PDF_DPI, PDF_PROBE_DPI, PDF_MIN_DPI, PDF_MAX_DPI,
+        OCR_CONF_GATE, OCR_LOW_CONF, OCR_LOW_CONF_SHARE,
+    )
+
+def _tess_config(psm: str, oem: str, whitelist: str, variables: dict) -> str:
+    cfg = f"--oem {oem} --psm {psm}"
+    for name, value in variables.items():
+        cfg += f" -c {name}={value}"
     if whitelist:
         cfg += f" -c tessedit_char_whitelist={whitelist}"
+    return cfg
+
+_HOCR_LINE_CLASSES = {"ocr_line", "ocr_caption", "ocr_header", "ocr_textfloat"}
+
+class _HocrParser(HTMLParser):
+    """hOCR (with hocr_char_boxes=1) -> the structured result of tess_recognize."""
+
+    def __init__(self):
+        super().__init__()
+        self.words, self.symbols = [], []
+        self._block = self._par = self._line = self._word = 0
+        self._open = []
 
-    boxes_txt = pytesseract.image_to_boxes(img, lang=lang, config=cfg)
-    if not boxes_txt.strip():
+    @staticmethod
+    def _prop(title: str, name: str):
+        m = re.search(rf"{name}\s+([-\d.\s]+)", title)
+        return [float(v) for v in m.group(1).split()] if m else []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        cls, title = attrs.get("class") or "", attrs.get("title") or ""
+        self._open.append(cls)
+        if cls == "ocr_carea":
+            self._block, self._par, self._line, self._word = self._block + 1, 0, 0, 0
+        elif cls == "ocr_par":
+            self._par, self._line, self._word = self._par + 1, 0, 0
+        elif cls in _HOCR_LINE_CLASSES:
+            self._line, self._word = self._line + 1, 0
+        elif cls == "ocrx_word":
+            self._word += 1
+            conf = self._prop(title, "x_wconf")
+            self.words.append({
+                "text": "", "conf": conf[0] if conf else -1.0,
+                "block": self._block, "par": self._par, "line": self._line, "word": self._word,
+                "box": tuple(int(v) for v in self._prop(title, "bbox")[:4]),
+            })
+        elif cls == "ocrx_cinfo":
+            conf = self._prop(title, "x_conf")
+            self.symbols.append({
+                "text": "", "conf": conf[0] if conf else -1.0,
+                "box": tuple(int(v) for v in self._prop(title, "x_bboxes")[:4]),
+                "word": len(self.words) - 1,
+            })
+
+    def handle_endtag(self, tag):
+        if self._open:
+            self._open.pop()
+
+    def handle_data(self, data):
+        # Between char spans hOCR only has layout whitespace; keep just the glyphs
+        if "ocrx_cinfo" in self._open and self.symbols:
+            self.symbols[-1]["text"] += data
+            if self.words:
+                self.words[-1]["text"] += data
+        elif "ocrx_word" in self._open and self.words and data.strip():
+            self.words[-1]["text"] += data
+
+def parse_hocr(hocr: bytes | str) -> dict:
+    parser = _HocrParser()
+    parser.feed(hocr.decode("utf-8", errors="ignore") if isinstance(hocr, bytes) else hocr)
+    for w in parser.words:
+        w["text"] = w["text"].strip()
+    symbols = [c for c in parser.symbols if c["text"].strip() and len(c["box"]) == 4]
+    return {"words": parser.words, "symbols": symbols}
+
+def tess_recognize(img: Image.Image, psm: str, lang: str, oem: str, whitelist: str, variables: dict) -> dict:
+    """
+    One Tesseract recognition pass returning words and character boxes together:
+      {"words":   [{"text", "conf", "block", "par", "line", "word", "box"}],
+       "symbols": [{"text", "conf", "box", "word"}]}
+    Boxes are (left, top, right, bottom) with a top-left origin. The capi backend
+    walks the result iterator; the CLI backend asks for hOCR with character boxes.
+    """
+    if _use_capi():
+        return tess_capi.recognize(img, lang=lang, oem=oem, psm=psm, whitelist=whitelist, variables=variables)
+    cfg = _tess_config(psm, oem, whitelist, {**variables, "hocr_char_boxes": 1})
+    return parse_hocr(pytesseract.image_to_pdf_or_hocr(img, lang=lang, config=cfg, extension="hocr"))
+
+def _rebuild_from_chars(symbols: list, img_size: tuple) -> str:
+    """
+    Char-box fallback: insert a space when the gap between adjacent chars
+    exceeds an adaptive threshold from the median gap + width safeguard.
+    """
+    if not symbols:
         return ""
 
-    # Parse char boxes
+    # (char, l,b,r,t, cx,cy, w,h) with a bottom-left origin, as in box files
+    img_h = img_size[1]
     chars = []
-    for line in boxes_txt.splitlines():
-        parts = line.strip().split()
-        if len(parts) < 6:
-            continue
-        ch, x1, y1, x2, y2, _ = parts[0], int(parts[1]), int(parts[2]), int(parts[3]), int(parts[4]), parts[5]
+    for sym in symbols:
+        x1, top, x2, bottom = sym["box"]
+        y1, y2 = img_h - bottom, img_h - top
         cx = (x1 + x2) / 2.0
         cy = (y1 + y2) / 2.0
         w  = (x2 - x1)
         h  = (y2 - y1)
-        chars.append((ch, x1, y1, x2, y2, cx, cy, w, h))  # (char, l,b,r,t, cx,cy, w,h)
-
-    if not chars:
-        return ""
+        chars.append((sym["text"], x1, y1, x2, y2, cx, cy, w, h))
 
     # Sort top->bottom, then left->right
     chars.sort(key=lambda c: (-c[6], c[5]))
@@ -136,84 +387,130 @@ def _reconstruct_from_chars(
 
     # If multiple micro-lines but the image is a single text line, flatten
     if len(rebuilt) > 1:
-        w, h = img.size
+        w, h = img_size
         if h < 0.4 * w:
             rebuilt = [" ".join(s for s in rebuilt if s.strip())]
 
     return "\n".join(rebuilt)
 
+def _rebuild_from_words(words: list, low_conf_spans: list | None = None):
+    """
+    Words -> (token_count, text), one output line per (block, par, line).
+    If `low_conf_spans` is given, the [start, end) offsets in text of the
+    words under OCR_LOW_CONF are appended to it.
+    """
+    words_by_line, line_tokens, prev_key = [], [], None
+    token_count = 0
+    pos = 0
+    for w in words:
+        txt = (w["text"] or "").strip()
+        if not txt or w["conf"] < 0:
+            continue
+
+        token_count += 1
+        key = (w["block"], w["par"], w["line"])
+        if prev_key is None:
+            prev_key = key
+        if key != prev_key:
+            if line_tokens:
+                words_by_line.append(" ".join(line_tokens))
+                line_tokens = []
+            prev_key = key
+        if line_tokens or words_by_line:
+            pos += 1  # the space or newline before this word
+        if low_conf_spans is not None and w["conf"] < OCR_LOW_CONF:
+            low_conf_spans.append([pos, pos + len(txt)])
+        pos += len(txt)
+        line_tokens.append(txt)
+
+    if line_tokens:
+        words_by_line.append(" ".join(line_tokens))
+
+    joined = "\n".join(words_by_line).strip()
+    return token_count, joined
+
+def _suspect_reason(words: list, joined: str) -> str | None:
+    """
+    Why a page whose words look well segmented may still be misread, or None
+    for a clean page. Uses the word confidences and token shapes of one pass.
+    """
+    confs = [w["conf"] for w in words if (w["text"] or "").strip() and w["conf"] >= 0]
+    if not confs:
+        return "no confident words"
+    mean_conf = sum(confs) / len(confs)
+    if mean_conf < OCR_CONF_GATE:
+        return f"mean word confidence {mean_conf:.0f} < {OCR_CONF_GATE:g}"
+    low_share = sum(c < OCR_LOW_CONF for c in confs) / len(confs)
+    if low_share > OCR_LOW_CONF_SHARE:
+        return f"{low_share:.0%} of words below confidence {OCR_LOW_CONF:g}"
+    tokens = joined.split()
+    if tokens and sum(len(t) for t in tokens) / len(tokens) > 12:
+        return "long glued tokens"
+    return None
+
 def ocr_tesseract_words(
     img: Image.Image,
     psm: str = "6",
     lang: str = "lat",
     oem: str = "1",
-    whitelist: str = ""
+    whitelist: str = "",
+    meta: dict | None = None
 ) -> str:
     """
-    Two-pass TSV strategy:
-      1) TSV with requested PSM (e.g., 7 for single line)
-      2) If collapsed, TSV with PSM 6 (paragraph) to force words
+    Word-join vs char-gap strategy, on one recognition pass:
+      1) words with the requested PSM (e.g., 7 for single line)
+      2) If collapsed, a second pass with PSM 6 (paragraph) to force words
       3) If still collapsed, char-box fallback
-      Best-of heuristic: prefer TSV unless char fallback is clearly longer (>=10%).
-    """
-    def _tsv(psm_value: str):
-        cfg = f"--oem {oem} --psm {psm_value} -c user_defined_dpi=400 -c preserve_interword_spaces=1"
-        if whitelist:
-            cfg += f" -c tessedit_char_whitelist={whitelist}"
-        return pytesseract.image_to_data(img, lang=lang, config=cfg, output_type=Output.DICT)
-
-    def _rebuild_from_tsv(data_dict):
-        words_by_line, line_tokens, prev_key = [], [], None
-        n = len(data_dict.get("text", []))
-        token_count = 0
-        for i in range(n):
-            txt = (data_dict["text"][i] or "").strip()
-            conf = data_dict["conf"][i]
-            try:
-                conf_val = int(conf) if isinstance(conf, str) and conf.strip().lstrip("-").isdigit() else int(conf)
-            except Exception:
-                conf_val = 0
-            if not txt or conf_val < 0:
-                continue
-
-            token_count += 1
-            key = (data_dict["block_num"][i], data_dict["par_num"][i], data_dict["line_num"][i])
-            if prev_key is None:
-                prev_key = key
-            if key != prev_key:
-                if line_tokens:
-                    words_by_line.append(" ".join(line_tokens))
-                    line_tokens = []
-                prev_key = key
-            line_tokens.append(txt)
-
-        if line_tokens:
-            words_by_line.append(" ".join(line_tokens))
-
-        joined = "\n".join(words_by_line).strip()
-        return token_count, joined
+      Best-of heuristic: prefer words unless char fallback is clearly longer (>=10%).
+    The char-box fallback reuses the symbol boxes of pass 1, so it never
+    re-runs Tesseract. On a page that is not collapsed it is only tried when
+    the word confidences look suspect (_suspect_reason); clean pages keep
+    their words as-is.
+    If `meta` is given, meta["passes"] lists the passes that ran and why, and
+    meta["low_conf_spans"] the [start, end) offsets of the low-confidence words
+    in the returned text (None for char-fallback text, which has no word
+    confidences: all of it counts as suspect).
+    """
+    variables = {"user_defined_dpi": 400, "preserve_interword_spaces": 1}
+    passes = []
+    if meta is None:
+        meta = {}
+    meta["passes"] = passes
+    meta["low_conf_spans"] = None
 
     # Pass A: user-requested PSM
-    dataA = _tsv(psm)
-    tokensA, joinedA = _rebuild_from_tsv(dataA)
+    resultA = tess_recognize(img, psm or "7", lang, oem, whitelist, variables)
+    spansA = []
+    tokensA, joinedA = _rebuild_from_words(resultA["words"], spansA)
+    passes.append({"pass": "words", "psm": psm or "7"})
+
+    def _char_alt(reason):
+        passes.append({"pass": "chars", "reason": reason})
+        return _rebuild_from_chars(resultA["symbols"], img.size)
 
     # If collapsed, retry with PSM 6 to force word segmentation
     if tokensA <= 1 or not joinedA or (" " not in joinedA and len(joinedA) > 8):
-        dataB = _tsv("6")
-        tokensB, joinedB = _rebuild_from_tsv(dataB)
+        resultB = tess_recognize(img, "6", lang, oem, whitelist, variables)
+        spansB = []
+        tokensB, joinedB = _rebuild_from_words(resultB["words"], spansB)
+        passes.append({"pass": "words", "psm": "6", "reason": "collapsed segmentation"})
         if tokensB > 1 and (" " in joinedB or len(joinedB) <= 8):
             # Best-of vs char fallback (require >=10% longer to switch)
-            char_alt = _reconstruct_from_chars(img, psm=(psm or "7"), lang=lang, oem=oem, whitelist=whitelist)
+            char_alt = _char_alt("compare with PSM 6 words")
             if char_alt and len(char_alt) >= int(len(joinedB) * 1.10):
                 return char_alt
+            meta["low_conf_spans"] = spansB
             return joinedB
         # Still collapsed -> char fallback
-        return _reconstruct_from_chars(img, psm=(psm or "7"), lang=lang, oem=oem, whitelist=whitelist)
+        return _char_alt("still collapsed")
 
-    # Normal success path -> compare with char fallback (require >=10% longer)
-    char_alt = _reconstruct_from_chars(img, psm=(psm or "7"), lang=lang, oem=oem, whitelist=whitelist)
-    if char_alt and len(char_alt) >= int(len(joinedA) * 1.10):
-        return char_alt
+    # Normal success path -> only a suspect page is compared with the char fallback
+    reason = _suspect_reason(resultA["words"], joinedA)
+    if reason is not None:
+        char_alt = _char_alt(reason)
+        if char_alt and len(char_alt) >= int(len(joinedA) * 1.10):
+            return char_alt
+    meta["low_conf_spans"] = spansA
     return joinedA
 
 def ocr_image_pil(
@@ -221,21 +518,24 @@ def ocr_image_pil(
     psm: str = "6",
     lang: str = "lat",
     oem: str = "1",
-    whitelist: str = ""
+    whitelist: str = "",
+    meta: dict | None = None,
+    scale: float | None = None
 ) -> str:
-    img = preprocess(img_pil)
-    return ocr_tesseract_words(img, psm=psm, lang=lang, oem=oem, whitelist=whitelist)
+    img = preprocess(img_pil, scale=scale)
+    return ocr_tesseract_words(img, psm=psm, lang=lang, oem=oem, whitelist=whitelist, meta=meta)
 
 def ocr_tesseract(
     img_bytes: bytes,
     psm: str = "6",
     lang: str = "lat",
     oem: str = "1",
-    whitelist: str = ""
+    whitelist: str = "",
+    meta: dict | None = None
 ) -> str:
     img = Image.open(io.BytesIO(img_bytes))
     img = preprocess(img)
-    return ocr_tesseract_words(img, psm=psm, lang=lang, oem=oem, whitelist=whitelist)
+    return ocr_tesseract_words(img, psm=psm, lang=lang, oem=oem, whitelist=whitelist, meta=meta)
 
 def ocr_kraken(img_bytes: bytes, model_id: str | None = None) -> str:
     """
@@ -254,7 +554,144 @@ def ocr_kraken(img_bytes: bytes, model_id: str | None = None) -> str:
     finally:
         os.remove(tmp_path)
 
-def ocr_bytes_auto(
+def probe_pdf_dpi(file_bytes: bytes) -> int | None:
+    """
+    Render the first pages at PDF_PROBE_DPI, measure their text line height
+    and return the DPI at which lines come out OCR_TARGET_LINE_PX tall.
+    None when nothing could be measured (callers fall back to PDF_DPI + 2x).
+    """
+    try:
+        probes = convert_from_bytes(file_bytes, dpi=PDF_PROBE_DPI, first_page=1, last_page=3)
+    except Exception:
+        # Only an optimization; a broken PDF fails properly in iter_pdf_pages
+        return None
+    heights = [h for h in (estimate_line_height(p) for p in probes) if h]
+    if not heights:
+        return None
+    dpi = PDF_PROBE_DPI * OCR_TARGET_LINE_PX / statistics.median(heights)
+    return int(min(PDF_MAX_DPI, max(PDF_MIN_DPI, dpi)))
+
+def iter_pdf_pages(file_bytes: bytes, dpi: int = PDF_DPI, batch: int | None = None):
+    """
+    Yield the pages of a PDF as PIL images, one at a time.
+    The PDF is written once to a spool directory and rendered `batch` pages per
+    pdftoppm call (first_page/last_page); each page file is loaded and removed
+    before the next window is rendered.
+    """
+    batch = max(1, batch or PDF_RASTER_BATCH)
+    with tempfile.TemporaryDirectory(prefix="ocr-spool-") as spool:
+        pdf_path = os.path.join(spool, "doc.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(file_bytes)
+        total = int(pdfinfo_from_path(pdf_path)["Pages"])
+        for first in range(1, total + 1, batch):
+            last = min(first + batch - 1, total)
+            paths = convert_from_path(
+                pdf_path, dpi=dpi, first_page=first, last_page=last,
+                output_folder=spool, fmt="ppm", paths_only=True,
+            )
+            for path in sorted(paths):
+                with Image.open(path) as page:
+                    page.load()
+                    img = page.copy()
+                os.remove(path)
+                yield img
+
+# ------------------------- Executors -------------------------
+ocr_executor = ThreadPoolExecutor(max_workers=OCR_REQUEST_THREADS, thread_name_prefix="ocr")
+translation_executor = ThreadPoolExecutor(max_workers=TRANSLATION_THREADS, thread_name_prefix="translate")
+completion_executor = ThreadPoolExecutor(max_workers=COMPLETION_THREADS, thread_name_prefix="complete")
+
+job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+job_store = JobStore(ttl_s=JOB_TTL_S, max_jobs=JOB_MAX_JOBS)
+
+async def run_blocking(executor, fn, *args, **kwargs):
+    """Await a blocking call on one of the executors above."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+
+ocr_cache = OcrCache(
+    max_entries=OCR_CACHE_ENTRIES,
+    disk_dir=OCR_CACHE_DIR,
+    disk_max_bytes=OCR_CACHE_MAX_MB * 1024 * 1024,
+)
+
+# ------------------------- Page pool -------------------------
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+def _init_ocr_worker(tess_threads: str):
+    # Inherited by every tesseract subprocess started from this worker, and read by
+    # libtesseract if this worker process loads it (a forked one inherits the parent's).
+    os.environ["OMP_THREAD_LIMIT"] = str(tess_threads)
+    tess_capi.set_thread_limit(tess_threads)
+
+def _page_executor():
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            pool_cls = ProcessPoolExecutor if OCR_POOL == "process" else ThreadPoolExecutor
+            _page_pool = pool_cls(
+                max_workers=OCR_WORKERS,
+                initializer=_init_ocr_worker,
+                initargs=(OCR_TESS_THREADS,),
+            )
+        return _page_pool
+
+def configure_page_pool(workers: int | None = None, pool: str | None = None, tess_threads: str | None = None):
+    """
+    Change the page pool settings at runtime (benchmarks, tests).
+    The current pool is shut down and rebuilt lazily on next use.
+    """
+    global OCR_WORKERS, OCR_POOL, OCR_TESS_THREADS, _page_pool
+    with _page_pool_lock:
+        if workers is not None:
+            OCR_WORKERS = max(1, int(workers))
+        if pool is not None:
+            OCR_POOL = pool.lower()
+        if tess_threads is not None:
+            OCR_TESS_THREADS = str(tess_threads)
+            if not tess_capi.set_thread_limit(OCR_TESS_THREADS) and _use_capi():
+                print(f"OCR_TESS_THREADS={OCR_TESS_THREADS} only applies to the tesseract CLI and to new "
+                      "worker processes: libtesseract in this process keeps the limit it was loaded with.")
+        if _page_pool is not None:
+            _page_pool.shutdown(wait=True)
+            _page_pool = None
+
+def _bounded_map(jobs, max_pending: int):
+    """
+    Ordered results for a lazy stream of (tag, future) pairs, yielding (tag, result).
+    At most `max_pending` futures are pulled ahead of the consumer, so a page
+    generator is never drained faster than the pool can OCR it.
+    """
+    pending = deque()
+    for tag, fut in jobs:
+        pending.append((tag, fut))
+        if len(pending) >= max_pending:
+            tag, fut = pending.popleft()
+            yield tag, fut.result()
+    while pending:
+        tag, fut = pending.popleft()
+        yield tag, fut.result()
+
+def _done(value) -> Future:
+    fut = Future()
+    fut.set_result(value)
+    return fut
+
+def _ocr_page(img: Image.Image, psm: str, lang: str, oem: str, whitelist: str, scale: float | None = None):
+    """One PDF page -> (text, elapsed_ms, passes, low_conf_spans). Module-level so process pools can pickle it."""
+    t0 = time.perf_counter()
+    page_meta = {}
+    text = ocr_image_pil(img, psm=psm, lang=lang, oem=oem, whitelist=whitelist, meta=page_meta, scale=scale)
+    return text, int((time.perf_counter() - t0) * 1000), page_meta.get("passes", []), page_meta.get("low_conf_spans")
+
+def count_pages(file_bytes: bytes, filename: str) -> int:
+    if infer_ext(filename) == ".pdf":
+        return int(pdfinfo_from_bytes(file_bytes)["Pages"])
+    return 1
+
+def iter_ocr_pages(
     file_bytes: bytes,
     filename: str,
     psm: str,
@@ -264,45 +701,279 @@ def ocr_bytes_auto(
     whitelist: str = ""
 ):
     """
-    Handles PNG/JPG directly; if PDF, converts to images (one per page) then OCRs each.
-    Returns (combined_text, meta_dict).
+    Yields one record per page as soon as that page is OCRed:
+      {"page": 1-based page number, "text": str, "per_page_ms": int,
+       "cache": "hit" | "miss", "passes": [Tesseract passes that ran, see ocr_tesseract_words],
+       "low_conf_spans": [[start, end) offsets of low-confidence words] | None (no word confidences)}
+    PDF pages are rasterized lazily (iter_pdf_pages) and, with OCR_WORKERS > 1,
+    OCRed concurrently on the page pool; records still come out in page order.
+    PNG/JPG uploads yield a single record.
+
+    Results are cached twice: per upload (sha256 of the bytes + OCR params), which
+    skips rasterization entirely, and per rendered page, which skips preprocessing
+    and Tesseract for pages already seen in another upload. The params include
+    the settings fingerprint (_ocr_fingerprint).
     """
     ext = infer_ext(filename)
-    start = time.perf_counter()
-    pages, per_page_ms = [], []
+    params = (engine.lower(), str(psm), lang, str(oem), whitelist) + _ocr_fingerprint()
+    dkey = doc_key(file_bytes, params)
+    cached = ocr_cache.get(dkey)
+    if cached is not None:
+        spans = cached.get("spans") or [None] * len(cached["pages"])
+        for page_no, (text, page_spans) in enumerate(zip(cached["pages"], spans), start=1):
+            yield {"page": page_no, "text": text, "per_page_ms": 0, "cache": "hit", "passes": [], "low_conf_spans": page_spans}
+        return
 
+    texts, spans = [], []
     if ext == ".pdf":
-        images = convert_from_bytes(file_bytes, dpi=300)
-        for img in images:
-            t0 = time.perf_counter()
-            text = ocr_image_pil(img, psm=psm, lang=lang, oem=oem, whitelist=whitelist)
-            per_page_ms.append(int((time.perf_counter() - t0) * 1000))
-            pages.append(text)
-        combined = PAGE_SEP.join(pages)
-        meta = {"pages": len(pages), "per_page_ms": per_page_ms}
+        pool = _page_executor() if OCR_WORKERS > 1 else None
+        # Rendered straight at the target resolution -> no second resample
+        dpi = probe_pdf_dpi(file_bytes) if PDF_ADAPTIVE_DPI else None
+        scale = 1.0 if dpi else None
+
+        def jobs():
+            for img in iter_pdf_pages(file_bytes, dpi=dpi or PDF_DPI):
+                pkey = page_key(img, params)
+                hit = ocr_cache.get(pkey)
+                if hit is not None:
+                    yield (pkey, "hit"), _done((hit["text"], 0, [], hit.get("spans")))
+                elif pool is not None:
+                    yield (pkey, "miss"), pool.submit(_ocr_page, img, psm, lang, oem, whitelist, scale)
+                else:
+                    yield (pkey, "miss"), _done(_ocr_page(img, psm, lang, oem, whitelist, scale))
+
+        max_pending = OCR_WORKERS + PDF_LOOKAHEAD if pool is not None else 1
+        results = _bounded_map(jobs(), max_pending)
+        for page_no, ((pkey, status), (text, ms, passes, page_spans)) in enumerate(results, start=1):
+            if status == "miss":
+                ocr_cache.put(pkey, {"text": text, "spans": page_spans})
+            texts.append(text)
+            spans.append(page_spans)
+            yield {"page": page_no, "text": text, "per_page_ms": ms, "cache": status, "passes": passes, "low_conf_spans": page_spans}
     else:
         t0 = time.perf_counter()
+        page_meta = {}
         if engine.lower() == "kraken":
-            combined = ocr_kraken(file_bytes, model_id=None)
+            text = ocr_kraken(file_bytes, model_id=None)
         else:
-            combined = ocr_tesseract(
+            text = ocr_tesseract(
                 img_bytes=file_bytes,
                 psm=psm,
                 lang=lang,
                 oem=oem,
                 whitelist=whitelist,
+                meta=page_meta,
             )
-        meta = {"pages": 1, "per_page_ms": [int((time.perf_counter() - t0) * 1000)]}
+        texts.append(text)
+        spans.append(page_meta.get("low_conf_spans"))
+        yield {
+            "page": 1, "text": text, "per_page_ms": int((time.perf_counter() - t0) * 1000),
+            "cache": "miss", "passes": page_meta.get("passes", []), "low_conf_spans": spans[0],
+        }
+
+    ocr_cache.put(dkey, {"pages": texts, "spans": spans})
 
+def pages_meta(records: list, psm: str) -> dict:
+    """Per-page timings, cache status, Tesseract passes and low-confidence spans for a list of page records."""
+    return {
+        "pages": len(records),
+        "per_page_ms": [r["per_page_ms"] for r in records],
+        "cache": [r["cache"] for r in records],
+        "passes": [r["passes"] for r in records],
+        "low_conf_spans": [r.get("low_conf_spans") for r in records],
+        "psm": str(psm),
+    }
+
+def ocr_bytes_auto(
+    file_bytes: bytes,
+    filename: str,
+    psm: str,
+    lang: str,
+    engine: str,
+    oem: str = "1",
+    whitelist: str = ""
+):
+    """
+    Handles PNG/JPG directly; if PDF, converts to images (one per page) then OCRs each.
+    Collects iter_ocr_pages into the PAGE_SEP-joined text.
+    Returns (combined_text, meta_dict).
+    """
+    start = time.perf_counter()
+    records = list(iter_ocr_pages(file_bytes, filename, psm, lang, engine, oem=oem, whitelist=whitelist))
+    combined = PAGE_SEP.join(r["text"] for r in records)
+    meta = pages_meta(records, psm)
+    if infer_ext(filename) == ".pdf":
+        meta["workers"] = OCR_WORKERS
     meta["duration_ms"] = int((time.perf_counter() - start) * 1000)
-    meta["psm"] = str(psm)
     return combined, meta
 
+def translate_text(text: str) -> str:
+    """webTranslation that never raises: failures are logged and reported inline."""
+    try:
+        if text.strip():
+            return webTranslation(text)
+    except Exception as e:
+        # Log the error but don't fail the request
+        print(f"Translation failed: {e}")
+        return "Translation failed"
+    return ""
+
+def _completion_call(path: str, payload: dict | None = None, timeout: float = COMPLETION_TIMEOUT_S) -> dict:
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(
+        COMPLETION_URL + path, data=data, headers={"Content-Type": "application/json"},
+        method="POST" if data is not None else "GET",
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+_completion_engine = None
+_completion_engine_lock = threading.Lock()
+
+def _completion_module():
+    """backend/completion/completion.py, imported (and its model loaded) once."""
+    global _completion_engine
+    with _completion_engine_lock:
+        if _completion_engine is None:
+            from completion import completion as engine
+            _completion_engine = engine
+        return _completion_engine
+
+if COMPLETION_INPROCESS and COMPLETION_PRELOAD:
+    _completion_module()
+
+def _correct_page(page: str, spans: list | None = None):
+    """
+    One page through the completion model -> (text, ms spent in the model, edits or None, positions
+    checked). With `spans` only those [start, end) ranges are checked and changed (greedy mode).
+    """
+    if COMPLETION_MODE == "beam":
+        spans = None
+    if COMPLETION_INPROCESS:
+        engine = _completion_module()
+        start = time.perf_counter()
+        threshold = engine.parseThreshold(COMPLETION_THRESHOLD)
+        if COMPLETION_MODE == "beam":
+            result = engine.beamCorrection(page)
+        elif spans is not None:
+            corrected, rescored = engine.correctSpans(page, threshold, spans)
+            result = {"text": corrected, "rescored": rescored}
+        else:
+            result = {"text": engine.correctText(page, threshold)}
+        result["durationMs"] = int((time.perf_counter() - start) * 1000)
+    else:
+        payload = {"text": page, "threshold": COMPLETION_THRESHOLD, "mode": COMPLETION_MODE}
+        if spans is not None:
+            payload["spans"] = spans
+        result = _completion_call("/correct", payload)
+    # textCorrection checks every position but the first and the last
+    return result["text"], result.get("durationMs", 0), result.get("edits"), result.get("rescored", max(0, len(page) - 2))
+
+def complete_text(text: str, spans: list | None = None):
+    """
+    Run the completion model (server or in-process) over each page of `text`. Never raises: on failure
+    the OCR text is returned unchanged and the error is reported in the meta.
+    `spans` holds each page's low-confidence spans (iter_ocr_pages' low_conf_spans); with
+    COMPLETION_SUSPECT_ONLY only those are rescored, the confident text is just context. Pages
+    without spans (None) are rescored in full.
+    Returns (text, meta) with round-trip and server-side timings and rescored_share, the share of
+    positions the model checked; in beam mode meta["edits"] lists every edit with its page, position
+    in the page and probability.
+    """
+    start = time.perf_counter()
+    meta = {"status": "ok", "mode": "inprocess" if COMPLETION_INPROCESS else "http", "server_ms": 0}
+    pages = text.split(PAGE_SEP)
+    if not COMPLETION_SUSPECT_ONLY or spans is None or len(spans) != len(pages):
+        spans = [None] * len(pages)
+    try:
+        out = []
+        rescored = positions = 0
+        for page_no, (page, page_spans) in enumerate(zip(pages, spans), start=1):
+            if not page.strip():
+                out.append(page)
+                continue
+            corrected, model_ms, edits, page_rescored = _correct_page(page, page_spans)
+            out.append(corrected)
+            meta["server_ms"] += model_ms
+            rescored += page_rescored
+            positions += max(0, len(page) - 2)
+            if edits is not None:
+                meta.setdefault("edits", []).extend({**edit, "page": page_no} for edit in edits)
+        text = PAGE_SEP.join(out)
+        meta["rescored_share"] = round(rescored / positions, 4) if positions else 0.0
+    except Exception as e:
+        print(f"Completion failed: {e}")
+        meta = {"status": "error", "mode": meta["mode"], "detail": str(e)}
+    meta["ms"] = int((time.perf_counter() - start) * 1000)
+    return text, meta
+
+def completion_health() -> dict:
+    """Reachability + round trip of the completion server (its /health, forwarded)."""
+    start = time.perf_counter()
+    if COMPLETION_INPROCESS:
+        try:
+            engine = _completion_module()
+            ok, detail = True, {"backend": engine.backend, "sequenceLength": engine.sequenceLength, "cache": engine.cacheStats()}
+        except Exception as e:
+            ok, detail = False, str(e)
+        return {"configured": True, "mode": "inprocess", "ok": ok, "ms": int((time.perf_counter() - start) * 1000), "server": detail}
+    if not COMPLETION_URL:
+        return {"configured": False, "ok": False}
+    try:
+        server = _completion_call("/health", timeout=5)
+        ok, detail = server.get("status") == "ok", server
+    except (OSError, ValueError) as e:
+        ok, detail = False, str(e)
+    return {"configured": True, "mode": "http", "ok": ok, "ms": int((time.perf_counter() - start) * 1000), "server": detail}
+
+def run_job(job_id: str, file_bytes: bytes, filename: str, psm: str, lang: str, engine: str, oem: str, whitelist: str,
+            complete: bool = False):
+    """Background worker: the /ocr pipeline, publishing progress into job_store."""
+    start = time.perf_counter()
+    job_store.update(job_id, status="running")
+    try:
+        job_store.update(job_id, progress={"pages_total": count_pages(file_bytes, filename)})
+        pages = []
+        for rec in iter_ocr_pages(file_bytes, filename, psm, lang, engine, oem=oem, whitelist=whitelist):
+            pages.append(rec)
+            job_store.add_page(job_id, rec)
+        text = PAGE_SEP.join(r["text"] for r in pages)
+        meta = pages_meta(pages, psm)
+        if complete:
+            text, meta["completion"] = complete_text(text, meta.get("low_conf_spans"))
+        translation = translate_text(text)
+        meta["duration_ms"] = int((time.perf_counter() - start) * 1000)
+        job_store.update(job_id, status="done", text=text, translation=translation, meta=meta)
+    except Exception as e:
+        job_store.update(job_id, status="error", error=f"OCR failed: {e}")
+
 # ------------------------- Routes -------------------------
 @app.get("/ping")
 def ping():
     return {"ok": True}
 
+@app.get("/completion/health")
+async def get_completion_health():
+    return await run_blocking(completion_executor, completion_health)
+
+def _check_upload(ext: str, engine: str, oem: str, complete: bool = False):
+    if ext not in ALLOWED_EXTS:
+        raise HTTPException(status_code=400, detail="Unsupported file type. Upload PNG/JPG/PDF.")
+
+    if complete and not (COMPLETION_URL or COMPLETION_INPROCESS):
+        raise HTTPException(status_code=400, detail="Completion requested, but neither COMPLETION_URL nor COMPLETION_INPROCESS is configured.")
+
+    # Friendly guard for OEM 0 without legacy data
+    if oem == "0" and not os.path.exists("/usr/share/tesseract-ocr/5/tessdata/lat.traineddata"):
+        raise HTTPException(
+            status_code=400,
+            detail="OEM 0 (legacy) requested, but legacy Latin data is not installed. "
+                   "Use oem=1 or install legacy 'lat.traineddata'."
+        )
+
+    if engine.lower() == "kraken" and ext == ".pdf":
+        raise HTTPException(status_code=400, detail="Kraken + PDF not yet supported.")
+
 @app.post("/ocr")
 async def ocr(
     file: UploadFile = File(...),
@@ -311,28 +982,19 @@ async def ocr(
     lang: str = Form("lat"),           # Latin
     oem: str = Form("1"),              # 1: LSTM (default). Use 0 only if legacy data is installed.
     kraken_model: str | None = Form(None),
-    whitelist: str = Form("")          # optional: restrict charset
+    whitelist: str = Form(""),         # optional: restrict charset
+    complete: bool = Form(False)       # run the completion server over the OCR text before translating
 ):
     filename = file.filename or ""
     ext = infer_ext(filename)
-    if ext not in ALLOWED_EXTS:
-        raise HTTPException(status_code=400, detail="Unsupported file type. Upload PNG/JPG/PDF.")
+    _check_upload(ext, engine, oem, complete)
 
     file_bytes = await file.read()
 
-    # Friendly guard for OEM 0 without legacy data
-    if oem == "0" and not os.path.exists("/usr/share/tesseract-ocr/5/tessdata/lat.traineddata"):
-        raise HTTPException(
-            status_code=400,
-            detail="OEM 0 (legacy) requested, but legacy Latin data is not installed. "
-                   "Use oem=1 or install legacy 'lat.traineddata'."
-        )
-
     try:
-        if engine.lower() == "kraken" and ext == ".pdf":
-            raise HTTPException(status_code=400, detail="Kraken + PDF not yet supported.")
-
-        text, meta = ocr_bytes_auto(
+        text, meta = await run_blocking(
+            ocr_executor,
+            ocr_bytes_auto,
             file_bytes=file_bytes,
             filename=filename,
             psm=psm,
@@ -342,15 +1004,11 @@ async def ocr(
             whitelist=whitelist
         )
 
+        if complete:
+            text, meta["completion"] = await run_blocking(completion_executor, complete_text, text, meta.get("low_conf_spans"))
+
         # Translate the OCR'd text to English
-        translation = ""
-        try:
-            if text.strip():
-                translation = webTranslation(text)
-        except Exception as e:
-            # Log the error but don't fail the request
-            print(f"Translation failed: {e}")
-            translation = "Translation failed"
+        translation = await run_blocking(translation_executor, translate_text, text)
 
         return JSONResponse({"engine": engine, "lang": lang, "text": text, "translation": translation, "meta": meta})
 
@@ -359,3 +1017,84 @@ async def ocr(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OCR failed: {e}")
 
+@app.post("/ocr/stream")
+async def ocr_stream(
+    file: UploadFile = File(...),
+    engine: str = Form("tesseract"),
+    psm: str = Form("6"),
+    lang: str = Form("lat"),
+    oem: str = Form("1"),
+    kraken_model: str | None = Form(None),
+    whitelist: str = Form("")
+):
+    """
+    Same inputs as /ocr, but answers with NDJSON (one JSON object per line):
+      {"type": "page", "page": n, "text": ..., "per_page_ms": ...}   as each page finishes
+      {"type": "translation", "page": n, "translation": ...}          once OCR is done
+      {"type": "done", "engine": ..., "lang": ..., "meta": {...}}
+    A failure after streaming has started is reported as {"type": "error", "detail": ...}.
+    """
+    filename = file.filename or ""
+    ext = infer_ext(filename)
+    _check_upload(ext, engine, oem)
+
+    file_bytes = await file.read()
+
+    async def records():
+        start = time.perf_counter()
+        pages, translations = [], []
+        done = object()
+        it = iter_ocr_pages(file_bytes, filename, psm, lang, engine, oem=oem, whitelist=whitelist)
+        try:
+            while True:
+                rec = await run_blocking(ocr_executor, next, it, done)
+                if rec is done:
+                    break
+                pages.append(rec)
+                # Translate while the remaining pages are still being OCRed
+                translations.append(asyncio.ensure_future(run_blocking(translation_executor, translate_text, rec["text"])))
+                yield json.dumps({"type": "page", **rec}) + "\n"
+            for rec, translation in zip(pages, translations):
+                yield json.dumps({"type": "translation", "page": rec["page"], "translation": await translation}) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": f"OCR failed: {e}"}) + "\n"
+            return
+        meta = pages_meta(pages, psm)
+        meta["duration_ms"] = int((time.perf_counter() - start) * 1000)
+        yield json.dumps({"type": "done", "engine": engine, "lang": lang, "meta": meta}) + "\n"
+
+    return StreamingResponse(records(), media_type="application/x-ndjson")
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    file: UploadFile = File(...),
+    engine: str = Form("tesseract"),
+    psm: str = Form("6"),
+    lang: str = Form("lat"),
+    oem: str = Form("1"),
+    kraken_model: str | None = Form(None),
+    whitelist: str = Form(""),
+    complete: bool = Form(False)
+):
+    """
+    Same inputs as /ocr, but only queues the work and returns the job id right away.
+    Poll GET /jobs/{id} for status, progress and (partial) results.
+    """
+    filename = file.filename or ""
+    ext = infer_ext(filename)
+    _check_upload(ext, engine, oem, complete)
+
+    file_bytes = await file.read()
+
+    job = job_store.create()
+    if job is None:
+        raise HTTPException(status_code=503, detail="Too many jobs queued; try again later.")
+    job_executor.submit(run_job, job["id"], file_bytes, filename, psm, lang, engine, oem, whitelist, complete)
+    return {"job_id": job["id"], "status": job["status"]}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job id.")
+    return job
@@ -0,0 +1,95 @@
+"""
+OCR benchmarks.
+
+--mode workers (default): builds an N-page PDF (from latin_test.png unless
+--pdf is given) and OCRs it with 1..max workers, printing pages/sec and the
+speedup over one worker. The OCR cache is turned off for it, otherwise every
+run after the first (and every repeated page) would be a cache hit.
+
+    python bench_ocr.py --pages 16 --max-workers 8 --pool thread
+
+--mode backends: per-page latency of ocr_tesseract_words with the pytesseract
+CLI backend versus the in-process libtesseract backend (tess_capi).
+
+    python bench_ocr.py --mode backends --repeats 10
+"""
+import argparse
+import io
+import os
+import shutil
+import time
+
+from PIL import Image
+
+import app
+
+
+def make_pdf(pages: int, image_path: str) -> bytes:
+    img = Image.open(image_path).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, "PDF", save_all=True, append_images=[img.copy() for _ in range(pages - 1)], resolution=150)
+    return buf.getvalue()
+
+
+def bench_workers(pdf_bytes: bytes, max_workers: int, pool: str, tess_threads: str, psm: str, lang: str, repeats: int):
+    base = None
+    app.ocr_cache = app.OcrCache(max_entries=0, disk_dir="")
+    print(f"{'workers':>7} {'pages':>6} {'seconds':>9} {'pages/s':>9} {'speedup':>8}")
+    for workers in range(1, max_workers + 1):
+        app.configure_page_pool(workers=workers, pool=pool, tess_threads=tess_threads)
+        best = None
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            _, meta = app.ocr_bytes_auto(pdf_bytes, "bench.pdf", psm=psm, lang=lang, engine="tesseract")
+            elapsed = time.perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        rate = meta["pages"] / best
+        base = base or rate
+        print(f"{workers:>7} {meta['pages']:>6} {best:>9.2f} {rate:>9.2f} {rate / base:>7.2f}x")
+
+
+def bench_backends(image_path: str, psm: str, lang: str, repeats: int):
+    img = app.preprocess(Image.open(image_path))
+    print(f"{'backend':>12} {'first ms':>9} {'median ms':>10}")
+    for backend in ("pytesseract", "capi"):
+        if backend == "capi" and not app.tess_capi.available():
+            print(f"{backend:>12}  (libtesseract not found; set TESSERACT_LIB)")
+            continue
+        if backend == "pytesseract" and not shutil.which(app.pytesseract.pytesseract.tesseract_cmd):
+            print(f"{backend:>12}  (tesseract CLI not on PATH)")
+            continue
+        app.OCR_TESS_BACKEND = backend
+        timings = []
+        for _ in range(repeats + 1):
+            t0 = time.perf_counter()
+            app.ocr_tesseract_words(img, psm=psm, lang=lang)
+            timings.append((time.perf_counter() - t0) * 1000)
+        first, rest = timings[0], sorted(timings[1:])
+        print(f"{backend:>12} {first:>9.1f} {rest[len(rest) // 2]:>10.1f}")
+
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", default="workers", choices=["workers", "backends"])
+    parser.add_argument("--pdf", help="benchmark this PDF instead of a generated one")
+    parser.add_argument("--pages", type=int, default=16)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--pool", default="thread", choices=["thread", "process"])
+    parser.add_argument("--tess-threads", default="1")
+    parser.add_argument("--psm", default="6")
+    parser.add_argument("--lang", default="lat")
+    parser.add_argument("--repeats", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.mode == "backends":
+        bench_backends(os.path.join(here, "latin_test.png"), args.psm, args.lang, max(args.repeats, 3))
+        raise SystemExit(0)
+
+    if args.pdf:
+        with open(args.pdf, "rb") as f:
+            pdf_bytes = f.read()
+    else:
+        pdf_bytes = make_pdf(args.pages, os.path.join(here, "latin_test.png"))
+
+    bench_workers(pdf_bytes, args.max_workers, args.pool, args.tess_threads, args.psm, args.lang, args.repeats)
@@ -0,0 +1,88 @@
+import threading
+import time
+import uuid
+
+
+class JobStore:
+    """
+    In-memory registry of background OCR jobs.
+
+    A job is a plain dict (safe to return as JSON):
+      id, status ("queued" | "running" | "done" | "error"),
+      progress {"pages_done", "pages_total"}, pages (partial results),
+      text, translation, meta, error, created_at, finished_at.
+
+    Finished jobs are kept for `ttl_s` seconds after they finish; expired jobs
+    are evicted lazily whenever the store is touched. At most `max_jobs` jobs are
+    held at once, so a flood of submissions is refused instead of exhausting memory.
+    """
+
+    def __init__(self, ttl_s: float = 3600, max_jobs: int = 1000):
+        self.ttl_s = ttl_s
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self) -> dict | None:
+        """Register a new queued job; returns None when the store is full."""
+        with self._lock:
+            self._evict_expired()
+            if len(self._jobs) >= self.max_jobs:
+                return None
+            job = {
+                "id": uuid.uuid4().hex,
+                "status": "queued",
+                "progress": {"pages_done": 0, "pages_total": None},
+                "pages": [],
+                "text": None,
+                "translation": None,
+                "meta": None,
+                "error": None,
+                "created_at": time.time(),
+                "finished_at": None,
+            }
+            self._jobs[job["id"]] = job
+            return self._snapshot(job)
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            self._evict_expired()
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job else None
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if "progress" in fields:
+                job["progress"] = {**job["progress"], **fields.pop("progress")}
+            job.update(fields)
+            if job["status"] in ("done", "error") and job["finished_at"] is None:
+                job["finished_at"] = time.time()
+
+    def add_page(self, job_id: str, record: dict):
+        """Append one finished page and bump progress."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["pages"].append(record)
+            job["progress"] = {**job["progress"], "pages_done": len(job["pages"])}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.ttl_s
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] is not None and job["finished_at"] < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    @staticmethod
+    def _snapshot(job: dict) -> dict:
+        return {**job, "progress": dict(job["progress"]), "pages": list(job["pages"])}
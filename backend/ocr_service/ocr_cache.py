@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# Bump when preprocessing/recognition changes enough that old entries are stale.
+CACHE_VERSION = "2"
+# A full disk cache is trimmed to this share of its limit, so the puts after
+# an eviction don't each walk the directory again.
+DISK_LOW_WATER = 0.9
+
+
+def doc_key(file_bytes: bytes, params: tuple) -> str:
+    """Key for a whole upload: sha256 of its bytes plus the OCR parameters."""
+    h = hashlib.sha256()
+    h.update(f"doc|{CACHE_VERSION}|{params!r}|".encode())
+    h.update(file_bytes)
+    return h.hexdigest()
+
+
+def page_key(img, params: tuple) -> str:
+    """Key for one rendered page: sha256 of its pixels plus the OCR parameters."""
+    h = hashlib.sha256()
+    h.update(f"page|{CACHE_VERSION}|{params!r}|{img.mode}|{img.size}|".encode())
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU of JSON-able values, bounded by entry count."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskCache:
+    """
+    JSON files under `root`, sharded by the first two hex digits of the key.
+    When the directory grows past `max_bytes`, the least recently used files
+    (by mtime, refreshed on every read) are deleted until it is under
+    DISK_LOW_WATER of it. The size is re-read from disk on every eviction, as
+    other worker processes may share the directory.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+            return value
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, key: str, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value).encode("utf-8")
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        with self._lock:
+            try:
+                self._size -= os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp, path)
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        self._size = sum(size for _, size, _ in entries)
+        if self._size <= self.max_bytes:
+            return
+        for path, size, _ in entries:
+            if self._size <= self.max_bytes * DISK_LOW_WATER:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+            except FileNotFoundError:
+                pass
+
+    def size_bytes(self) -> int:
+        return self._size
+
+
+class OcrCache:
+    """
+    Two-tier cache: a memory LRU in front of an optional DiskCache.
+    Disk hits are promoted into memory.
+    """
+
+    def __init__(self, max_entries: int = 256, disk_dir: str = "", disk_max_bytes: int = 512 * 1024 * 1024):
+        self.memory = LRUCache(max_entries)
+        self.disk = DiskCache(disk_dir, disk_max_bytes) if disk_dir else None
+
+    def get(self, key: str):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        return value
+
+    def put(self, key: str, value):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
@@ -0,0 +1,302 @@
+"""
+In-process Tesseract through the libtesseract C API (ctypes).
+
+pytesseract writes a temp image, forks the tesseract CLI and reloads the
+traineddata for every call. Here each (lang, oem) keeps a pool of initialized
+TessBaseAPI handles and images are handed over as raw pixel buffers.
+recognize() walks the result iterator once and returns words and per-symbol
+boxes together.
+
+The library is located via TESSERACT_LIB, then ctypes.util.find_library.
+TESSDATA_PREFIX (or tesseract's compiled-in default) points at the traineddata.
+OpenMP reads OMP_THREAD_LIMIT once, when the library is loaded, so the thread
+limit has to be set (set_thread_limit) before the first recognition.
+"""
+import atexit
+import ctypes
+import ctypes.util
+import os
+import threading
+from contextlib import contextmanager
+
+from PIL import Image
+
+_lib = None
+_lib_error = None
+_lib_lock = threading.Lock()
+# OMP_THREAD_LIMIT when the library was loaded, the limit it runs with
+_thread_limit = None
+
+# TessPageIteratorLevel
+RIL_BLOCK, RIL_PARA, RIL_TEXTLINE, RIL_WORD, RIL_SYMBOL = range(5)
+
+
+def _load_library():
+    global _lib, _lib_error, _thread_limit
+    with _lib_lock:
+        if _lib is not None or _lib_error is not None:
+            return _lib
+        candidates = [os.getenv("TESSERACT_LIB"), ctypes.util.find_library("tesseract"), "libtesseract.so.5"]
+        for name in filter(None, candidates):
+            try:
+                lib = ctypes.CDLL(name)
+                break
+            except OSError as e:
+                _lib_error = e
+        else:
+            _lib_error = _lib_error or OSError("libtesseract not found")
+            return None
+
+        handle, char_p, c_int = ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int
+        signatures = {
+            "TessVersion": ([], char_p),
+            "TessBaseAPICreate": ([], handle),
+            "TessBaseAPIDelete": ([handle], None),
+            "TessBaseAPIInit2": ([handle, char_p, char_p, c_int], c_int),
+            "TessBaseAPISetVariable": ([handle, char_p, char_p], c_int),
+            "TessBaseAPIGetIntVariable": ([handle, char_p, ctypes.POINTER(c_int)], c_int),
+            "TessBaseAPIGetBoolVariable": ([handle, char_p, ctypes.POINTER(c_int)], c_int),
+            "TessBaseAPIGetDoubleVariable": ([handle, char_p, ctypes.POINTER(ctypes.c_double)], c_int),
+            "TessBaseAPIGetStringVariable": ([handle, char_p], char_p),
+            "TessBaseAPISetPageSegMode": ([handle, c_int], None),
+            "TessBaseAPISetImage": ([handle, ctypes.c_void_p, c_int, c_int, c_int, c_int], None),
+            "TessBaseAPISetSourceResolution": ([handle, c_int], None),
+            "TessBaseAPIRecognize": ([handle, ctypes.c_void_p], c_int),
+            "TessBaseAPIClear": ([handle], None),
+            "TessBaseAPIEnd": ([handle], None),
+            "TessDeleteText": ([ctypes.c_void_p], None),
+            "TessBaseAPIGetIterator": ([handle], ctypes.c_void_p),
+            "TessResultIteratorDelete": ([ctypes.c_void_p], None),
+            "TessResultIteratorGetPageIterator": ([ctypes.c_void_p], ctypes.c_void_p),
+            "TessResultIteratorNext": ([ctypes.c_void_p, c_int], c_int),
+            "TessResultIteratorGetUTF8Text": ([ctypes.c_void_p, c_int], ctypes.c_void_p),
+            "TessResultIteratorConfidence": ([ctypes.c_void_p, c_int], ctypes.c_float),
+            "TessPageIteratorIsAtBeginningOf": ([ctypes.c_void_p, c_int], c_int),
+            "TessPageIteratorBoundingBox": ([ctypes.c_void_p, c_int] + [ctypes.POINTER(c_int)] * 4, c_int),
+        }
+        for fn_name, (argtypes, restype) in signatures.items():
+            fn = getattr(lib, fn_name)
+            fn.argtypes = argtypes
+            fn.restype = restype
+        _lib = lib
+        _lib_error = None
+        _thread_limit = os.environ.get("OMP_THREAD_LIMIT")
+        return _lib
+
+
+def available() -> bool:
+    """True when libtesseract could be loaded."""
+    return _load_library() is not None
+
+
+def version() -> str:
+    lib = _load_library()
+    return lib.TessVersion().decode() if lib else ""
+
+
+def set_thread_limit(threads) -> bool:
+    """
+    OpenMP threads per in-process recognition. Before the library is loaded this
+    sets OMP_THREAD_LIMIT for it; afterwards the limit is fixed, and False means
+    the loaded library runs with a different one (a restart is needed).
+    """
+    with _lib_lock:
+        if _lib is None:
+            os.environ["OMP_THREAD_LIMIT"] = str(threads)
+            return True
+        return _thread_limit == str(threads)
+
+
+def _get_variable(api, name: str) -> str | None:
+    """Current value of a tesseract variable as SetVariable takes it, None if there is no such variable."""
+    number = ctypes.c_int()
+    if _lib.TessBaseAPIGetIntVariable(api, name.encode(), ctypes.pointer(number)):
+        return str(number.value)
+    if _lib.TessBaseAPIGetBoolVariable(api, name.encode(), ctypes.pointer(number)):
+        return str(number.value)
+    real = ctypes.c_double()
+    if _lib.TessBaseAPIGetDoubleVariable(api, name.encode(), ctypes.pointer(real)):
+        return repr(real.value)
+    text = _lib.TessBaseAPIGetStringVariable(api, name.encode())
+    return text.decode() if text is not None else None
+
+
+class EnginePool:
+    """
+    Idle TessBaseAPI handles per (lang, oem). A handle is only ever used by one
+    thread at a time; new handles are created on demand, so the pool grows to
+    the peak number of concurrent recognitions and then stays there.
+    Variables set through set_variable are put back to their previous values
+    when the handle is released, so one call's settings never leak into the next.
+    """
+
+    def __init__(self, datapath: str | None = None):
+        self.datapath = datapath
+        self._idle = {}
+        self._lock = threading.Lock()
+        # handle -> {variable: value before this acquire changed it}
+        self._changed = {}
+
+    def _create(self, lang: str, oem: str):
+        lib = _load_library()
+        if lib is None:
+            raise RuntimeError(f"libtesseract unavailable: {_lib_error}")
+        api = lib.TessBaseAPICreate()
+        datapath = self.datapath or os.getenv("TESSDATA_PREFIX")
+        rc = lib.TessBaseAPIInit2(api, datapath.encode() if datapath else None, lang.encode(), int(oem))
+        if rc != 0:
+            lib.TessBaseAPIDelete(api)
+            raise RuntimeError(f"TessBaseAPIInit2 failed for lang={lang!r} oem={oem!r}")
+        return api
+
+    @contextmanager
+    def acquire(self, lang: str, oem: str):
+        key = (lang, str(oem))
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            api = idle.pop() if idle else None
+        if api is None:
+            api = self._create(lang, oem)
+        try:
+            yield api
+        finally:
+            _lib.TessBaseAPIClear(api)
+            self._restore(api)
+            with self._lock:
+                self._idle.setdefault(key, []).append(api)
+
+    def set_variable(self, api, name: str, value) -> bool:
+        """SetVariable on an acquired handle, remembering the old value for release."""
+        changed = self._changed.setdefault(api, {})
+        if name not in changed:
+            previous = _get_variable(api, name)
+            if previous is None:
+                return False
+            changed[name] = previous
+        return bool(_lib.TessBaseAPISetVariable(api, name.encode(), str(value).encode()))
+
+    def _restore(self, api):
+        for name, value in self._changed.pop(api, {}).items():
+            _lib.TessBaseAPISetVariable(api, name.encode(), value.encode())
+
+    def size(self) -> int:
+        with self._lock:
+            return sum(len(v) for v in self._idle.values())
+
+    def reset(self):
+        """Forget all handles (after fork they belong to the parent)."""
+        with self._lock:
+            self._idle = {}
+            self._changed = {}
+
+    def close(self):
+        """End and free every idle handle."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for handles in idle.values():
+            for api in handles:
+                _lib.TessBaseAPIEnd(api)
+                _lib.TessBaseAPIDelete(api)
+
+
+engine_pool = EnginePool()
+atexit.register(engine_pool.close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=engine_pool.reset)
+
+
+def _set_image(api, img: Image.Image):
+    if img.mode not in ("L", "RGB"):
+        img = img.convert("RGB" if img.mode in ("RGBA", "P", "CMYK") else "L")
+    bpp = 1 if img.mode == "L" else 3
+    w, h = img.size
+    buf = img.tobytes()
+    _lib.TessBaseAPISetImage(api, buf, w, h, bpp, w * bpp)
+    return buf  # keep alive until recognition is done
+
+
+def _configure(api, psm: str, whitelist: str, variables: dict | None):
+    _lib.TessBaseAPISetPageSegMode(api, int(psm))
+    settings = {"tessedit_char_whitelist": whitelist or "", **(variables or {})}
+    for name, value in settings.items():
+        engine_pool.set_variable(api, name, value)
+
+
+def _take_text(ptr) -> str:
+    if not ptr:
+        return ""
+    try:
+        return ctypes.string_at(ptr).decode("utf-8", errors="replace")
+    finally:
+        _lib.TessDeleteText(ptr)
+
+
+def _run(api, img: Image.Image, psm: str, whitelist: str, variables: dict | None):
+    _configure(api, psm, whitelist, variables)
+    buf = _set_image(api, img)
+    dpi = (variables or {}).get("user_defined_dpi")
+    if dpi:
+        _lib.TessBaseAPISetSourceResolution(api, int(dpi))
+    if _lib.TessBaseAPIRecognize(api, None) != 0:
+        raise RuntimeError("TessBaseAPIRecognize failed")
+    del buf
+
+
+def _walk(ri) -> dict:
+    pi = _lib.TessResultIteratorGetPageIterator(ri)
+    coords = [ctypes.c_int() for _ in range(4)]
+    refs = [ctypes.byref(c) for c in coords]
+
+    def bbox(level):
+        if not _lib.TessPageIteratorBoundingBox(pi, level, *refs):
+            return (0, 0, 0, 0)
+        return tuple(c.value for c in coords)
+
+    words, symbols = [], []
+    block = par = line = word = 0
+    while True:
+        if _lib.TessPageIteratorIsAtBeginningOf(pi, RIL_BLOCK):
+            block, par, line, word = block + 1, 0, 0, 0
+        if _lib.TessPageIteratorIsAtBeginningOf(pi, RIL_PARA):
+            par, line, word = par + 1, 0, 0
+        if _lib.TessPageIteratorIsAtBeginningOf(pi, RIL_TEXTLINE):
+            line, word = line + 1, 0
+        if _lib.TessPageIteratorIsAtBeginningOf(pi, RIL_WORD):
+            word += 1
+            words.append({
+                "text": _take_text(_lib.TessResultIteratorGetUTF8Text(ri, RIL_WORD)).strip(),
+                "conf": float(_lib.TessResultIteratorConfidence(ri, RIL_WORD)),
+                "block": block, "par": par, "line": line, "word": word,
+                "box": bbox(RIL_WORD),
+            })
+        ch = _take_text(_lib.TessResultIteratorGetUTF8Text(ri, RIL_SYMBOL))
+        if ch.strip():
+            symbols.append({
+                "text": ch,
+                "conf": float(_lib.TessResultIteratorConfidence(ri, RIL_SYMBOL)),
+                "box": bbox(RIL_SYMBOL),
+                "word": len(words) - 1,
+            })
+        if not _lib.TessResultIteratorNext(ri, RIL_SYMBOL):
+            break
+    return {"words": words, "symbols": symbols}
+
+
+def recognize(img: Image.Image, lang: str = "lat", oem: str = "1", psm: str = "6",
+              whitelist: str = "", variables: dict | None = None) -> dict:
+    """
+    One recognition pass, one iterator walk:
+      {"words":   [{"text", "conf", "block", "par", "line", "word", "box"}],
+       "symbols": [{"text", "conf", "box", "word"}]}
+    Boxes are (left, top, right, bottom) in image pixels; symbol["word"] indexes `words`.
+    """
+    with engine_pool.acquire(lang, oem) as api:
+        _run(api, img, psm, whitelist, variables)
+        ri = _lib.TessBaseAPIGetIterator(api)
+        if not ri:
+            return {"words": [], "symbols": []}
+        try:
+            return _walk(ri)
+        finally:
+            _lib.TessResultIteratorDelete(ri)
+
@@ -3,8 +3,28 @@ import { useState, useCallback } from "react";
 
 /** Backend endpoint constants */
 const API_URL = "http://127.0.0.1:8000/ocr";
+const STREAM_URL = `${API_URL}/stream`;
 const PAGE_SEP = "\n\n--- page break ---\n\n";
 
+/** Yields parsed NDJSON records from a fetch Response as they arrive. */
+async function* readNdjson(res) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+    let nl;
+    while ((nl = buf.indexOf("\n")) >= 0) {
+      const line = buf.slice(0, nl).trim();
+      buf = buf.slice(nl + 1);
+      if (line) yield JSON.parse(line);
+    }
+  }
+  if (buf.trim()) yield JSON.parse(buf);
+}
+
 export default function App() {
   const [file, setFile] = useState(null);
   const [dragOver, setDragOver] = useState(false);
@@ -43,25 +63,39 @@ export default function App() {
       fd.append("psm", psmToUse);
       fd.append("lang", "lat");
 
-      const res = await fetch(API_URL, { method: "POST", body: fd });
+      const res = await fetch(STREAM_URL, { method: "POST", body: fd });
       if (!res.ok) {
         let detail = "";
         try { detail = (await res.json())?.detail || ""; } catch {}
         throw new Error(detail || `HTTP ${res.status}`);
       }
 
-      const j = await res.json();
-      const text = j?.text || "";
-      const pages = text.split(PAGE_SEP);
-      const meta = j?.meta || {};
-      const english = j?.translation || "";
-
-      setResult({
-        latin_raw: text,
-        english: english,
-        pages,
+      // Pages (and later their translations) are rendered as soon as they arrive
+      const pages = [];
+      const translations = [];
+      const show = (meta = {}) => setResult({
+        latin_raw: pages.join(PAGE_SEP),
+        english: translations.filter(Boolean).join("\n\n"),
+        pages: [...pages],
+        translations: [...translations],
         meta,
       });
+
+      for await (const rec of readNdjson(res)) {
+        if (rec.type === "page") {
+          pages[rec.page - 1] = rec.text || "";
+          setStatus(`Processing … page ${rec.page} done`);
+          show();
+        } else if (rec.type === "translation") {
+          translations[rec.page - 1] = rec.translation || "";
+          setStatus(`Processing … translated page ${rec.page}`);
+          show();
+        } else if (rec.type === "error") {
+          throw new Error(rec.detail || "OCR failed");
+        } else if (rec.type === "done") {
+          show(rec.meta || {});
+        }
+      }
       setStatus("Done");
     } catch (err) {
       setStatus(`Error: ${err.message}`);
@@ -145,6 +179,7 @@ export default function App() {
                 <div key={i} style={{ marginBottom: 16 }}>
                   {result.pages.length > 1 && <h3>Page {i + 1}</h3>}
                   <pre style={{ whiteSpace: "pre-wrap" }}>{p}</pre>
+                  {result.translations?.[i] && <p><i>{result.translations[i]}</i></p>}
                 </div>
               ))}
 
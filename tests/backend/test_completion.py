@@ -1,34 +1,13 @@
+import os
 import sys
 import types
 import numpy as np
 import pytest
 
 # ---------------------------------------------------------------------
-# Test-only stubs so we don't need sklearn or real TensorFlow.
+# Test-only stubs so we don't need real TensorFlow.
 # ---------------------------------------------------------------------
 
-# Fake modelCreation module so `import modelCreation` works in completion.py
-model_creation_stub = types.ModuleType("modelCreation")
-
-_SEQ_LEN = 32
-
-def _getSeqLen():
-    return _SEQ_LEN
-
-def _sequenceToInputFormat(text: str):
-    # Just return some fixed-size numeric array; details don't matter here.
-    return np.zeros((_SEQ_LEN,), dtype=float)
-
-def _decode(idx: int) -> str:
-    # Map index -> A..Z cycle
-    return chr(ord("A") + (idx % 26))
-
-model_creation_stub.getSeqLen = _getSeqLen
-model_creation_stub.sequenceToInputFormat = _sequenceToInputFormat
-model_creation_stub.decode = _decode
-
-sys.modules["modelCreation"] = model_creation_stub
-
 # Fake tensorflow module so `tf.keras.models.load_model(...)` works
 tf_stub = types.ModuleType("tensorflow")
 keras_stub = types.ModuleType("keras")
@@ -50,9 +29,27 @@ keras_stub.models = models_stub
 tf_stub.keras = keras_stub
 
 sys.modules["tensorflow"] = tf_stub
+# The stub can't trace graphs, so completion uses the keras model as is
+os.environ.setdefault("COMPLETION_TF_MODE", "eager")
 
 # Now import the real completion module (uses our stubs)
 import backend.completion.completion as completion_module
+from distributionCache import DistributionCache
+
+
+@pytest.fixture(autouse=True)
+def no_default_artifacts(monkeypatch, tmp_path):
+    """Tests don't pick up the generator.* artifacts a local build left next to the model."""
+    import corpusIndex
+    import ngramModel
+    import symSpell
+
+    monkeypatch.setenv("COMPLETION_CORPUS_INDEX", str(tmp_path / "no-index"))
+    monkeypatch.setattr(corpusIndex, "_defaultIndex", None)
+    monkeypatch.setenv("COMPLETION_LEXICON", str(tmp_path / "no-lexicon"))
+    monkeypatch.setattr(symSpell, "_defaultLexicon", None)
+    monkeypatch.setenv("COMPLETION_NGRAM", str(tmp_path / "no-ngram"))
+    monkeypatch.setattr(ngramModel, "_defaultModel", None)
 
 
 def test_getNextCharsVector_basic():
@@ -66,3 +63,491 @@ def test_getNextCharsVector_basic():
     assert isinstance(result, list)
     assert all(isinstance(c, str) for c in result)
     assert len(result) >= 1
+
+
+def test_parseThreshold_accepts_fractions_and_decimals():
+    assert completion_module.parseThreshold("1/32") == 1 / 32
+    assert completion_module.parseThreshold("0.03") == 0.03
+    with pytest.raises(ValueError):
+        completion_module.parseThreshold("1/0")
+
+
+def test_completionServer_rejects_bad_requests():
+    import json
+    import threading
+    import urllib.error
+    import urllib.request
+
+    from backend.completion.completionServer import makeServer
+
+    server = makeServer(lambda text, threshold: text, port=0, quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        for body in (b"not json", json.dumps({"threshold": "1/32"}).encode(), json.dumps({"text": "a", "threshold": "x"}).encode(),
+                     json.dumps({"text": "a", "mode": "beam"}).encode()):
+            with pytest.raises(urllib.error.HTTPError) as err:
+                urllib.request.urlopen(urllib.request.Request(base + "/correct", data=body))
+            assert err.value.code == 400
+        with urllib.request.urlopen(base + "/health") as resp:
+            assert json.loads(resp.read())["requests"] == 0
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_serveForked_gives_up_on_workers_that_die_at_startup(monkeypatch):
+    import time
+
+    import backend.completion.completionServer as completionServer
+
+    class CrashingServer:
+        closed = False
+
+        def serve_forever(self):
+            raise OSError("bad weights")
+
+        def server_close(self):
+            self.closed = True
+
+    # keep pytest's own signal handlers, and back off in milliseconds
+    monkeypatch.setattr(completionServer.signal, "signal", lambda *args: None)
+    monkeypatch.setattr(completionServer, "restartBackoffS", 0.05)
+    monkeypatch.setattr(completionServer, "maxQuickExits", 4)
+    server = CrashingServer()
+    start = time.monotonic()
+    with pytest.raises(SystemExit):
+        completionServer.serveForked(server, 2)
+    # 2 + 3 workers were forked, with 0.05 + 0.1 + 0.2 s between the restarts
+    assert time.monotonic() - start >= 0.35
+    assert server.closed
+
+
+def test_vocabulary_artifact_matches_training_encoding(tmp_path):
+    vocab = completion_module.vocabulary
+    assert vocab.sequenceLength == 32
+    assert vocab.vocab == sorted(vocab.vocab)
+
+    encoded = vocab.sequenceToInputFormat("arma 7uirumque")
+    assert encoded.shape == (1, 32, 2)
+    # Out-of-vocabulary characters are dropped, the rest is left-padded with spaces
+    text = "".join(vocab.decode(int(i)) for i in encoded[0, :, 0])
+    assert text == " " * 19 + "arma uirumque"
+    assert encoded[0, 0, 1] == -1.0 and encoded[0, -1, 1] == 1.0
+    with pytest.raises(ValueError):
+        vocab.sequenceToInputFormat("a" * 33)
+
+    from vocabulary import loadVocabulary, vocabFormatVersion
+
+    path = tmp_path / "generator.vocab.json"
+    vocab.save(str(path))
+    assert loadVocabulary(str(path)).vocab == vocab.vocab
+    path.write_text(path.read_text().replace(f'"version": {vocabFormatVersion}', '"version": 0'))
+    with pytest.raises(ValueError):
+        loadVocabulary(str(path))
+
+
+def test_encodeBatch_matches_sequenceToInputFormat():
+    vocab = completion_module.vocabulary
+    texts = ["", "a", "Maxima pars Graium Saturno et", "ab\U0001F600c\x00d", "x" * vocab.sequenceLength]
+    expected = np.concatenate([vocab.sequenceToInputFormat(t) for t in texts])
+
+    batch = vocab.encodeBatch(texts)
+    assert batch.dtype == np.float32 and batch.flags["C_CONTIGUOUS"]
+    np.testing.assert_array_equal(batch, expected.astype(np.float32))
+    # the buffer is reused, a caller-provided one gets the location channel too
+    assert np.shares_memory(vocab.encodeBatch(texts[:2]), batch)
+    out = np.zeros((len(texts), vocab.sequenceLength, 2), dtype=np.float32)
+    np.testing.assert_array_equal(vocab.encodeBatch(texts, out=out), expected.astype(np.float32))
+    with pytest.raises(ValueError):
+        vocab.encodeBatch(["a", "x" * (vocab.sequenceLength + 1)])
+
+
+class _TrigramModel:
+    """
+    Deterministic stand-in for generator.keras: next-char distribution from
+    corpus trigram counts of the last two characters of each window, row by
+    row, so results do not depend on how windows are batched.
+    """
+
+    def __init__(self, vocab, text):
+        self.vocab = vocab
+        size = vocab.vocabSize
+        self.counts = {}
+        encoded = vocab.encode(text)
+        for a, b, c in zip(encoded, encoded[1:], encoded[2:]):
+            self.counts.setdefault((a, b), np.full(size, 0.05))[c] += 1
+        self.calls = 0
+        self.rows = 0
+
+    def __call__(self, x):
+        self.calls += 1
+        self.rows += len(x)
+        out = []
+        for window in np.asarray(x)[:, :, 0].astype(int):
+            counts = self.counts.get((window[-2], window[-1]))
+            if counts is None:
+                counts = np.ones(self.vocab.vocabSize)
+            out.append(counts / counts.sum())
+        return np.array(out)
+
+
+def _corrupt(text, seed):
+    rng = np.random.default_rng(seed)
+    chars = list(text)
+    for _ in range(max(1, len(chars) // 25)):
+        pos = int(rng.integers(1, len(chars) - 1))
+        op = rng.integers(3)
+        if op == 0:
+            chars[pos] = "xqzk"[int(rng.integers(4))]
+        elif op == 1:
+            del chars[pos]
+        else:
+            chars.insert(pos, "e")
+    return "".join(chars)
+
+
+def test_batched_textCorrection_matches_reference(monkeypatch):
+    import os
+
+    corpus_path = os.path.join(os.path.dirname(completion_module.__file__), "trainingData", "latinCorpusCleaned.txt")
+    with open(corpus_path, encoding="utf-8") as f:
+        corpus = f.read(150_000)
+    fake = _TrigramModel(completion_module.vocabulary, corpus)
+    monkeypatch.setattr(completion_module, "model", fake)
+    monkeypatch.setattr(completion_module, "distributionCache", DistributionCache(maxEntries=0))
+
+    samples = [corpus[k * 7919 % 100_000:][:60 + 15 * (k % 8)] for k in range(16)]
+    regression = [_corrupt(s, seed) for seed, s in enumerate(samples)]
+    regression.append("Maxima pars Graium Saturno et maxKme AthKnae")
+
+    # The reference is the original loop as it was: its case c unpacks the candidate list into two names and
+    # raises ValueError (IndexError when nothing reaches the threshold). Batching with the original repairs must
+    # give the same text wherever it doesn't, and raise where it does.
+    reference_calls = batched_calls = compared = 0
+    for threshold in (1 / 32, 0.001):
+        for text in regression:
+            fake.calls = 0
+            try:
+                expected = completion_module.textCorrectionReference(text, threshold)
+            except (ValueError, IndexError) as e:
+                with pytest.raises(type(e)):
+                    completion_module.textCorrection(text, threshold, repair=completion_module.originalRepair)
+                continue
+            reference_calls += fake.calls
+            fake.calls = 0
+            assert completion_module.textCorrection(text, threshold, repair=completion_module.originalRepair) == expected, text
+            batched_calls += fake.calls
+            compared += 1
+    assert compared >= 8
+    assert batched_calls * 5 < reference_calls
+
+
+def test_repairPosition_changes_text_only_at_the_position(monkeypatch):
+    corpus = "maxima pars graium saturno et maxime athenae " * 20
+    monkeypatch.setattr(completion_module, "model", _TrigramModel(completion_module.vocabulary, corpus))
+    repair = completion_module.repairPosition
+    text = "maxima pars grum saturno"
+    i = text.index("um")
+    sequenceText, threshold = completion_module.getSequenceText(text, i, 1 / 32)
+    nextChars = completion_module.getNextCharsVector(completion_module.predictBatch([sequenceText])[0], threshold)
+    assert nextChars == ["a"]
+    # case c: the missing characters are generated until text[i] is predicted after them
+    assert repair(text, i, sequenceText, threshold, nextChars, "m", None) == "maxima pars graium saturno"
+    # case a replaces text[i], case b deletes only text[i], and without candidates nothing changes
+    assert repair(text, i, sequenceText, threshold, nextChars, "m", "a") == "maxima pars gram saturno"
+    assert repair(text, i, sequenceText, threshold, ["m"], "m", None) == "maxima pars grm saturno"
+    assert repair(text, i, sequenceText, threshold, [], "m", None) == text
+
+
+def test_distribution_cache_keeps_results_and_saves_forward_passes(monkeypatch):
+    text = "Maxima pars Graium Saturno et maxKme AthKnae"
+    corpus = "maxima pars graium saturno et maxime athenae " * 20
+    fake = _TrigramModel(completion_module.vocabulary, corpus)
+    monkeypatch.setattr(completion_module, "model", fake)
+    monkeypatch.setattr(completion_module, "inferenceBatchSize", 8)
+
+    for threshold in (1 / 32, 0.001):
+        monkeypatch.setattr(completion_module, "distributionCache", DistributionCache(maxEntries=0))
+        expected = completion_module.textCorrection(text, threshold)
+        # topK=2 keeps too few characters for most lookups, which must then go to the model
+        for cache in (DistributionCache(maxEntries=10_000, topK=2), DistributionCache(maxEntries=10_000)):
+            monkeypatch.setattr(completion_module, "distributionCache", cache)
+            fake.rows = 0
+            assert completion_module.textCorrection(text, threshold) == expected
+            first = fake.rows
+            fake.rows = 0
+            assert completion_module.textCorrection(text, threshold) == expected
+            if cache.topK == 32 and threshold == 1 / 32:
+                # only the first windows, whose thresholds are scaled down, miss
+                assert fake.rows * 10 < first
+
+    stats = cache.stats()
+    assert stats["hits"] > 0 and stats["uncovered"] > 0  # at 0.001 most of the vocab is above the threshold
+    assert 0 < stats["hitRatio"] <= 1 and stats["bytes"] > 0
+
+
+def test_distribution_cache_evicts_least_recently_used():
+    cache = DistributionCache(maxEntries=2, topK=2)
+    cache.put("a", np.array([0.5, 0.3, 0.2]))
+    cache.put("b", np.array([0.1, 0.1, 0.8]))
+    assert list(cache.get("a", 0.4)) == [0]
+    # the unkept 0.2 could be anything up to 0.3, so lower thresholds are not covered
+    assert cache.get("a", 0.25) is None
+    cache.put("c", np.array([0.2, 0.2, 0.6]))
+    assert cache.get("b", 0.5) is None
+    assert list(cache.get("c", 0.3)) == [2]
+    assert cache.stats()["entries"] == 2
+
+
+def test_correctSpans_only_checks_suspect_spans(monkeypatch):
+    corpus = "maxima pars graium saturno et maxime athenae " * 20
+    fake = _TrigramModel(completion_module.vocabulary, corpus)
+    monkeypatch.setattr(completion_module, "model", fake)
+    monkeypatch.setattr(completion_module, "distributionCache", DistributionCache(maxEntries=0))
+
+    text = "maxima pars graium saturno et maxkme athenae maxima pars graium"
+    full = completion_module.textCorrection(text, 1 / 32)
+    fake.rows = 0
+    start = text.index("maxkme")
+    corrected, checked = completion_module.correctSpans(text, 1 / 32, [(start, start + 6)])
+    assert corrected == full == text.replace("maxkme", "maxime")
+    assert checked == 6 + 2 * completion_module.spanMargin
+    assert fake.rows < len(text) / 2
+
+    # repairs that change the length stay inside the span, the confident text around it comes back as it was
+    text = "maxima pars graium saturno et maxiime athenae maxima pars"
+    start, end = text.index("maxiime"), text.index("maxiime") + 7
+    corrected, _ = completion_module.correctSpans(text, 1 / 32, [(start, end)])
+    assert corrected.startswith(text[:start]) and corrected.endswith(text[end:])
+    assert corrected == text.replace("maxiime", "maxime")
+
+
+def test_beamCorrection_repairs_edits_and_fills_lacunae(monkeypatch):
+    import beamDecoder
+
+    corpus = "maxima pars graium saturno et maxime athenae " * 20
+    fake = _TrigramModel(completion_module.vocabulary, corpus)
+    monkeypatch.setattr(completion_module, "model", fake)
+
+    cases = {
+        "maxima pars graium saturno et maxkme athenae": ("maxima pars graium saturno et maxime athenae", "substitution"),
+        "maxima pars graum saturno": ("maxima pars graium saturno", "insertion"),
+        "maxima pars graiuum saturno": ("maxima pars graium saturno", "deletion"),
+        "maxima pars gr?ium saturno": ("maxima pars graium saturno", "fill"),
+        "maxima pars gr[...]um saturno": ("maxima pars graium saturno", "fill"),
+    }
+
+    with pytest.raises(ValueError):
+        completion_module.beamCorrection("maxima pars gr[...]um saturno", beamWidth=4, maxInsert=0)
+    assert completion_module.beamCorrection("maxima pars graium", beamWidth=4, maxInsert=0)["text"] == "maxima pars graium"
+
+    # only a '?' inside a word is a lacuna, a question mark stays a character
+    assert [kind for kind, _, _ in beamDecoder.tokenize("gr?ium")].count("one") == 1
+    assert [kind for kind, _, _ in beamDecoder.tokenize("graium? ?? a?")].count("one") == 0
+    for text, (expected, kind) in cases.items():
+        fake.rows = 0
+        result = completion_module.beamCorrection(text, beamWidth=4, maxInsert=2)
+        assert result["text"] == expected
+        assert {edit["kind"] for edit in result["edits"]} == {kind}
+        assert all(0 < edit["prob"] <= 1 for edit in result["edits"])
+        # at most maxInsert + 1 passes of beamWidth windows per character
+        assert fake.rows <= len(text) * 4 * 3
+
+
+def test_beamCorrection_keeps_clean_text(monkeypatch):
+    vocab = completion_module.vocabulary
+    corpus = "Gallia est omnis divisa in partes tres, quarum unam incolunt Belgae. " * 20
+    monkeypatch.setattr(completion_module, "model", _TrigramModel(vocab, corpus))
+    for text in ("Gallia est omnis divisa in partes tres", "quarum unam incolunt Belgae."):
+        result = completion_module.beamCorrection(text)
+        assert (result["text"], result["edits"]) == (text, [])
+
+    # a model sure of one character, or one without an opinion, doesn't rewrite what was read either
+    peaked = np.full(vocab.vocabSize, 0.1 / (vocab.vocabSize - 1))
+    peaked[vocab.charToInt["e"]] = 0.9
+    for probs in (peaked, np.full(vocab.vocabSize, 1 / vocab.vocabSize)):
+        monkeypatch.setattr(completion_module, "model", lambda x, probs=probs: np.tile(probs, (len(x), 1)))
+        assert completion_module.beamCorrection("Gallia est omnis divisa")["text"] == "Gallia est omnis divisa"
+        filled = completion_module.beamCorrection("ma?ime")["text"]
+        assert len(filled) == 6 and filled[:2] + filled[3:] == "maime"
+
+
+def test_corpusIndex_answers_wildcard_prefix_and_suffix_queries(tmp_path, monkeypatch):
+    import corpusIndex
+
+    rng = np.random.default_rng(0)
+    ids = rng.integers(0, 3, size=500).astype(np.uint8)
+    suffixes = corpusIndex.buildSuffixArray(ids)
+    text = ids.tobytes()
+    assert list(suffixes) == sorted(range(len(ids)), key=lambda i: text[i:])
+
+    corpus = tmp_path / "corpus.txt"
+    corpus.write_text("Maxime Athenae, maxime uero maxima. Athenis maxime Athenae sunt. Romae\n", encoding="utf-8")
+    index = corpusIndex.CorpusIndex(corpusIndex.buildIndex(str(corpus), str(tmp_path / "index")))
+    assert index.count("maxim") == 3
+    assert index.candidates("ma?ime") == [("maxime", 2)]
+    assert index.candidates("max?m?") == [("maxime", 2), ("maxima", 1)]
+    assert index.candidates("Ath*") == [("Athenae", 2), ("Athenis", 1)]
+    assert index.candidates("*ae") == [("Athenae", 2), ("Romae", 1)]
+    assert index.candidates("axim") == [] and index.candidates("q?q") == []
+
+    # beamCorrection fills lacunae the corpus is sure about before the model runs
+    monkeypatch.setattr(corpusIndex, "_defaultIndex", index)
+    filled, edits = completion_module.fillFromCorpus("uero ma?ime Ath?nae max?m?")
+    assert filled == "uero maxime Athenae max?m?"  # the last '?' is a question mark, and no word is max?m
+    assert [(e["position"], e["char"], e["prob"], e["source"]) for e in edits] == [(7, "x", 1.0, "corpus"), (15, "e", 1.0, "corpus")]
+    # a piece found more often than maxOccurrences is checked on an even sample of its occurrences
+    monkeypatch.setattr(corpusIndex, "maxOccurrences", 2)
+    assert len(index.findAll("maxim")) == 2
+
+
+def test_symSpell_lexicon_ranks_corrections_and_fixes_single_substitutions(tmp_path, monkeypatch):
+    import symSpell
+
+    assert symSpell.editDistance("maxKme", "maxime") == 1
+    assert symSpell.editDistance("Athenae", "Atheane") == 1  # swapped letters
+    assert symSpell.editDistance("uero", "Romae") == 3  # capped at limit + 1
+
+    corpus = tmp_path / "corpus.txt"
+    corpus.write_text("Maxime Athenae, maxime uero maxima. Athenis maxime Athenae sunt. maxume\n", encoding="utf-8")
+    lexicon = symSpell.Lexicon(symSpell.buildLexicon(str(corpus), str(tmp_path / "lexicon")))
+    assert lexicon.count("maxime") == 2 and lexicon.count("maxKme") == 0
+    assert lexicon.lookup("maxKme") == [("maxime", 1, 2), ("maxume", 1, 1), ("Maxime", 2, 1), ("maxima", 2, 1)]
+    assert lexicon.lookup("sunt", 0) == [("sunt", 0, 1)]
+    assert lexicon.fixSubstitution("maxKme", share=0.6) == ("maxime", 2 / 3)
+    assert lexicon.fixSubstitution("maxKme") is None  # maxume is too likely as well
+    assert lexicon.fixSubstitution("AthKnae") == ("Athenae", 1.0)
+    assert lexicon.fixSubstitution("Atheane") is None  # a swap, not a substitution
+    assert lexicon.fixSubstitution("maxime") is None and lexicon.fixSubstitution("uxxo") is None
+
+    # the pre-pass keeps the length, skips words at lacunae and can be limited to spans
+    monkeypatch.setattr(symSpell, "_defaultLexicon", lexicon)
+    monkeypatch.setattr(completion_module, "lexiconShare", 0.6)
+    fixed, edits = completion_module.lexiconPass("uero maxKme? AthKnae?ne AthKnae")
+    assert fixed == "uero maxime? AthKnae?ne Athenae"
+    assert [(e["position"], e["observed"], e["char"], e["source"]) for e in edits] == [(8, "K", "i", "lexicon"), (27, "K", "e", "lexicon")]
+    assert completion_module.lexiconPass("uero maxKme AthKnae", spans=[(14, 16)])[0] == "uero maxKme Athenae"
+    assert completion_module.lexiconPass("uero maxKme AthKnae", spans=[(12, 14)])[0] == "uero maxKme AthKnae"
+
+
+def test_ngramModel_smooths_counts_and_prefilters_textCorrection(tmp_path, monkeypatch):
+    import ngramModel
+
+    corpus = "maxima pars graium saturno et maxime athenae " * 20
+    ngrams = ngramModel.NgramModel(ngramModel.buildModel(modelPath=str(tmp_path / "ngram"), text=corpus, order=4))
+    assert ngrams.order == 4
+    dists = ngrams.distributions(["maxim", "", "zzz", "athena"])
+    assert np.allclose(dists.sum(axis=1), 1) and (dists > 0).all()
+    vocab = completion_module.vocabulary
+    assert vocab.vocab[dists[0].argmax()] in "ae" and dists[3][vocab.charToInt["e"]] > 0.9
+    # "zzz" was never seen, so the unigram estimate is used
+    assert np.allclose(dists[2], dists[1])
+    p = ngrams.probabilities(["maxim", "maxim", "maxim"], ["a", "k", "\u2603"])
+    assert p[0] > 0.4 and p[1] < 0.01 and p[2] == 0
+
+    # positions the n-gram model is sure of never reach the transformer, the repair still happens
+    fake = _TrigramModel(vocab, corpus)
+    monkeypatch.setattr(completion_module, "model", fake)
+    monkeypatch.setattr(completion_module, "distributionCache", DistributionCache(maxEntries=0))
+    text = "maxima pars graium saturno et maxkme athenae maxima pars graium"
+    expected = completion_module.textCorrection(text, 1 / 32)
+    unfiltered = fake.rows
+    monkeypatch.setattr(ngramModel, "_defaultModel", ngrams)
+    fake.rows = 0
+    assert completion_module.textCorrection(text, 1 / 32) == expected == text.replace("maxkme", "maxime")
+    assert fake.rows * 2 < unfiltered
+    monkeypatch.setattr(completion_module, "ngramAccept", 0)
+    fake.rows = 0
+    assert completion_module.textCorrection(text, 1 / 32) == expected and fake.rows == unfiltered
+
+
+def _random_generator_weights(vocab_size, seq_len=32, dim=8, heads=2, key_dim=4, seed=0):
+    """Random weights in numpyModel's layout for a small buildModel-shaped network."""
+    import numpyModel
+
+    rng = np.random.default_rng(seed)
+    shapes = {
+        "projectionKernel": (2, dim), "projectionBias": (dim,),
+        "queryKernel": (dim, heads, key_dim), "queryBias": (heads, key_dim),
+        "keyKernel": (dim, heads, key_dim), "keyBias": (heads, key_dim),
+        "valueKernel": (dim, heads, key_dim), "valueBias": (heads, key_dim),
+        "attentionOutputKernel": (heads, key_dim, dim), "attentionOutputBias": (dim,),
+        "norm1Gamma": (dim,), "norm1Beta": (dim,),
+        "feedForwardAKernel": (dim, dim), "feedForwardABias": (dim,),
+        "feedForwardBKernel": (dim, dim), "feedForwardBBias": (dim,),
+        "norm2Gamma": (dim,), "norm2Beta": (dim,),
+        "outputKernel": (seq_len * dim, vocab_size), "outputBias": (vocab_size,),
+    }
+    weights = {name: rng.normal(size=shape).astype(np.float32) for name, shape in shapes.items()}
+    weights["layerNormEpsilon"] = np.float32(1e-3)
+    weights["formatVersion"] = np.int32(numpyModel.weightsFormatVersion)
+    return weights
+
+
+def test_numpy_backend_runs_batches_without_tensorflow(tmp_path):
+    vocab = completion_module.vocabulary
+    path = tmp_path / "generator.npz"
+    np.savez(path, **_random_generator_weights(vocab.vocabSize))
+
+    model, backend = completion_module.loadModel("auto", str(path))
+    assert backend == "numpy"
+    batch = np.concatenate([vocab.sequenceToInputFormat(t) for t in ("arma", "uirumque cano", "")])
+    out = model(batch)
+    assert out.shape == (3, vocab.vocabSize)
+    assert np.allclose(out.sum(axis=1), 1.0, atol=1e-5)
+    # Each row is independent of the rest of the batch
+    assert np.allclose(model(batch[1:2])[0], out[1], atol=1e-6)
+
+
+def test_numpy_weights_directory_is_memory_mapped(tmp_path):
+    import numpyModel
+
+    weights = _random_generator_weights(completion_module.vocabulary.vocabSize)
+    numpyModel.saveWeights(weights, str(tmp_path / "generator.npz"))
+    numpyModel.saveWeights(weights, str(tmp_path / "generator.weights"))
+
+    mapped = numpyModel.loadWeights(str(tmp_path / "generator.weights"))
+    assert isinstance(mapped["outputKernel"], np.memmap)
+    assert not mapped["outputKernel"].flags.writeable
+
+    model = numpyModel.NumpyModel(mapped)
+    # The model only keeps views of the mapped arrays, never private copies
+    assert all(np.shares_memory(kernel, mapped[name]) for name, (kernel, _) in model.kernels.items())
+
+    x = completion_module.vocabulary.sequenceToInputFormat("arma uirumque")
+    assert np.array_equal(model(x), numpyModel.loadNumpyModel(str(tmp_path / "generator.npz"))(x))
+
+
+def test_int8_variant_keeps_per_channel_error_within_half_a_step(tmp_path):
+    import numpyModel
+
+    weights = _random_generator_weights(completion_module.vocabulary.vocabSize)
+    quantized = numpyModel.quantizeWeights(weights)
+    assert quantized["outputKernel"].dtype == np.int8
+    # one scale per output unit: per (head, keyDim) for query/key/value, per model dim for attentionOutput
+    assert quantized["queryKernelScale"].shape == weights["queryKernel"].shape[1:]
+    assert quantized["attentionOutputKernelScale"].shape == weights["attentionOutputKernel"].shape[2:]
+    assert quantized["outputKernelScale"].shape == weights["outputKernel"].shape[1:]
+    assert np.allclose(quantized["queryKernelScale"], np.abs(weights["queryKernel"]).max(axis=0) / 127)
+
+    for name in ("outputKernel", "queryKernel", "attentionOutputKernel"):
+        step = quantized[name + "Scale"]
+        assert np.all(np.abs(quantized[name] * step - weights[name]) <= step / 2 + 1e-6)
+
+    # loaded from a directory the kernels stay int8 and mapped, the model runs on them
+    numpyModel.saveWeights(quantized, str(tmp_path / "generator.int8.weights"))
+    restored = numpyModel.loadWeights(str(tmp_path / "generator.int8.weights"))
+    assert set(restored) == set(quantized)
+    assert isinstance(restored["outputKernel"], np.memmap) and restored["outputKernel"].dtype == np.int8
+    model = numpyModel.NumpyModel(restored)
+    assert all(np.shares_memory(kernel, restored[name]) for name, (kernel, _) in model.kernels.items())
+
+    x = completion_module.vocabulary.sequenceToInputFormat("arma uirumque cano")
+    float_probs = numpyModel.NumpyModel(weights)(x)
+    int8_probs = model(x)
+    assert np.abs(float_probs - int8_probs).max() < 0.05
+    # the same as running the float model on the dequantized kernels
+    dequantized = {name: quantized[name] * quantized[name + "Scale"] if name + "Scale" in quantized else array
+                   for name, array in quantized.items() if not name.endswith("Scale")}
+    assert np.allclose(int8_probs, numpyModel.NumpyModel(dequantized)(x), atol=1e-5)
@@ -1,5 +1,7 @@
 # tests/backend/test_ocr_service.py
 
+import os
+
 import pytest
 from PIL import Image
 from fastapi.testclient import TestClient
@@ -7,6 +9,15 @@ from fastapi.testclient import TestClient
 import backend.ocr_service.app as ocr_service
 
 
+@pytest.fixture(autouse=True)
+def fresh_ocr_cache(monkeypatch):
+    """Every test starts with an empty, memory-only result cache (and the mockable pytesseract backend)."""
+    cache = ocr_service.OcrCache(max_entries=64, disk_dir="")
+    monkeypatch.setattr(ocr_service, "ocr_cache", cache)
+    monkeypatch.setattr(ocr_service, "OCR_TESS_BACKEND", "pytesseract")
+    return cache
+
+
 def test_ping_endpoint_works():
     """Basic smoke test for the OCR FastAPI app."""
     app_instance = getattr(ocr_service, "app", None)
@@ -18,41 +29,525 @@ def test_ping_endpoint_works():
     assert resp.status_code == 200
 
 
+def _hocr(lines, conf=90):
+    """Tiny hOCR page: lines -> words -> (char, (l, t, r, b)) with x_wconf `conf`."""
+    out = ["<div class='ocr_page'><div class='ocr_carea'><p class='ocr_par'>"]
+    for words in lines:
+        out.append("<span class='ocr_line' title='bbox 0 0 100 10'>")
+        for chars in words:
+            out.append(f"<span class='ocrx_word' title='bbox 0 0 10 10; x_wconf {conf}'>")
+            for ch, box in chars:
+                out.append(f"<span class='ocrx_cinfo' title='x_bboxes {' '.join(map(str, box))}; x_conf 95.5'>{ch}</span>")
+            out.append("</span> ")
+        out.append("</span>")
+    out.append("</p></div></div>")
+    return "".join(out).encode()
+
+
 @pytest.mark.parametrize("mode", ["normal", "fallback"])
 def test_ocr_tesseract_words_modes(monkeypatch, mode):
     """Exercise ocr_tesseract_words with mocked Tesseract in both normal and fallback cases."""
     img = Image.new("RGB", (10, 10))
+    calls = []
 
-    def fake_image_to_data(*args, **kwargs):
+    def fake_image_to_pdf_or_hocr(*args, **kwargs):
+        calls.append(kwargs["config"])
         if mode == "normal":
-            # "Normal" TSV output with real words
-            return {
-                "text": ["lorem", "ipsum"],
-                "conf": [90, 95],
-                "block_num": [0, 0],
-                "par_num": [1, 1],
-                "line_num": [1, 1],
-                "word_num": [1, 2],
-            }
-        else:
-            # Collapsed TSV that should force internal fallback path
-            return {
-                "text": [""],
-                "conf": [-1],
-                "block_num": [0],
-                "line_num": [0],
-                "word_num": [0],
-            }
-
-    def fake_image_to_boxes(*args, **kwargs):
-        # Simple char-box fallback
-        return "a 0 0 5 5 0\nb 0 0 5 5 0"
+            # "Normal" output with real words
+            return _hocr([[
+                [(c, (i * 6, 0, i * 6 + 5, 5)) for i, c in enumerate("lorem")],
+                [(c, (40 + i * 6, 0, 45 + i * 6, 5)) for i, c in enumerate("ipsum")],
+            ]])
+        # Collapsed output (one glued token) that should force the internal fallback path
+        return _hocr([[[("a", (0, 0, 5, 5)), ("b", (0, 0, 5, 5))]]])
 
     # Patch pytesseract inside the ocr_service module
-    monkeypatch.setattr("backend.ocr_service.app.pytesseract.image_to_data", fake_image_to_data)
-    monkeypatch.setattr("backend.ocr_service.app.pytesseract.image_to_boxes", fake_image_to_boxes)
+    monkeypatch.setattr("backend.ocr_service.app.pytesseract.image_to_pdf_or_hocr", fake_image_to_pdf_or_hocr)
 
     text = ocr_service.ocr_tesseract_words(img)
 
     assert isinstance(text, str)
     assert text.strip() != ""
+    assert all("hocr_char_boxes=1" in cfg for cfg in calls)
+    # Words and char boxes come from the same pass; only a collapsed page gets a PSM 6 retry
+    assert len(calls) == (1 if mode == "normal" else 2)
+
+
+@pytest.mark.parametrize("conf, expect_chars", [(92, False), (41, True)])
+def test_char_fallback_only_runs_on_suspect_pages(monkeypatch, conf, expect_chars):
+    """Clean pages skip the char-box comparison; low-confidence pages run it and say why."""
+    words = [
+        [(c, (i * 6, 0, i * 6 + 5, 5)) for i, c in enumerate("lorem")],
+        [(c, (40 + i * 6, 0, 45 + i * 6, 5)) for i, c in enumerate("ipsum")],
+    ]
+    monkeypatch.setattr(
+        "backend.ocr_service.app.pytesseract.image_to_pdf_or_hocr", lambda *a, **k: _hocr([words], conf=conf)
+    )
+
+    meta = {}
+    text = ocr_service.ocr_tesseract_words(Image.new("L", (100, 10)), psm="7", meta=meta)
+
+    assert text == "lorem ipsum"
+    assert meta["passes"][0] == {"pass": "words", "psm": "7"}
+    if expect_chars:
+        assert [p["pass"] for p in meta["passes"]] == ["words", "chars"]
+        assert "confidence" in meta["passes"][1]["reason"]
+    else:
+        assert len(meta["passes"]) == 1
+
+
+def test_parse_hocr_keeps_hierarchy_confidences_and_char_boxes():
+    result = ocr_service.parse_hocr(_hocr([
+        [[("G", (1, 2, 3, 4)), ("a", (4, 2, 6, 4))], [("e", (9, 2, 11, 4))]],
+        [[("x", (1, 12, 3, 14))]],
+    ]))
+    assert [(w["text"], w["line"], w["word"], w["conf"]) for w in result["words"]] == [
+        ("Ga", 1, 1, 90.0), ("e", 1, 2, 90.0), ("x", 2, 1, 90.0),
+    ]
+    assert [(c["text"], c["box"], c["word"]) for c in result["symbols"][:2]] == [
+        ("G", (1, 2, 3, 4), 0), ("a", (4, 2, 6, 4), 0),
+    ]
+    assert ocr_service._rebuild_from_words(result["words"]) == (3, "Ga e\nx")
+
+    words = [dict(w, conf=c) for w, c in zip(result["words"], (90.0, 20.0, 10.0))]
+    spans = []
+    _, joined = ocr_service._rebuild_from_words(words, spans)
+    assert [joined[a:b] for a, b in spans] == ["e", "x"]
+
+
+def test_pdf_pages_ocr_in_parallel_keep_page_order(monkeypatch):
+    """Pages finish out of order on the pool but come back in page order."""
+    import random
+    import time
+
+    images = [Image.new("RGB", (10 + i, 10)) for i in range(6)]
+
+    def fake_ocr_image_pil(img, **kwargs):
+        time.sleep(random.uniform(0, 0.02))
+        return f"page-{img.size[0] - 10}"
+
+    monkeypatch.setattr(ocr_service, "iter_pdf_pages", lambda *a, **k: iter(images))
+    monkeypatch.setattr(ocr_service, "ocr_image_pil", fake_ocr_image_pil)
+    prev_workers, prev_pool = ocr_service.OCR_WORKERS, ocr_service.OCR_POOL
+    ocr_service.configure_page_pool(workers=4, pool="thread")
+    try:
+        text, meta = ocr_service.ocr_bytes_auto(b"%PDF", "doc.pdf", psm="6", lang="lat", engine="tesseract")
+    finally:
+        ocr_service.configure_page_pool(workers=prev_workers, pool=prev_pool)
+
+    assert text.split(ocr_service.PAGE_SEP) == [f"page-{i}" for i in range(6)]
+    assert meta["pages"] == 6
+    assert len(meta["per_page_ms"]) == 6
+    assert meta["workers"] == 4
+
+
+def test_iter_pdf_pages_renders_lazily_in_windows(monkeypatch):
+    """The rasterizer asks pdftoppm for one small window of pages at a time."""
+    import os
+
+    calls = []
+
+    def fake_convert_from_path(pdf_path, dpi, first_page, last_page, output_folder, **kwargs):
+        calls.append((first_page, last_page))
+        paths = []
+        for n in range(first_page, last_page + 1):
+            path = os.path.join(output_folder, f"page-{n:03d}.ppm")
+            Image.new("RGB", (n, 5)).save(path)
+            paths.append(path)
+        return paths
+
+    monkeypatch.setattr(ocr_service, "pdfinfo_from_path", lambda path: {"Pages": 5})
+    monkeypatch.setattr(ocr_service, "convert_from_path", fake_convert_from_path)
+
+    pages = ocr_service.iter_pdf_pages(b"%PDF", batch=2)
+    first = next(pages)
+    assert first.size == (1, 5)
+    assert calls == [(1, 2)]
+
+    rest = list(pages)
+    assert [img.size[0] for img in rest] == [2, 3, 4, 5]
+    assert calls == [(1, 2), (3, 4), (5, 5)]
+
+
+def test_ocr_stream_emits_pages_then_translations(monkeypatch):
+    """/ocr/stream sends one NDJSON record per page, then per-page translations."""
+    import json
+
+    images = [Image.new("RGB", (10 + i, 10)) for i in range(3)]
+    monkeypatch.setattr(ocr_service, "iter_pdf_pages", lambda *a, **k: iter(images))
+    monkeypatch.setattr(ocr_service, "ocr_image_pil", lambda img, **k: f"pagina {img.size[0] - 9}")
+    monkeypatch.setattr(ocr_service, "webTranslation", lambda text: text.replace("pagina", "page"))
+
+    client = TestClient(ocr_service.app)
+    resp = client.post("/ocr/stream", files={"file": ("doc.pdf", b"%PDF", "application/pdf")})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+
+    records = [json.loads(line) for line in resp.text.splitlines() if line.strip()]
+    assert [r["type"] for r in records] == ["page"] * 3 + ["translation"] * 3 + ["done"]
+    assert [r["text"] for r in records[:3]] == ["pagina 1", "pagina 2", "pagina 3"]
+    assert records[3] == {"type": "translation", "page": 1, "translation": "page 1"}
+    assert records[-1]["meta"]["pages"] == 3
+
+
+def test_ocr_stream_rejects_unsupported_files():
+    client = TestClient(ocr_service.app)
+    resp = client.post("/ocr/stream", files={"file": ("notes.txt", b"hi", "text/plain")})
+    assert resp.status_code == 400
+
+
+def test_ping_stays_responsive_while_large_uploads_are_processed(monkeypatch):
+    """OCR runs off the event loop, so /ping latency stays flat under N busy uploads."""
+    import asyncio
+    import time
+
+    import httpx
+
+    def slow_ocr_bytes_auto(**kwargs):
+        time.sleep(0.5)  # stands in for rasterizing and OCRing a large PDF
+        return "textus", {"pages": 1, "per_page_ms": [500]}
+
+    monkeypatch.setattr(ocr_service, "ocr_bytes_auto", slow_ocr_bytes_auto)
+    monkeypatch.setattr(ocr_service, "webTranslation", lambda text: "text")
+
+    async def scenario(n_uploads):
+        transport = httpx.ASGITransport(app=ocr_service.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            uploads = [
+                asyncio.create_task(client.post("/ocr", files={"file": (f"big{i}.pdf", b"%PDF", "application/pdf")}))
+                for i in range(n_uploads)
+            ]
+            await asyncio.sleep(0.05)
+            latencies = []
+            for _ in range(5):
+                t0 = time.perf_counter()
+                resp = await client.get("/ping")
+                latencies.append(time.perf_counter() - t0)
+                assert resp.status_code == 200
+                await asyncio.sleep(0.02)
+            results = await asyncio.gather(*uploads)
+        return latencies, results
+
+    latencies, results = asyncio.run(scenario(4))
+    assert all(r.status_code == 200 for r in results)
+    assert max(latencies) < 0.2
+
+
+def test_jobs_run_in_background_and_report_progress(monkeypatch):
+    import time
+
+    images = [Image.new("RGB", (10 + i, 10)) for i in range(3)]
+    monkeypatch.setattr(ocr_service, "pdfinfo_from_bytes", lambda data: {"Pages": 3})
+    monkeypatch.setattr(ocr_service, "iter_pdf_pages", lambda *a, **k: iter(images))
+    monkeypatch.setattr(ocr_service, "ocr_image_pil", lambda img, **k: f"pagina {img.size[0] - 9}")
+    monkeypatch.setattr(ocr_service, "webTranslation", lambda text: "translated")
+
+    client = TestClient(ocr_service.app)
+    resp = client.post("/jobs", files={"file": ("doc.pdf", b"%PDF", "application/pdf")}, data={"psm": "6"})
+    assert resp.status_code == 202
+    job_id = resp.json()["job_id"]
+
+    deadline = time.time() + 5
+    while True:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("done", "error") or time.time() > deadline:
+            break
+        time.sleep(0.01)
+
+    assert job["status"] == "done"
+    assert job["progress"] == {"pages_done": 3, "pages_total": 3}
+    assert [p["text"] for p in job["pages"]] == ["pagina 1", "pagina 2", "pagina 3"]
+    assert job["text"] == ocr_service.PAGE_SEP.join(["pagina 1", "pagina 2", "pagina 3"])
+    assert job["translation"] == "translated"
+
+    assert client.get("/jobs/does-not-exist").status_code == 404
+
+
+def test_job_store_evicts_finished_jobs_after_ttl(monkeypatch):
+    from backend.ocr_service.jobs import JobStore
+
+    now = [1000.0]
+    monkeypatch.setattr("backend.ocr_service.jobs.time.time", lambda: now[0])
+
+    store = JobStore(ttl_s=60, max_jobs=2)
+    finished = store.create()
+    running = store.create()
+    assert store.create() is None  # full
+
+    store.update(finished["id"], status="done")
+    store.update(running["id"], status="running")
+    now[0] += 61
+    assert store.get(finished["id"]) is None
+    assert store.get(running["id"])["status"] == "running"
+    assert store.create() is not None
+
+
+def test_cache_hits_skip_rasterization_and_ocr(monkeypatch):
+    images = [Image.new("RGB", (10 + i, 10)) for i in range(2)]
+    rasterized, ocred = [], []
+
+    def fake_iter_pdf_pages(*args, **kwargs):
+        rasterized.append(1)
+        return iter(images)
+
+    def fake_ocr_image_pil(img, **kwargs):
+        ocred.append(img.size)
+        return f"pagina {img.size[0] - 9}"
+
+    monkeypatch.setattr(ocr_service, "iter_pdf_pages", fake_iter_pdf_pages)
+    monkeypatch.setattr(ocr_service, "ocr_image_pil", fake_ocr_image_pil)
+
+    text1, meta1 = ocr_service.ocr_bytes_auto(b"%PDF-a", "a.pdf", psm="6", lang="lat", engine="tesseract")
+    assert meta1["cache"] == ["miss", "miss"]
+
+    # Same upload + params: document-level hit, nothing is rendered or OCRed again
+    text2, meta2 = ocr_service.ocr_bytes_auto(b"%PDF-a", "a.pdf", psm="6", lang="lat", engine="tesseract")
+    assert (text2, meta2["cache"]) == (text1, ["hit", "hit"])
+    assert len(rasterized) == 1 and len(ocred) == 2
+
+    # Different bytes rendering to the same pages: page-level hits skip OCR only
+    _, meta3 = ocr_service.ocr_bytes_auto(b"%PDF-b", "b.pdf", psm="6", lang="lat", engine="tesseract")
+    assert meta3["cache"] == ["hit", "hit"]
+    assert len(rasterized) == 2 and len(ocred) == 2
+
+    # Different OCR params never share entries
+    _, meta4 = ocr_service.ocr_bytes_auto(b"%PDF-a", "a.pdf", psm="7", lang="lat", engine="tesseract")
+    assert meta4["cache"] == ["miss", "miss"]
+
+    # Neither do results OCRed under other settings (or another Tesseract)
+    monkeypatch.setattr(ocr_service, "OCR_TARGET_LINE_PX", 40.0)
+    _, meta5 = ocr_service.ocr_bytes_auto(b"%PDF-a", "a.pdf", psm="6", lang="lat", engine="tesseract")
+    assert meta5["cache"] == ["miss", "miss"]
+    monkeypatch.setattr(ocr_service, "OCR_TARGET_LINE_PX", 56.0)
+    monkeypatch.setattr(ocr_service, "_tesseract_version", lambda capi: "9.9.9")
+    _, meta6 = ocr_service.ocr_bytes_auto(b"%PDF-a", "a.pdf", psm="6", lang="lat", engine="tesseract")
+    assert meta6["cache"] == ["miss", "miss"]
+
+
+def test_disk_cache_evicts_least_recently_used_beyond_size_limit(tmp_path):
+    import os
+    import time
+
+    from backend.ocr_service.ocr_cache import OcrCache
+
+    cache = OcrCache(max_entries=0, disk_dir=str(tmp_path), disk_max_bytes=300)
+    for i in range(3):
+        cache.put(f"{i:02d}key", {"text": "x" * 80})
+        path = tmp_path / f"{i:02d}" / f"{i:02d}key.json"
+        os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+    assert cache.get("00key") is not None  # refreshes its mtime
+
+    cache.put("03key", {"text": "x" * 80})
+    assert cache.get("01key") is None
+    assert cache.get("00key") is not None and cache.get("03key") is not None
+    # trimmed below the low-water mark, and the size is what is on disk
+    on_disk = sum(path.stat().st_size for path in tmp_path.rglob("*.json"))
+    assert cache.disk.size_bytes() == on_disk <= 300 * 0.9
+
+
+def test_capi_handles_get_their_variables_back_and_thread_limit_is_set_before_loading(monkeypatch):
+    """EnginePool restores variables on release; OMP_THREAD_LIMIT can only be set before libtesseract loads."""
+    capi = ocr_service.tess_capi
+
+    class FakeLib:
+        def __init__(self):
+            self.variables = {"tessedit_char_whitelist": "", "user_defined_dpi": "0"}
+
+        def TessBaseAPIGetIntVariable(self, api, name, value):
+            if name == b"user_defined_dpi":
+                value.contents.value = int(self.variables["user_defined_dpi"])
+                return 1
+            return 0
+
+        def TessBaseAPIGetBoolVariable(self, api, name, value):
+            return 0
+
+        def TessBaseAPIGetDoubleVariable(self, api, name, value):
+            return 0
+
+        def TessBaseAPIGetStringVariable(self, api, name):
+            value = self.variables.get(name.decode())
+            return value.encode() if value is not None else None
+
+        def TessBaseAPISetVariable(self, api, name, value):
+            if name.decode() not in self.variables:
+                return 0
+            self.variables[name.decode()] = value.decode()
+            return 1
+
+        def TessBaseAPISetPageSegMode(self, api, psm):
+            pass
+
+        def TessBaseAPIClear(self, api):
+            pass
+
+    lib = FakeLib()
+    pool = capi.EnginePool()
+    pool._idle[("lat", "1")] = [1]
+    monkeypatch.setattr(capi, "_lib", lib)
+    monkeypatch.setattr(capi, "engine_pool", pool)
+    with pool.acquire("lat", "1") as api:
+        capi._configure(api, "6", "abc", {"user_defined_dpi": 400, "no_such_variable": 1})
+        assert lib.variables == {"tessedit_char_whitelist": "abc", "user_defined_dpi": "400"}
+    assert lib.variables == {"tessedit_char_whitelist": "", "user_defined_dpi": "0"}
+
+    monkeypatch.setenv("OMP_THREAD_LIMIT", "1")
+    monkeypatch.setattr(capi, "_thread_limit", "1")
+    assert capi.set_thread_limit(1) and not capi.set_thread_limit(4)
+    monkeypatch.setattr(capi, "_lib", None)
+    assert capi.set_thread_limit(4) and os.environ["OMP_THREAD_LIMIT"] == "4"
+
+
+def _text_lines(line_h, lines=6, size=(900, 700)):
+    """White page with black bars standing in for text lines `line_h` px tall."""
+    from PIL import ImageDraw
+
+    img = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(img)
+    for i in range(lines):
+        top = 40 + i * line_h * 2
+        draw.rectangle([60, top, size[0] - 60, top + line_h - 1], fill="black")
+    return img
+
+
+@pytest.mark.parametrize("line_h", [14, 28, 80])
+def test_preprocess_scales_text_to_target_line_height(line_h):
+    img = _text_lines(line_h)
+    assert ocr_service.estimate_line_height(img) == pytest.approx(line_h, abs=1.5)
+
+    scale = ocr_service.choose_scale(img)
+    expected = min(ocr_service.OCR_MAX_SCALE, ocr_service.OCR_TARGET_LINE_PX / line_h)
+    assert scale == pytest.approx(expected, rel=0.1)
+    out = ocr_service.preprocess(img)
+    assert out.mode == "L"
+    assert out.width - 48 == int(img.width * scale)
+
+
+def test_preprocess_falls_back_to_2x_without_text():
+    img = Image.new("RGB", (200, 100), "white")
+    assert ocr_service.estimate_line_height(img) is None
+    assert ocr_service.preprocess(img).size == (400 + 48, 200 + 16)
+    assert ocr_service.preprocess(img, scale=1.0).size == (200 + 48, 100 + 16)
+
+
+def test_pdf_is_rendered_at_probed_dpi_without_resampling(monkeypatch):
+    # 72 DPI probe shows 12 px lines -> render at 72 * 56 / 12 = 336 DPI
+    monkeypatch.setattr(ocr_service, "convert_from_bytes", lambda *a, **k: [_text_lines(12)])
+    dpi = ocr_service.probe_pdf_dpi(b"%PDF")
+    assert dpi == int(72 * ocr_service.OCR_TARGET_LINE_PX / 12)
+
+    seen = {}
+
+    def fake_iter_pdf_pages(file_bytes, dpi=300, batch=None):
+        seen["dpi"] = dpi
+        yield Image.new("RGB", (10, 10), "white")
+
+    def fake_ocr_image_pil(img, meta=None, scale=None, **kwargs):
+        seen["scale"] = scale
+        return "x"
+
+    monkeypatch.setattr(ocr_service, "OCR_WORKERS", 1)
+    monkeypatch.setattr(ocr_service, "iter_pdf_pages", fake_iter_pdf_pages)
+    monkeypatch.setattr(ocr_service, "ocr_image_pil", fake_ocr_image_pil)
+    list(ocr_service.iter_ocr_pages(b"%PDF", "a.pdf", psm="6", lang="lat", oem="1", whitelist="", engine="tesseract"))
+    assert seen == {"dpi": dpi, "scale": 1.0}
+
+
+@pytest.fixture
+def completion_server(monkeypatch):
+    """A real completionServer on a free port, with an upper-casing stand-in for the model."""
+    import threading
+
+    from backend.completion.completionServer import makeServer
+
+    seen = []
+
+    def fake_correct(text, threshold):
+        seen.append((text, threshold))
+        return text.upper()
+
+    def fake_correct_spans(text, threshold, spans):
+        seen.append((text, threshold))
+        for a, b in spans:
+            text = text[:a] + text[a:b].upper() + text[b:]
+        return text, sum(b - a for a, b in spans)
+
+    server = makeServer(fake_correct, port=0, sequenceLength=32, quiet=True, correctSpans=fake_correct_spans)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(ocr_service, "COMPLETION_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    yield seen
+    server.shutdown()
+    server.server_close()
+
+
+def test_ocr_runs_completion_stage_per_page_before_translation(monkeypatch, completion_server):
+    combined = ocr_service.PAGE_SEP.join(["arma uirumque", "cano"])
+    monkeypatch.setattr(ocr_service, "ocr_bytes_auto", lambda **k: (combined, {"pages": 2}))
+    translated = []
+    monkeypatch.setattr(ocr_service, "webTranslation", lambda text: translated.append(text) or "arms")
+
+    client = TestClient(ocr_service.app)
+    resp = client.post("/ocr", files={"file": ("doc.pdf", b"%PDF", "application/pdf")}, data={"complete": "true"})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["text"] == ocr_service.PAGE_SEP.join(["ARMA UIRUMQUE", "CANO"])
+    assert translated == [body["text"]]
+    assert body["meta"]["completion"]["status"] == "ok"
+    assert [t for t, _ in completion_server] == ["arma uirumque", "cano"]
+    assert completion_server[0][1] == 1 / 32
+
+    health = client.get("/completion/health").json()
+    assert health["ok"] and health["server"]["requests"] == 2
+
+
+def test_completion_only_rescores_low_confidence_spans(monkeypatch, completion_server):
+    combined = ocr_service.PAGE_SEP.join(["arma uirumque cano", "troiae qui"])
+    text, meta = ocr_service.complete_text(combined, [[[5, 13]], None])
+    # page 2 has no word confidences and is rescored in full
+    assert text == ocr_service.PAGE_SEP.join(["arma UIRUMQUE cano", "TROIAE QUI"])
+    assert meta["rescored_share"] == round((8 + 8) / (16 + 8), 4)
+
+    monkeypatch.setattr(ocr_service, "COMPLETION_SUSPECT_ONLY", False)
+    text, meta = ocr_service.complete_text(combined, [[[5, 13]], None])
+    assert text == ocr_service.PAGE_SEP.join(["ARMA UIRUMQUE CANO", "TROIAE QUI"]) and meta["rescored_share"] == 1.0
+
+
+def test_completion_failures_keep_ocr_text(monkeypatch):
+    monkeypatch.setattr(ocr_service, "COMPLETION_URL", "http://127.0.0.1:9")
+    text, meta = ocr_service.complete_text("arma")
+    assert text == "arma"
+    assert meta["status"] == "error"
+
+    monkeypatch.setattr(ocr_service, "COMPLETION_URL", "")
+    client = TestClient(ocr_service.app)
+    resp = client.post("/ocr", files={"file": ("a.png", b"x", "image/png")}, data={"complete": "true"})
+    assert resp.status_code == 400
+
+
+def test_completion_can_run_in_process(monkeypatch):
+    import types
+
+    engine = types.SimpleNamespace(
+        backend="numpy",
+        sequenceLength=32,
+        parseThreshold=lambda t: 0.5,
+        correctText=lambda text, threshold: text.replace("7", "t"),
+        cacheStats=lambda: {"hits": 3, "misses": 1},
+        beamCorrection=lambda text: {
+            "text": text.replace("?", "t"),
+            "edits": [{"position": i, "kind": "fill", "char": "t", "prob": 0.9} for i, c in enumerate(text) if c == "?"],
+        },
+    )
+    monkeypatch.setattr(ocr_service, "COMPLETION_URL", "")
+    monkeypatch.setattr(ocr_service, "COMPLETION_INPROCESS", True)
+    monkeypatch.setattr(ocr_service, "_completion_engine", engine)
+
+    text, meta = ocr_service.complete_text(ocr_service.PAGE_SEP.join(["arma 7", "cano"]))
+    assert text == ocr_service.PAGE_SEP.join(["arma t", "cano"])
+    assert meta["status"] == "ok" and meta["mode"] == "inprocess"
+    assert ocr_service.completion_health()["server"] == {"backend": "numpy", "sequenceLength": 32, "cache": {"hits": 3, "misses": 1}}
+
+    monkeypatch.setattr(ocr_service, "COMPLETION_MODE", "beam")
+    text, meta = ocr_service.complete_text(ocr_service.PAGE_SEP.join(["arma", "ca?o ?"]))
+    assert text == ocr_service.PAGE_SEP.join(["arma", "cato t"])
+    assert [(e["page"], e["position"]) for e in meta["edits"]] == [(2, 2), (2, 5)]